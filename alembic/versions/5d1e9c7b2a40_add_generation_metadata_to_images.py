@@ -0,0 +1,36 @@
+"""Add generation metadata to images
+
+Revision ID: 5d1e9c7b2a40
+Revises: ca5b788cc7fb
+Create Date: 2026-10-18 10:12:41.306214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '5d1e9c7b2a40'
+down_revision: Union[str, None] = 'ca5b788cc7fb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.add_column('images', sa.Column('seed', sa.BigInteger(), nullable=True))
+    op.add_column('images', sa.Column('tier', sa.String(), nullable=True))
+    op.add_column('images', sa.Column('wait_seconds', sa.Float(), nullable=True))
+    op.add_column('images', sa.Column('generate_seconds', sa.Float(), nullable=True))
+    op.add_column('images', sa.Column('size_bytes', sa.BigInteger(), nullable=True))
+    # Generated images have no description; the model already declares it nullable
+    op.alter_column('images', 'description', existing_type=sa.String(), nullable=True)
+
+
+def downgrade():
+    op.alter_column('images', 'description', existing_type=sa.String(), nullable=False)
+    op.drop_column('images', 'size_bytes')
+    op.drop_column('images', 'generate_seconds')
+    op.drop_column('images', 'wait_seconds')
+    op.drop_column('images', 'tier')
+    op.drop_column('images', 'seed')
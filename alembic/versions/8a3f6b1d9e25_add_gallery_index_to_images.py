@@ -0,0 +1,30 @@
+"""Add gallery index to images
+
+Revision ID: 8a3f6b1d9e25
+Revises: 5d1e9c7b2a40
+Create Date: 2026-10-18 14:37:09.518823
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '8a3f6b1d9e25'
+down_revision: Union[str, None] = '5d1e9c7b2a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Built concurrently, outside the migration's transaction, so writes to a large table are not blocked
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_images_user_id_created_at_id', 'images', ['user_id', 'created_at', 'id'],
+            postgresql_include=['url', 'aspectRatio', 'tier'], postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_images_user_id_created_at_id', table_name='images', postgresql_concurrently=True)
@@ -1,16 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
 from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.db.database import get_db
+from app.db.database import get_async_db, get_db
 from app.db.models import User
-from app.db.model.user import get_user_from_uuid
+from app.db.model.user import get_user_from_uuid_async
+from app.db.user_cache import TTLCache, user_cache
 from datetime import datetime, timezone, timedelta
 import uuid
 import logging
 import os
 from jose import JWTError, jwt
-from google.oauth2 import id_token
-from google.auth.transport import requests
+from app.helpers.google_certs import google_verifier
 import time
 
 # Set up logging configuration
@@ -25,6 +26,7 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 30))
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", 10000))
 if not GOOGLE_CLIENT_ID:
     raise ValueError("Google CLIENT_ID not found in environment variables.")
 
@@ -32,6 +34,9 @@ if not GOOGLE_CLIENT_ID:
 ACCESS_TOKEN_MAX_AGE_SECONDS = ACCESS_TOKEN_EXPIRE_MINUTES * 60
 REFRESH_TOKEN_MAX_AGE_SECONDS = REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60
 
+# Claims of access tokens already validated by this process, until each token expires
+_validated_tokens = TTLCache(TOKEN_CACHE_MAX_ENTRIES)
+
 class TokenData(BaseModel):
     access_token: str
 
@@ -65,13 +70,35 @@ def validate_jwt_token(token: str):
         logging.error(f"Token validation failed with error: {str(e)}")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
-async def get_current_user(request: Request, db: Session = Depends(get_db)):
+def validate_access_token(token: str) -> dict:
+    """
+    Validates an access token like `validate_jwt_token`, but decodes each token only once per
+    process: its claims are kept until the token's `exp`.
+
+    :return: The token's claims.
+    :raises HTTPException: If the token is invalid or has expired.
+    """
+    payload = _validated_tokens.get(token)
+    if payload is None:
+        payload = validate_jwt_token(token)
+        if "exp" in payload:
+            _validated_tokens.set(token, payload, payload["exp"])
+    return payload
+
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_async_db)):
     access_token = request.cookies.get("access_token")
     if access_token:
         try:
-            payload = validate_jwt_token(access_token)
+            payload = validate_access_token(access_token)
             user_uuid = payload.get("sub")
-            user = get_user_from_uuid(user_uuid, db)
+            user = await user_cache.get(user_uuid)
+            if user is None:
+                user = await get_user_from_uuid_async(user_uuid, db)
+                # Hands the connection back to the pool right away; event streams and other long
+                # responses would otherwise hold it until they end. The user stays readable.
+                await db.close()
+                if user:
+                    await user_cache.set(user)
             if not user:
                 logging.error(f"User not found with email {payload.get('email')}")
                 raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
@@ -83,7 +110,7 @@ async def get_current_user(request: Request, db: Session = Depends(get_db)):
     raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token missing or invalid")
 
 @router.post("/refresh")
-async def refresh_access_token(request: Request, db: Session = Depends(get_db)):
+async def refresh_access_token(request: Request, db: AsyncSession = Depends(get_async_db)):
     refresh_token = request.cookies.get("refresh_token")
     if not refresh_token:
         logging.error("Refresh token missing")
@@ -91,10 +118,12 @@ async def refresh_access_token(request: Request, db: Session = Depends(get_db)):
     try:
         payload = validate_jwt_token(refresh_token)
         user_uuid = payload.get("sub")
-        user = get_user_from_uuid(user_uuid, db)
+        user = await get_user_from_uuid_async(user_uuid, db)
         if not user:
             logging.error(f"User not found during refresh for UUID {user_uuid}")
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        # The user was just read from the database anyway
+        await user_cache.set(user)
         new_access_token, _ = generate_tokens(user)
         response = Response()
         response.set_cookie(
@@ -130,6 +159,8 @@ def verify_token(token_data: TokenData, response: Response, db: Session = Depend
     access_token, refresh_token = generate_tokens(user)
     user.refresh_token = refresh_token
     db.commit()
+    # The refresh token was rotated; other processes must not keep serving the old row
+    user_cache.invalidate(user.uuid)
     response.set_cookie(
         key="access_token", value=access_token, httponly=True, secure=True, max_age=ACCESS_TOKEN_MAX_AGE_SECONDS, samesite="None"
     )
@@ -140,7 +171,8 @@ def verify_token(token_data: TokenData, response: Response, db: Session = Depend
 
 def verify_google_oauth_token(access_token: str):
     try:
-        id_info = id_token.verify_oauth2_token(access_token, requests.Request(), GOOGLE_CLIENT_ID, clock_skew_in_seconds=10)
+        # Verified locally against Google's cached signing certificates
+        id_info = google_verifier.verify(access_token)
         if id_info.get("exp") < time.time():
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has expired")
         return id_info
@@ -149,10 +181,14 @@ def verify_google_oauth_token(access_token: str):
     
 
 @router.get("/logout", status_code=status.HTTP_204_NO_CONTENT)
-async def logout(response: Response, current_user: User = Depends(get_current_user)):
+async def logout(request: Request, response: Response, current_user: User = Depends(get_current_user)):
     """
     Logs out the user by deleting the access_token and refresh_token cookies.
     """
+    # Forget the token's claims and the cached user, in every process for the latter
+    _validated_tokens.pop(request.cookies.get("access_token"))
+    await user_cache.invalidate_async(current_user.uuid)
+
     # Delete the access_token cookie
     response.delete_cookie(key="access_token", httponly=True)
 
@@ -0,0 +1,54 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from typing import Optional
+import logging
+from app.api.auth import get_current_user
+from app.db.database import get_db
+from app.db.gallery import InvalidCursor, gallery_page
+from app.inference.image.derivatives import srcset
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+MAX_GALLERY_PAGE_SIZE = 100
+
+class GalleryImage(BaseModel):
+    imageId: str
+    imageUrl: str
+    aspectRatio: str
+    tier: Optional[str] = None
+    createdAt: str
+    srcset: str
+
+class GalleryPage(BaseModel):
+    images: list[GalleryImage]
+    nextCursor: Optional[str] = None
+
+@router.get("", response_model=GalleryPage)
+def get_gallery(
+    limit: int = Query(50, ge=1, le=MAX_GALLERY_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Lists the current user's images, newest first.
+
+    :param limit: The number of images per page.
+    :param cursor: The `nextCursor` of the previous page; omitted for the first page.
+    :return: The page's images and the cursor of the next page, which is null on the last page.
+    :raises HTTPException: If the cursor is malformed.
+    """
+    try:
+        rows, next_cursor = gallery_page(db, current_user.uuid, limit, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    images = [
+        GalleryImage(
+            imageId=str(row.id), imageUrl=row.url, aspectRatio=row.aspectRatio, tier=row.tier,
+            createdAt=row.created_at.isoformat(), srcset=srcset(str(row.id)),
+        )
+        for row in rows
+    ]
+    return GalleryPage(images=images, nextCursor=next_cursor)
@@ -0,0 +1,31 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+import logging
+import threading
+from app.inference.warmup import ModelWarmup, configured_models, readiness
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# Models served from the API process itself
+API_MODELS = ["llama"]
+
+def start_warmup() -> ModelWarmup:
+    """
+    Warms up the API process's models in a background thread, so the server keeps answering
+    readiness probes while the models load.
+    """
+    warmup = ModelWarmup("api", configured_models(API_MODELS))
+    if warmup.models:
+        threading.Thread(target=warmup.run, name="warmup", daemon=True).start()
+    return warmup
+
+@router.get("/ready")
+async def ready():
+    """
+    Reports the per-model warm-up state of every live API and worker process.
+
+    :return: The readiness report, with status 200 once every model is warm and 503 before.
+    """
+    report = readiness()
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
@@ -0,0 +1,122 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
+from functools import lru_cache
+import asyncio
+import hashlib
+import logging
+import os
+from app.inference.image.derivatives import DerivativeMaker, parse_derivative_key
+from app.inference.image.storage import get_storage
+from app.inference.image.writer import ENCODERS, alternate_key, get_alternate_formats
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# Images never change once written, so clients and proxies may keep them for a year
+IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", 31536000))
+IMAGE_ETAG_CACHE_SIZE = int(os.getenv("IMAGE_ETAG_CACHE_SIZE", 8192))
+CACHE_CONTROL = f"public, max-age={IMAGE_CACHE_MAX_AGE}, immutable"
+
+@lru_cache(maxsize=IMAGE_ETAG_CACHE_SIZE)
+def _content_etag(path: str, mtime_ns: int, size: int) -> str:
+    # Keyed by modification time and size too, so a replaced file is hashed again
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return f'"{digest.hexdigest()[:32]}"'
+
+def _accepted_types(accept: str) -> set:
+    """Returns the media types a client explicitly accepts (wildcards and q=0 entries are ignored)."""
+    accepted = set()
+    for part in (accept or "").split(","):
+        media_type, *params = [token.strip() for token in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0 and "*" not in media_type:
+            accepted.add(media_type.lower())
+    return accepted
+
+def _select_file(key: str, accept: str):
+    """
+    Picks the file to send for a key: the first alternate format the client accepts and that
+    exists, or the file itself.
+
+    :return: A tuple of (path, stat result, ETag), or None if the file does not exist.
+    """
+    storage = get_storage()
+    accepted = _accepted_types(accept)
+    candidates = [
+        alternate_key(key, name) for name in get_alternate_formats()
+        if ENCODERS[name]["media_type"] in accepted and not key.endswith(ENCODERS[name]["extension"])
+    ]
+    for candidate in candidates + [key]:
+        path = storage.path(candidate)
+        try:
+            stat_result = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        if os.path.isfile(path):
+            return path, stat_result, _content_etag(path, stat_result.st_mtime_ns, stat_result.st_size)
+    return None
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+async def _make_derivative(key: str) -> bool:
+    """Makes the derivative stored under `key`, if it is one; returns whether it was made."""
+    derivative = parse_derivative_key(key)
+    if derivative is None:
+        return False
+    image_id, width = derivative
+    try:
+        await asyncio.wrap_future(DerivativeMaker().submit(image_id, [width])[key])
+    except FileNotFoundError:
+        return False  # The image itself does not exist
+    except Exception as e:
+        logger.error(f"Failed to make derivative '{key}': {e}")
+        return False
+    return True
+
+@router.api_route("/images/{key:path}", methods=["GET", "HEAD"])
+async def serve_image(key: str, request: Request):
+    """
+    Serves a stored image with long-lived, immutable caching.
+
+    Responses carry a content-hash ETag, so revalidation with If-None-Match is answered with
+    304 and no body. Byte ranges (and If-Range) are supported for partial downloads. Clients
+    whose Accept header lists a pre-encoded alternate format (e.g. image/webp) get that
+    encoding of the image instead.
+
+    Derivatives (resized copies) that have not been made yet are made on first request;
+    concurrent requests for the same derivative wait for a single job.
+
+    :param key: The storage key of the image, e.g. '3f/a2/original_<id>.png'.
+    :return: The image, a 304 response, or 404 if it does not exist.
+    """
+    parts = key.split("/")
+    if any(not part or part.startswith(".") for part in parts):
+        # Rejects traversal ('..') and the writer's in-progress temporary files
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    selected = await run_in_threadpool(_select_file, key, request.headers.get("accept"))
+    if selected is None and await _make_derivative(key):
+        selected = await run_in_threadpool(_select_file, key, request.headers.get("accept"))
+    if selected is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    path, stat_result, etag = selected
+
+    headers = {"Cache-Control": CACHE_CONTROL, "ETag": etag}
+    if get_alternate_formats():
+        headers["Vary"] = "Accept"
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and _matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, headers=headers, stat_result=stat_result)
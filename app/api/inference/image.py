@@ -1,24 +1,57 @@
 from fastapi import HTTPException, Header, Request, APIRouter, Depends
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import os
 import logging
-from celery.result import AsyncResult
-from app.workers.images import generate_image_task
+from celery.result import AsyncResult, GroupResult
+from app.workers.scheduler import AdmissionError, DEFAULT_LANE, LANES
+from app.workers.telemetry import QueueTelemetry, STAGES
+from app.workers.images import enqueue_generate_image, enqueue_generate_variations, generation_cache_key, get_generation, image_owners, random_seed, serve_cached_result
+from app.inference.image.result_cache import ResultCache
+from app.inference.image.flux.config import MAX_SEED, MAX_VARIATIONS, DEFAULT_TIER
 from app.api.auth import get_current_user
-from typing import Optional
-import redis
+from app.inference.image.writer import PREFIXES, get_durable_urls, get_durable_urls_many
+from app.workers.retention import ImageGarbageCollector
+from app.workers.celery_config import celery
+from app.workers.progress import progress_channel, progress_key, TERMINAL_STATES
+from app.db.redis_config import async_redis_client
+from app.api.task_events import hub as task_event_hub
+from starlette.concurrency import run_in_threadpool
+from sse_starlette.sse import EventSourceResponse
+import time
+import asyncio
+from typing import Literal, Optional
 import traceback
 import json
 
 logging = logging.getLogger(__name__)
 router = APIRouter()
+telemetry = QueueTelemetry()
 
 class PromptRequest(BaseModel):
     userPrompt: str
     aspectRatio: str
+    seed: Optional[int] = Field(None, ge=0, le=MAX_SEED)
+    tier: Literal["draft", "standard", "final"] = DEFAULT_TIER
+    draftImageId: Optional[str] = None
+    priority: Literal["interactive", "batch"] = DEFAULT_LANE
+
+MAX_BATCH_PROMPTS = 4
+
+class VariationsRequest(BaseModel):
+    userPrompts: list[str] = Field(..., min_length=1, max_length=MAX_BATCH_PROMPTS)
+    numImages: int = Field(4, ge=1, le=MAX_VARIATIONS)
+    aspectRatio: str
+    seed: Optional[int] = Field(None, ge=0, le=MAX_SEED)
+    tier: Literal["draft", "standard"] = DEFAULT_TIER
+    priority: Literal["interactive", "batch"] = DEFAULT_LANE
+
+class VariationsResponse(BaseModel):
+    groupId: str
+    tasks: list[dict]
 
 class ImageResponse(BaseModel):
     taskId: str
+    result: Optional[dict] = None
 
 class DeleteImagesRequest(BaseModel):
     image_ids: list[str]
@@ -34,74 +67,161 @@ async def generate_image_endpoint(
     Endpoint for generating an image based on a prompt and aspect ratio.
 
     :param request: The HTTP request object.
-    :param prompt_request: The request body containing prompt and aspect ratio.
+    :param prompt_request: The request body containing prompt, aspect ratio, an optional seed, the speed
+                           tier and the priority lane. 'final' requests refine the draft in `draftImageId`,
+                           keeping its aspect ratio and, unless a seed is given, its seed.
     :param authorization: Authorization header containing the Bearer token.
     :param current_user: The current authenticated user.
-    :return: A dictionary containing the task ID for polling status.
-    :raises HTTPException: If an internal error occurs.
+    :return: A dictionary containing the task ID for polling status, and the result when it was
+             served from the result cache.
+    :raises HTTPException: If a 'final' request has no known draft, the job is refused by admission
+                           control (429 with Retry-After), or an internal error occurs.
     """
+    # Log the prompt request
+    logging.info(f"Prompt Request: {prompt_request}")
+
+    aspect_ratio, seed = prompt_request.aspectRatio, prompt_request.seed
+    if prompt_request.tier == "final":
+        if not prompt_request.draftImageId:
+            raise HTTPException(status_code=400, detail="draftImageId is required for the 'final' tier")
+        draft = get_generation(prompt_request.draftImageId)
+        # Other users' drafts are reported as missing, so their IDs cannot be probed
+        if draft is None or draft.get("userId") != str(current_user.uuid):
+            raise HTTPException(status_code=404, detail="Draft image not found")
+        aspect_ratio = draft["aspectRatio"]
+        seed = seed if seed is not None else draft["seed"]
+
     try:
-        # Log the prompt request
-        logging.info(f"Prompt Request: {prompt_request}")
+        # Requests without a seed get a fresh one, so every result can be reproduced
+        seed = seed if seed is not None else random_seed()
+        cache_key = generation_cache_key(
+            str(current_user.uuid), prompt_request.userPrompt, aspect_ratio, seed, prompt_request.tier, prompt_request.draftImageId
+        )
+        cached = ResultCache().get(cache_key)
+        if cached is not None:
+            logging.info(f"Serving cached result for image {cached['imageId']}")
+            return {"taskId": serve_cached_result(cached), "result": cached}
 
-        # Call the Celery task and get the task ID
-        task = generate_image_task.delay(prompt_request.userPrompt, prompt_request.aspectRatio)
+        # Queued from the thread pool: admission waits on the scheduler's Redis lock
+        task = await run_in_threadpool(
+            enqueue_generate_image, prompt_request.userPrompt, aspect_ratio, seed, prompt_request.tier, prompt_request.draftImageId,
+            user_id=str(current_user.uuid), lane=prompt_request.priority,
+        )
         return {"taskId": task.id}
 
+    except AdmissionError as e:
+        logging.info(f"Refused image job of user {current_user.uuid}: {e}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logging.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/generate-images", response_model=VariationsResponse)
+async def generate_images_endpoint(
+    variations_request: VariationsRequest,
+    authorization: str = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Endpoint for generating several variations of one or more prompts.
+
+    Each prompt is encoded once and its `numImages` variations are denoised together in one
+    batched pipeline call. Variation `i` uses seed `seed + i`.
+
+    :param variations_request: The request body with the prompts, the number of variations per
+                               prompt, the aspect ratio, an optional seed, the speed tier and the priority lane.
+    :param authorization: Authorization header containing the Bearer token.
+    :param current_user: The current authenticated user.
+    :return: The group ID, for GET /group-status/{groupId}, and every image's task ID and prompt.
+    :raises HTTPException: If the jobs are refused by admission control (429 with Retry-After), or an internal error occurs.
+    """
+    logging.info(f"Variations Request: {variations_request}")
+    try:
+        group = await run_in_threadpool(
+            enqueue_generate_variations, variations_request.userPrompts, variations_request.numImages, variations_request.aspectRatio,
+            variations_request.seed, variations_request.tier, user_id=str(current_user.uuid), lane=variations_request.priority,
+        )
+    except AdmissionError as e:
+        logging.info(f"Refused image jobs of user {current_user.uuid}: {e}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logging.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=str(e))
+    count = variations_request.numImages
+    return {"groupId": group.id, "tasks": [
+        {"taskId": result.id, "prompt": variations_request.userPrompts[i // count]}
+        for i, result in enumerate(group.results)
+    ]}
+
+@router.get("/group-status/{groupId}", response_model=dict)
+async def get_group_status(groupId: str, authorization: str = Header(None), current_user: dict = Depends(get_current_user)):
+    """
+    Returns the status of every image of a batch generation, so clients can show images as they finish.
+
+    :return: A dictionary with 'groupId', 'total', 'completed' (finished tasks, successful or
+             not) and 'tasks' (the status of every task by task ID, as in POST /task-status).
+    :raises HTTPException: If the group is unknown.
+    """
+    group = await run_in_threadpool(GroupResult.restore, groupId, app=celery)
+    if group is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+    statuses = await run_in_threadpool(_task_statuses, [result.id for result in group.results])
+    return {
+        "groupId": groupId,
+        "total": len(statuses),
+        "completed": sum(1 for status in statuses.values() if status["status"] in TERMINAL_STATES),
+        "tasks": statuses,
+    }
+
 @router.delete("/delete-images/", response_model=dict)
 async def delete_images(
     request: DeleteImagesRequest,
     authorization: str = Header(None),
     current_user: dict = Depends(get_current_user)
 ):
-    IMAGE_DIR = "frontend/images"
+    """
+    Deletes images of the current user with every variant and derivative, and their metadata.
+
+    :param request: The request body with the image IDs; file names such as 'original_<id>.png' are accepted too.
+    :return: The deleted and unknown image IDs, and the bytes reclaimed. Other users' images are
+             reported as not found and left alone.
+    """
     if not request.image_ids:
         logging.warning("No image IDs provided.")
         raise HTTPException(status_code=400, detail="No image IDs provided")
 
-    deleted_files = []
-    not_found_files = []
     logging.info(f"Attempting to delete {len(request.image_ids)} images.")
-
-    for image_id in request.image_ids:
-        file_paths = [
-            os.path.join(IMAGE_DIR, image_id),
-            os.path.join(IMAGE_DIR, f"original_{image_id}")
-        ]
-
-        deleted = False
-        for file_path in file_paths:
-            if os.path.isfile(file_path):
-                try:
-                    os.remove(file_path)
-                    deleted_files.append(file_path)
-                    logging.info(f"Deleted file: {file_path}")
-                    deleted = True
-                    break
-                except Exception as e:
-                    logging.error(f"Failed to delete file: {file_path}. Error: {e}")
-
-        if not deleted:
-            not_found_files.append(image_id)
-            logging.warning(f"File not found: {image_id}")
+    image_ids = list(dict.fromkeys(_image_id_of(name) for name in request.image_ids))
+    owners = await run_in_threadpool(image_owners, image_ids)
+    owned = [image_id for image_id in image_ids if owners.get(image_id) == str(current_user.uuid)]
+    report = await run_in_threadpool(ImageGarbageCollector().delete, owned)
+    not_found = [image_id for image_id in image_ids if image_id not in report["deleted"]]
+    for image_id in not_found:
+        logging.warning(f"File not found: {image_id}")
 
     response = {
-        "deleted_files": deleted_files,
-        "not_found_files": not_found_files,
-        "detail": "Some files were not found" if not_found_files else "All files deleted successfully"
+        "deleted_files": report["deleted"],
+        "not_found_files": not_found,
+        "bytes_reclaimed": report["bytes"],
+        "detail": "Some files were not found" if not_found else "All files deleted successfully"
     }
     logging.info("Image deletion completed.")
     return response
 
+def _image_id_of(name: str) -> str:
+    # Accepts bare IDs as well as the file names of any variant
+    name = os.path.splitext(os.path.basename(name))[0]
+    for prefix in PREFIXES.values():
+        if prefix and name.startswith(prefix):
+            return name[len(prefix):]
+    return name
+
 @router.get("/task-status/{taskId}", response_model=dict)
 async def get_task_status(taskId: str, authorization: str = Header(None), current_user: dict = Depends(get_current_user)):
     try:
         result = AsyncResult(taskId)
         if result.state == 'SUCCESS':
-            return {"status": 'SUCCESS', "result": result.result}
+            return {"status": 'SUCCESS', "result": _with_upscale_status(result.result)}
         elif result.state == 'FAILURE':
             return {"status": 'FAILURE', "result": str(result.info)}
         return {"status": result.state}
@@ -109,33 +229,176 @@ async def get_task_status(taskId: str, authorization: str = Header(None), curren
         logging.error(f"Error checking task status: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve task status")
 
-r = redis.StrictRedis(host='localhost', port=6379, db=0)
+MAX_STATUS_TASKS = 500
+
+class TaskStatusRequest(BaseModel):
+    taskIds: list[str] = Field(..., min_length=1, max_length=MAX_STATUS_TASKS)
 
-def get_queued_jobs_from_redis():
+@router.post("/task-status", response_model=dict)
+async def get_task_statuses(status_request: TaskStatusRequest, authorization: str = Header(None), current_user: dict = Depends(get_current_user)):
+    """
+    Returns the status of many tasks at once, in the shape of GET /task-status/{taskId}.
+
+    :param status_request: The request body with the task IDs.
+    :return: A dictionary with 'tasks', the status of every task by task ID. Unknown tasks are PENDING.
+    """
     try:
-        queued_jobs = r.lrange('celery', 0, -1)
-        return len(queued_jobs)
+        return {"tasks": await run_in_threadpool(_task_statuses, list(dict.fromkeys(status_request.taskIds)))}
     except Exception as e:
-        logging.error(f"Error getting queued jobs: {e}")
-        return 0
+        logging.error(f"Error checking task statuses: {e}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve task status")
+
+def _read_metas(task_ids: list) -> list:
+    """Reads the result backend entries of many tasks with one MGET; missing entries are None."""
+    backend = celery.backend
+    payloads = backend.client.mget([backend.get_key_for_task(task_id) for task_id in task_ids]) if task_ids else []
+    return [backend.decode_result(payload) if payload else None for payload in payloads]
+
+def _task_statuses(task_ids: list) -> dict:
+    # Three round trips however many tasks: the results, then the upscale results and the
+    # durable URLs of the images they produced
+    metas = dict(zip(task_ids, _read_metas(task_ids)))
+    results = {
+        task_id: meta["result"] for task_id, meta in metas.items()
+        if meta and meta["status"] == 'SUCCESS' and isinstance(meta["result"], dict) and 'imageId' in meta["result"]
+    }
+    upscale_ids = list({result['upscaleTaskId'] for result in results.values() if result.get('upscaleTaskId')})
+    upscale_metas = dict(zip(upscale_ids, _read_metas(upscale_ids)))
+    durable_urls = get_durable_urls_many([result['imageId'] for result in results.values()])
 
-def get_active_jobs_from_redis():
+    statuses = {}
+    for task_id, meta in metas.items():
+        if meta is None:
+            statuses[task_id] = {"status": 'PENDING'}
+        elif task_id in results:
+            result = results[task_id]
+            statuses[task_id] = {"status": 'SUCCESS', "result": _compose_upscale_status(
+                result, upscale_metas.get(result.get('upscaleTaskId')), durable_urls[result['imageId']],
+            )}
+        elif meta["status"] == 'FAILURE':
+            statuses[task_id] = {"status": 'FAILURE', "result": str(meta["result"])}
+        elif meta["status"] == 'SUCCESS':
+            statuses[task_id] = {"status": 'SUCCESS', "result": meta["result"]}
+        else:
+            statuses[task_id] = {"status": meta["status"]}
+    return statuses
+
+def _with_upscale_status(result: dict) -> dict:
+    """
+    Adds the state of the linked upscale task to a generation result. The base image URL
+    is reported as soon as generation succeeds; the upscaled URL is added once it exists.
+    `durableUrls` lists the variants whose files have been completely written.
+    """
+    if not isinstance(result, dict):
+        return result
+    upscale = None
+    if result.get('upscaleTaskId'):
+        upscale = _read_metas([result['upscaleTaskId']])[0]
+    return _compose_upscale_status(result, upscale, get_durable_urls(result['imageId']))
+
+def _compose_upscale_status(result: dict, upscale_meta: dict, durable_urls: dict) -> dict:
+    if not result.get('upscaleTaskId'):
+        return dict(result, durableUrls=durable_urls)
+    upscale_state = upscale_meta["status"] if upscale_meta else 'PENDING'
+    result = dict(result, upscaleStatus=upscale_state, durableUrls=durable_urls)
+    if upscale_state == 'SUCCESS':
+        result.update(upscale_meta["result"])
+    return result
+
+PROGRESS_STREAM_TIMEOUT_SECONDS = 1800
+MAX_STREAM_TASKS = 500
+
+def _stored_event(task_id: str) -> dict:
+    # For tasks whose latest event has expired: fall back to the result backend
+    result = AsyncResult(task_id)
+    if result.state == 'SUCCESS':
+        return {"state": 'SUCCESS', "result": _with_upscale_status(result.result)}
+    if result.state == 'FAILURE':
+        return {"state": 'FAILURE', "result": str(result.info)}
+    return {"state": result.state}
+
+async def _task_events(task_ids: list, request: Request, event_name: str = "status"):
+    """
+    Relays the events of some tasks until all of them finish, the client goes away or the
+    stream times out. Each event is tagged with its 'taskId'; the stream starts with the
+    current state of every task.
+    """
+    queue = await task_event_hub.subscribe(task_ids)
     try:
-        queued_jobs = r.lrange('celery', 0, -1)
-        active_jobs_count = sum(
-            1 for job in queued_jobs if json.loads(job).get('properties', {}).get('delivery_tag')
-        )
-        return active_jobs_count
-    except Exception as e:
-        logging.error(f"Error getting active jobs: {e}")
-        return 0
+        # Subscribed before reading the latest events, so nothing published in between is missed
+        channels = {progress_channel(task_id): task_id for task_id in task_ids}
+        pending = set(task_ids)
+        latest = await async_redis_client.mget([progress_key(task_id) for task_id in task_ids])
+        for task_id, data in zip(task_ids, latest):
+            event = json.loads(data) if data else await run_in_threadpool(_stored_event, task_id)
+            yield {"event": event_name, "data": json.dumps(dict(event, taskId=task_id))}
+            if event.get("state") in TERMINAL_STATES:
+                pending.discard(task_id)
+        deadline = time.monotonic() + PROGRESS_STREAM_TIMEOUT_SECONDS
+        while pending and time.monotonic() < deadline and not await request.is_disconnected():
+            try:
+                channel, data = await asyncio.wait_for(queue.get(), timeout=5.0)
+            except asyncio.TimeoutError:
+                continue
+            task_id, event = channels[channel], json.loads(data)
+            yield {"event": event_name, "data": json.dumps(dict(event, taskId=task_id))}
+            if event.get("state") in TERMINAL_STATES:
+                pending.discard(task_id)
+    finally:
+        await task_event_hub.unsubscribe(task_ids, queue)
+
+@router.get("/progress/{taskId}")
+async def stream_task_progress(taskId: str, request: Request, current_user: dict = Depends(get_current_user)):
+    """
+    Streams step progress for a generation task as server-sent events.
+
+    Each event carries the step number, elapsed time and ETA, and every few steps a small
+    preview image as a data URL. The final event has state SUCCESS (with the task result) or FAILURE.
+    """
+    return EventSourceResponse(_task_events([taskId], request, event_name="progress"))
+
+@router.get("/task-events")
+async def stream_task_events(taskIds: str, request: Request, current_user: dict = Depends(get_current_user)):
+    """
+    Streams the state transitions of one or many tasks as server-sent events, instead of polling
+    /task-status for each of them.
+
+    Every event is a JSON object with 'taskId' and 'state' (QUEUED, STARTED, PROGRESS, SUCCESS or
+    FAILURE); SUCCESS events carry the task result. Generation results name their upscale task
+    in 'upscaleTaskId', whose events can be followed the same way. The stream ends once every
+    task has finished.
+
+    :param taskIds: Comma-separated task IDs.
+    :raises HTTPException: If no or too many task IDs are given.
+    """
+    task_ids = list(dict.fromkeys(task_id.strip() for task_id in taskIds.split(",") if task_id.strip()))
+    if not task_ids or len(task_ids) > MAX_STREAM_TASKS:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {MAX_STREAM_TASKS} task IDs are required")
+    return EventSourceResponse(_task_events(task_ids, request))
 
 @router.get("/jobs/queued")
-async def get_queued_jobs(current_user: dict = Depends(get_current_user)):
+async def get_queued_jobs(aspectRatio: str = "1:1", priority: Literal["interactive", "batch"] = DEFAULT_LANE,
+                          current_user: dict = Depends(get_current_user)):
+    """
+    Reports queue depth and the estimated wait of a new job.
+
+    Counts come from counters the enqueue path and the workers maintain, so this is constant
+    time however deep the queue is.
+
+    :param aspectRatio: The aspect ratio of the job to estimate for.
+    :param priority: The lane of the job to estimate for.
+    :return: Total queued and running generation jobs, counts per queue, the estimated wait in
+             seconds (None until there are recent samples) and recent stage durations.
+    """
     try:
-        total_queued_jobs = get_queued_jobs_from_redis()
-        total_running_jobs = get_active_jobs_from_redis()
-        return {"queued_jobs": total_queued_jobs, "running_jobs": total_running_jobs}
+        counts = telemetry.counts()
+        return {
+            "queued_jobs": sum(counts[lane]["queued"] for lane in LANES),
+            "running_jobs": sum(counts[lane]["running"] for lane in LANES),
+            "queues": counts,
+            "estimatedWaitSeconds": telemetry.estimated_wait(aspectRatio, priority, counts),
+            "durations": {stage: telemetry.duration_stats(stage, aspectRatio) for stage in STAGES},
+        }
     except Exception as e:
         logging.error(f"Error retrieving job counts: {e}")
         return {"error": "Failed to retrieve job counts"}
@@ -1,13 +1,13 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 import logging
 import asyncio
 import html
 from typing import Iterator
 from app.db.models import User
-from app.db.database import get_db
-from app.db.model.user import get_user_from_uuid
+from app.db.database import get_async_db
+from app.db.model.user import get_user_from_uuid_async
 from app.api.auth import validate_jwt_token, get_current_user, generate_tokens
 from app.inference.language.llama.chat import generate_chat
 from app.inference.language.llama.description import generate_description
@@ -75,7 +75,7 @@ def delete_chat_history(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=404, detail={"status": "failure", "message": "Chat history not found"})
 
 @router.websocket("/ws/chat")
-async def websocket_chat_endpoint(websocket: WebSocket, db: Session = Depends(get_db)):
+async def websocket_chat_endpoint(websocket: WebSocket, db: AsyncSession = Depends(get_async_db)):
     # Accept the WebSocket connection
     await websocket.accept()
 
@@ -132,7 +132,9 @@ async def websocket_chat_endpoint(websocket: WebSocket, db: Session = Depends(ge
 
     # Fetch user from the database using the user_uuid
     user_uuid = user_info.get("sub")
-    user = get_user_from_uuid(user_uuid, db)
+    user = await get_user_from_uuid_async(user_uuid, db)
+    # The connection goes back to the pool instead of being held for the whole chat
+    await db.close()
     if not user:
         logger.error("User not found")
         await websocket.close(code=4000)  # Close with an error code
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from app.db.redis_config import async_redis_client
+from app.workers.progress import progress_channel
+
+# Set up logging configuration
+logger = logging.getLogger(__name__)
+
+class TaskEventHub:
+    """
+    Shares one Redis pub/sub connection between all task event streams of a process.
+
+    Streams register the task IDs they follow and get an asyncio queue. The first subscriber
+    of a task subscribes the shared connection to its channel, and the last one to leave
+    unsubscribes it. A single reader task fans each message out to the queues of that
+    channel, so a web worker holds one Redis subscription no matter how many clients stream.
+    """
+
+    def __init__(self, client=async_redis_client):
+        self.redis_client = client
+        self._pubsub = None
+        self._reader = None
+        self._subscribers = {}  # Channel -> queues of the streams following it
+        self._lock = asyncio.Lock()
+
+    @property
+    def channel_count(self) -> int:
+        return len(self._subscribers)
+
+    async def subscribe(self, task_ids: list) -> asyncio.Queue:
+        """
+        Follows the events of some tasks.
+
+        :return: A queue receiving (channel, data) tuples for the tasks' events.
+        """
+        queue = asyncio.Queue()
+        async with self._lock:
+            if self._pubsub is None:
+                self._pubsub = self.redis_client.pubsub()
+            channels = [progress_channel(task_id) for task_id in task_ids]
+            new = [channel for channel in dict.fromkeys(channels) if channel not in self._subscribers]
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add(queue)
+            if new:
+                await self._pubsub.subscribe(*new)
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read())
+        return queue
+
+    async def unsubscribe(self, task_ids: list, queue: asyncio.Queue) -> None:
+        """Stops following the tasks; channels nobody follows any more are unsubscribed."""
+        async with self._lock:
+            unused = []
+            for channel in dict.fromkeys(progress_channel(task_id) for task_id in task_ids):
+                queues = self._subscribers.get(channel)
+                if queues is None:
+                    continue
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[channel]
+                    unused.append(channel)
+            if unused:
+                await self._pubsub.unsubscribe(*unused)
+
+    async def _read(self) -> None:
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The connection resubscribes to its channels when it reconnects
+                logger.warning(f"Task event subscription failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message is None or message["type"] != "message":
+                continue
+            channel, data = message["channel"].decode(), message["data"].decode()
+            for queue in list(self._subscribers.get(channel, ())):
+                queue.put_nowait((channel, data))
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        self._pubsub, self._reader, self._subscribers = None, None, {}
+
+hub = TaskEventHub()
@@ -7,6 +7,7 @@ import uuid
 from app.db.models import User  # Adjusted path for the User model
 from app.db.schemas.user import UserCreate, UserRead  # Adjusted path for schemas
 from app.db.database import get_db  # Adjusted path for the get_db function
+from app.db.user_cache import user_cache
 from app.helpers.jwt import verify_token, TokenData  # Import the JWT utility function and TokenData model
 
 router = APIRouter()
@@ -55,6 +56,7 @@ def update_user(user_id: UUID, updated_user: UserCreate, db: Session = Depends(g
     user.email = updated_user.email
     user.name = updated_user.name
     db.commit()
+    user_cache.invalidate(user_id)
     db.refresh(user)
     return user
 
@@ -66,4 +68,5 @@ def delete_user(user_id: UUID, db: Session = Depends(get_db), current_user: Toke
         raise HTTPException(status_code=404, detail="User not found")
     db.delete(user)
     db.commit()
+    user_cache.invalidate(user_id)
     return user
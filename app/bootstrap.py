@@ -0,0 +1,33 @@
+import os
+import logging
+from dotenv import load_dotenv
+
+# Set up logging configuration
+logger = logging.getLogger(__name__)
+
+def bootstrap():
+    """
+    Runs the one-time setup steps of a deployment: logs in to Hugging Face (the token is stored
+    on disk, where the model loaders of every process pick it up) and creates the database schema.
+
+    Run once per deploy with `python -m app.bootstrap`, before starting the API and workers.
+
+    :raises ValueError: If HUGGINGFACE_TOKEN is not set.
+    """
+    load_dotenv()
+    hf_token = os.getenv("HUGGINGFACE_TOKEN")
+    if not hf_token:
+        raise ValueError("HUGGINGFACE_TOKEN environment variable is not set.")
+
+    from huggingface_hub import login
+    login(token=hf_token, add_to_git_credential=True)
+    logger.info("Logged in to Hugging Face.")
+
+    from app.db.database import Base, engine
+    import app.db.models  # Registers the tables on Base.metadata
+    Base.metadata.create_all(bind=engine)
+    logger.info("Database schema created.")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    bootstrap()
@@ -1,6 +1,7 @@
 # app/db/config.py
 
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -14,9 +15,31 @@ DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = os.getenv("DB_PORT", "5432")
 DB_NAME = os.getenv("DB_NAME", "default_db")
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Used by request handlers, which must not block the event loop on a query
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
 
-engine = create_engine(DATABASE_URL)
+# Connection pool of each engine, per process (each Uvicorn and Celery worker has its own).
+# Every process may open up to 2 x (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections, and the sum
+# over all processes must stay below Postgres' max_connections (100 by default)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 2))  # Connections kept open
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 2))  # Extra connections opened under load
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))  # Longest wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # Reconnect after this many seconds; -1 never does
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")  # Test connections on checkout
+
+POOL_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+engine = create_engine(DATABASE_URL, **POOL_OPTIONS)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **POOL_OPTIONS)
+# Loaded objects stay usable after a commit, without another round trip to reload them
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
@@ -33,4 +56,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Dependency to get an async database session, for `async def` handlers
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
         
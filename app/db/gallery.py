@@ -0,0 +1,58 @@
+import base64
+import uuid
+from datetime import datetime
+from sqlalchemy import select, tuple_
+from app.db.models import Image
+
+# The columns the gallery grid shows. Together with the key columns they are all stored in the
+# gallery index, so a page is read from the index alone.
+GALLERY_COLUMNS = (Image.id, Image.url, Image.aspectRatio, Image.tier, Image.created_at)
+
+class InvalidCursor(ValueError):
+    """Raised for a gallery cursor that was not issued by `encode_cursor`."""
+
+def encode_cursor(created_at: datetime, image_id: uuid.UUID) -> str:
+    """Returns an opaque cursor pointing just past the given image."""
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{image_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Decodes a cursor from `encode_cursor`.
+
+    :return: A tuple of (created_at, image ID).
+    :raises InvalidCursor: If the cursor is malformed.
+    """
+    try:
+        created_at, image_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(image_id)
+    except ValueError as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+def gallery_query(user_id: uuid.UUID, limit: int, cursor: str = None):
+    """
+    Builds the query of a gallery page: a user's images newest first, `limit` + 1 rows so the
+    caller can tell whether another page follows.
+
+    Pages are found by keyset pagination on (user_id, created_at, id): the cursor is the last
+    row of the previous page and the query seeks past it in the index, so every page costs the
+    same however deep it is, unlike OFFSET, which reads and discards every skipped row.
+    """
+    query = select(*GALLERY_COLUMNS).where(Image.user_id == user_id)
+    if cursor is not None:
+        created_at, image_id = decode_cursor(cursor)
+        query = query.where(tuple_(Image.created_at, Image.id) < tuple_(created_at, image_id))
+    return query.order_by(Image.created_at.desc(), Image.id.desc()).limit(limit + 1)
+
+def gallery_page(session, user_id: uuid.UUID, limit: int, cursor: str = None) -> tuple:
+    """
+    Loads a page of a user's gallery.
+
+    :param session: A database session or connection.
+    :return: A tuple of (rows, the cursor of the next page or None on the last page).
+    :raises InvalidCursor: If `cursor` is malformed.
+    """
+    rows = session.execute(gallery_query(user_id, limit, cursor)).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
@@ -1,6 +1,10 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.db.models import User
 from app.db.schemas.user import UserCreate, UserUpdate
+from app.db.user_cache import user_cache
+from typing import Optional
 from uuid import UUID
 
 def get_user(db: Session, user_uuid: UUID):
@@ -25,6 +29,7 @@ def update_user(db: Session, user_uuid: UUID, user: UserUpdate):
         for key, value in user.dict(exclude_unset=True).items():
             setattr(db_user, key, value)
         db.commit()
+        user_cache.invalidate(user_uuid)
         db.refresh(db_user)
     return db_user
 
@@ -33,7 +38,17 @@ def delete_user(db: Session, user_uuid: UUID):
     if db_user:
         db.delete(db_user)
         db.commit()
+        user_cache.invalidate(user_uuid)
     return db_user
 def get_user_from_uuid(user_uuid: str, db: Session) -> User:
     """Fetch user from the database by UUID."""
-    return db.query(User).filter(User.uuid == user_uuid).first()
\ No newline at end of file
+    return db.query(User).filter(User.uuid == user_uuid).first()
+
+async def get_user_from_uuid_async(user_uuid: str, db: AsyncSession) -> Optional[User]:
+    """Fetch user from the database by UUID, without blocking the event loop."""
+    try:
+        user_uuid = UUID(str(user_uuid))
+    except ValueError:
+        return None
+    result = await db.execute(select(User).where(User.uuid == user_uuid))
+    return result.scalars().first()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, MetaData, Text
+from sqlalchemy import Column, String, DateTime, ForeignKey, MetaData, Text, BigInteger, Float, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -31,6 +31,11 @@ class Image(Base):
     prompt = Column(Text, nullable=False)  # Prompt text, cannot be null
     refinedPrompt = Column(Text, nullable=True)  # Refined prompt, can be null
     aspectRatio = Column(String, nullable=False)  # Aspect ratio, cannot be null
+    seed = Column(BigInteger, nullable=True)  # Seed the image was generated with
+    tier = Column(String, nullable=True)  # Speed tier: 'draft', 'standard' or 'final'
+    wait_seconds = Column(Float, nullable=True)  # Time spent queued
+    generate_seconds = Column(Float, nullable=True)  # Time spent in the pipeline (for the whole batch)
+    size_bytes = Column(BigInteger, nullable=True)  # Size of the original file
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     
     # Foreign key to associate the image with a user
@@ -38,3 +43,10 @@ class Image(Base):
     
     # Back reference to the User model
     user = relationship('User', back_populates='images')
+
+    __table_args__ = (
+        # Keyset pagination of a user's gallery, newest first (see app/db/gallery.py). The grid's
+        # columns are included so pages are served by index-only scans.
+        Index('ix_images_user_id_created_at_id', 'user_id', 'created_at', 'id',
+              postgresql_include=['url', 'aspectRatio', 'tier']),
+    )
@@ -1,7 +1,11 @@
 import redis
+import redis.asyncio
 # Redis configuration
 REDIS_HOST = 'localhost'
 REDIS_PORT = 6379
 REDIS_DB = 0
 
 redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB)
+
+# Async client for request handlers that wait on pub/sub without blocking the event loop
+async_redis_client = redis.asyncio.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB)
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+import redis
+from app.db.models import User
+from app.db.redis_config import async_redis_client, redis_client
+
+# Set up logging configuration
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 30))  # Per-process tier; bounds staleness if an invalidation is missed
+USER_CACHE_REDIS_TTL_SECONDS = int(os.getenv("USER_CACHE_REDIS_TTL_SECONDS", 300))  # Shared tier
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", 10000))
+
+# Users that changed are announced here, so every process drops its own copy
+INVALIDATION_CHANNEL = "users:invalidate"
+# The refresh token is deliberately left out; nothing that reads the current user needs it
+CACHED_COLUMNS = ("uuid", "email", "name", "last_logged_in", "created_at", "updated_at")
+
+def user_key(user_uuid) -> str:
+    return f"user:{user_uuid}"
+
+class TTLCache:
+    """Thread-safe LRU of at most `max_entries` entries, each dropped once its expiry time passes."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # Key -> (expiry as time.time(), value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the value stored under `key`, or None if there is none or it has expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+def _dump(user: User) -> str:
+    columns = {}
+    for name in CACHED_COLUMNS:
+        value = getattr(user, name)
+        columns[name] = value.isoformat() if isinstance(value, datetime) else str(value) if value is not None else None
+    return json.dumps(columns)
+
+def _load(payload) -> dict:
+    columns = json.loads(payload)
+    columns["uuid"] = UUID(columns["uuid"])
+    for name in ("last_logged_in", "created_at", "updated_at"):
+        if columns.get(name) is not None:
+            columns[name] = datetime.fromisoformat(columns[name])
+    return columns
+
+class UserCache:
+    """
+    Two-level cache of the users that requests authenticate as, keyed by user UUID.
+
+    Lookups try a per-process LRU first (`ttl` seconds), then Redis (`redis_ttl` seconds), which
+    the API processes share; only a miss in both reaches Postgres. Each hit returns a new,
+    transient `User` carrying the cached columns, so requests never share an ORM instance.
+
+    Writers call `invalidate` once a user changes. It deletes the Redis entry and announces the
+    UUID on INVALIDATION_CHANNEL; `listen` drops announced users from the process's own tier.
+    Redis errors are logged and treated as misses.
+    """
+
+    def __init__(self, client=redis_client, async_client=async_redis_client, ttl: float = USER_CACHE_TTL_SECONDS,
+                 redis_ttl: int = USER_CACHE_REDIS_TTL_SECONDS, max_entries: int = USER_CACHE_MAX_ENTRIES):
+        self.redis_client = client
+        self.async_redis_client = async_client
+        self.ttl = ttl
+        self.redis_ttl = redis_ttl
+        self.local = TTLCache(max_entries)
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    async def get(self, user_uuid) -> Optional[User]:
+        """
+        Looks up a user in the process's tier, then in Redis.
+
+        :param user_uuid: The user's UUID, as a string or a UUID.
+        :return: A transient `User`, or None on a miss.
+        """
+        key = str(user_uuid)
+        columns = self.local.get(key)
+        if columns is not None:
+            self.local_hits += 1
+            return User(**columns)
+        try:
+            payload = await self.async_redis_client.get(user_key(key))
+        except redis.RedisError as e:
+            logger.warning(f"User cache lookup failed: {e}")
+            payload = None
+        if payload is None:
+            self.misses += 1
+            return None
+        self.redis_hits += 1
+        columns = _load(payload)
+        self.local.set(key, columns, time.time() + self.ttl)
+        return User(**columns)
+
+    async def set(self, user: User) -> None:
+        """Caches a user just read from the database in both tiers."""
+        payload = _dump(user)
+        self.local.set(str(user.uuid), _load(payload), time.time() + self.ttl)
+        try:
+            await self.async_redis_client.set(user_key(user.uuid), payload, ex=self.redis_ttl)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to cache user {user.uuid}: {e}")
+
+    def invalidate(self, user_uuid) -> None:
+        """Forgets a user in every process, e.g. after an update; for synchronous callers."""
+        key = str(user_uuid)
+        self.local.pop(key)
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.delete(user_key(key))
+            pipe.publish(INVALIDATION_CHANNEL, key)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Failed to invalidate cached user {key}: {e}")
+
+    async def invalidate_async(self, user_uuid) -> None:
+        """Forgets a user in every process; for `async def` callers."""
+        key = str(user_uuid)
+        self.local.pop(key)
+        try:
+            async with self.async_redis_client.pipeline() as pipe:
+                pipe.delete(user_key(key))
+                pipe.publish(INVALIDATION_CHANNEL, key)
+                await pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Failed to invalidate cached user {key}: {e}")
+
+    async def listen(self) -> None:
+        """Drops users that other processes invalidate from this process's tier, until cancelled."""
+        while True:
+            pubsub = self.async_redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Announcements made while not subscribed are lost; start over
+                self.local.clear()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.local.pop(message["data"].decode())
+            except redis.RedisError as e:
+                logger.warning(f"User cache invalidation listener lost Redis, retrying: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def stats(self) -> dict:
+        return {"local_hits": self.local_hits, "redis_hits": self.redis_hits, "misses": self.misses, "entries": len(self.local)}
+
+user_cache = UserCache()
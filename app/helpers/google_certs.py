@@ -0,0 +1,175 @@
+import os
+import re
+import json
+import time
+import base64
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from google.auth import jwt as google_jwt
+
+# Set up logging configuration
+logger = logging.getLogger(__name__)
+
+# Google's signing certificates, as {key ID: PEM certificate}
+GOOGLE_CERTS_URL = os.getenv("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs")
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+GOOGLE_CERTS_DEFAULT_TTL = int(os.getenv("GOOGLE_CERTS_DEFAULT_TTL", 3600))  # When the response has no max-age
+GOOGLE_CERTS_REFRESH_MARGIN = int(os.getenv("GOOGLE_CERTS_REFRESH_MARGIN", 300))  # Refresh this long before expiry
+GOOGLE_CERTS_RETRY_SECONDS = int(os.getenv("GOOGLE_CERTS_RETRY_SECONDS", 30))  # After a failed refresh
+GOOGLE_HTTP_POOL_SIZE = int(os.getenv("GOOGLE_HTTP_POOL_SIZE", 4))
+GOOGLE_HTTP_TIMEOUT = float(os.getenv("GOOGLE_HTTP_TIMEOUT", 5))
+CLOCK_SKEW_SECONDS = 10
+
+def max_age(headers) -> int:
+    """
+    Returns how long a response may be cached according to its Cache-Control and Age headers.
+
+    :return: The remaining lifetime in seconds, GOOGLE_CERTS_DEFAULT_TTL without a max-age, or 0 for no-store/no-cache.
+    """
+    cache_control = headers.get("Cache-Control", "").lower()
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = re.search(r"(?:^|[,\s])max-age=(\d+)", cache_control)
+    if match is None:
+        return GOOGLE_CERTS_DEFAULT_TTL
+    try:
+        age = int(headers.get("Age", 0))
+    except ValueError:
+        age = 0
+    return max(int(match.group(1)) - age, 0)
+
+def _key_id(token: str):
+    """Reads the key ID from a token's header, without verifying anything."""
+    try:
+        header = token.split(".")[0]
+        return json.loads(base64.urlsafe_b64decode(header + "=" * (-len(header) % 4))).get("kid")
+    except (ValueError, AttributeError):
+        return None
+
+class GoogleTokenVerifier:
+    """
+    Verifies Google ID tokens locally against a cached copy of Google's signing certificates.
+
+    Certificates are downloaded through one long-lived `requests` session, so the connection
+    (and its TLS session) is reused, and kept for as long as the response's Cache-Control
+    allows. A background thread downloads them again GOOGLE_CERTS_REFRESH_MARGIN seconds before
+    they expire, so logins only wait on Google for the very first download. Concurrent logins
+    that find no usable certificates share a single download.
+
+    A token signed with a key the cache does not know (Google has just rotated its keys)
+    triggers one early download, at most every GOOGLE_CERTS_RETRY_SECONDS. If a refresh fails,
+    the previous certificates keep being used until it succeeds.
+    """
+
+    def __init__(self, client_id: str = None, certs_url: str = GOOGLE_CERTS_URL, session: requests.Session = None):
+        self.client_id = client_id or os.getenv("GOOGLE_CLIENT_ID")
+        self.certs_url = certs_url
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=GOOGLE_HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+        self._certs = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._last_attempt = float("-inf")
+        self._lock = threading.Lock()  # Held while downloading
+        self._wake = threading.Event()
+        self._refresher = None
+        self._stopped = False
+        self.fetches = 0
+
+    def _fetch(self) -> None:
+        """Downloads the certificates; on failure the previous ones are kept and a retry is scheduled."""
+        now = self._last_attempt = time.monotonic()
+        try:
+            response = self.session.get(self.certs_url, timeout=GOOGLE_HTTP_TIMEOUT)
+            response.raise_for_status()
+            certs = response.json()
+        except (requests.RequestException, ValueError):
+            self._refresh_at = now + GOOGLE_CERTS_RETRY_SECONDS
+            raise
+        ttl = max_age(response.headers)
+        self._certs = certs
+        self._expires_at = now + ttl
+        self._refresh_at = now + max(ttl - GOOGLE_CERTS_REFRESH_MARGIN, ttl / 2, GOOGLE_CERTS_RETRY_SECONDS)
+        self.fetches += 1
+        logger.info(f"Fetched {len(certs)} Google signing certificates, valid for {ttl}s")
+
+    def certs(self, key_id: str = None) -> dict:
+        """
+        Returns the cached certificates. They are downloaded first if there are none, or if they
+        have expired or lack `key_id` and no download was tried in the last GOOGLE_CERTS_RETRY_SECONDS.
+
+        :raises ValueError: If there are no certificates and they cannot be downloaded.
+        """
+        self._start_refresher()
+        certs = self._certs
+        if certs is not None and time.monotonic() < self._expires_at and (key_id is None or key_id in certs):
+            return certs
+        with self._lock:
+            # Another thread may have downloaded them while this one waited for the lock
+            certs = self._certs
+            usable = certs is not None and time.monotonic() < self._expires_at and (key_id is None or key_id in certs)
+            retry_due = time.monotonic() - self._last_attempt >= GOOGLE_CERTS_RETRY_SECONDS
+            if certs is None or (not usable and retry_due):
+                try:
+                    self._fetch()
+                except (requests.RequestException, ValueError) as e:
+                    if self._certs is None:
+                        raise ValueError(f"Could not fetch Google's signing certificates: {e}")
+                    logger.warning(f"Could not refresh Google's signing certificates, using the previous ones: {e}")
+                finally:
+                    self._wake.set()
+            return self._certs
+
+    def verify(self, token: str) -> dict:
+        """
+        Verifies a Google ID token's signature, audience, issuer and expiry.
+
+        :param token: The ID token.
+        :return: The token's claims.
+        :raises ValueError: If the token is invalid, or the certificates cannot be fetched.
+        """
+        if isinstance(token, bytes):
+            token = token.decode("utf-8")
+        claims = google_jwt.decode(
+            token, certs=self.certs(_key_id(token)), audience=self.client_id, clock_skew_in_seconds=CLOCK_SKEW_SECONDS
+        )
+        if claims.get("iss") not in GOOGLE_ISSUERS:
+            raise ValueError(f"Wrong issuer. 'iss' should be one of {GOOGLE_ISSUERS} but got {claims.get('iss')}")
+        return claims
+
+    def _start_refresher(self) -> None:
+        if self._refresher is not None:
+            return
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh_forever, name="google-certs-refresher", daemon=True)
+                self._refresher.start()
+
+    def _refresh_forever(self) -> None:
+        while not self._stopped:
+            # The first download is made by the login that needs it. Woken whenever a login
+            # downloads them, so the schedule follows the new expiry.
+            delay = max(self._refresh_at - time.monotonic(), 0) if self._certs is not None else None
+            if self._wake.wait(delay):
+                self._wake.clear()
+                continue
+            with self._lock:
+                if self._stopped or time.monotonic() < self._refresh_at:
+                    continue
+                try:
+                    self._fetch()
+                except Exception as e:
+                    logger.warning(f"Background refresh of Google's signing certificates failed, retrying in {GOOGLE_CERTS_RETRY_SECONDS}s: {e}")
+
+    def stop(self) -> None:
+        """Stops the background refresh."""
+        self._stopped = True
+        self._wake.set()
+
+google_verifier = GoogleTokenVerifier()
@@ -0,0 +1,32 @@
+import logging
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+ASPECT_RATIOS = {
+    "1:1": (1024, 1024),
+    "2:3": (1024, 1536),
+    "3:2": (1536, 1024),
+    "4:3": (1280, 960),
+    "3:4": (960, 1280),
+    "16:9": (1920, 1080),
+    "21:9": (2520, 1080),
+    "32:9": (1280, 360),  # Updated after dividing by 4
+}
+
+DEFAULT_ASPECT_RATIO = "1:1"
+
+def get_aspect_ratio_dimensions(aspect_ratio: str) -> tuple:
+    """
+    Retrieves the dimensions for the given aspect ratio.
+
+    Kept free of torch/diffusers imports so the API process can bucket jobs without loading the models.
+
+    :param aspect_ratio: The aspect ratio string (e.g., '16:9', '4:3').
+    :return: A tuple containing the width and height for the specified aspect ratio.
+    """
+    if aspect_ratio not in ASPECT_RATIOS:
+        logger.warning(f"Invalid aspect ratio '{aspect_ratio}'. Defaulting to '{DEFAULT_ASPECT_RATIO}'.")
+        aspect_ratio = DEFAULT_ASPECT_RATIO  # Default aspect ratio if invalid
+
+    return ASPECT_RATIOS[aspect_ratio]
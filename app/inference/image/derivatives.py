@@ -0,0 +1,184 @@
+import io
+import os
+import re
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from PIL import Image
+from app.db.redis_config import redis_client
+from app.inference.image.storage import get_storage, object_key
+from app.inference.image.writer import ENCODERS, BYTES_KEY, encoder_available, files_key, open_image
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Derivative configuration
+DERIVATIVE_WIDTHS = [int(width) for width in os.getenv("DERIVATIVE_WIDTHS", "256,512,1024").split(",")]
+DERIVATIVE_FORMAT = os.getenv("DERIVATIVE_FORMAT", "webp")  # 'webp' or 'avif'
+DERIVATIVE_QUALITY = int(os.getenv("DERIVATIVE_QUALITY", 80))
+DERIVATIVE_POOL = os.getenv("DERIVATIVE_POOL", "process")  # 'process' or 'thread'
+DERIVATIVE_WORKERS = int(os.getenv("DERIVATIVE_WORKERS", 2))
+
+# Lossy encoder options per format; derivatives are for display, not for reuse
+DERIVATIVE_OPTIONS = {
+    "webp": lambda quality: {"quality": quality, "method": 4},
+    "avif": lambda quality: {"quality": quality},
+}
+
+_KEY_PATTERN = re.compile(r"(?:.*/)?(?P<image_id>[^/_]+)_(?P<width>\d+)w\.(?:webp|avif)")
+
+def get_derivative_format() -> str:
+    """Returns the configured derivative format, falling back to WebP when it is not available."""
+    name = DERIVATIVE_FORMAT.lower()
+    if name not in DERIVATIVE_OPTIONS or not encoder_available(name):
+        logger.warning(f"Derivative format '{name}' is not available. Defaulting to 'webp'.")
+        name = "webp"
+    return name
+
+def derivatives_key(image_id: str) -> str:
+    """Returns the Redis hash recording an image's derivatives: their URL by width."""
+    return f"image:{image_id}:derivatives"
+
+def derivative_key(image_id: str, width: int) -> str:
+    """Returns the storage key of a derivative, e.g. '3f/a2/3fa2..._256w.webp'."""
+    return object_key(image_id, f"{image_id}_{width}w{ENCODERS[get_derivative_format()]['extension']}")
+
+def parse_derivative_key(key: str):
+    """
+    Recognizes the storage key of a derivative of the configured ladder.
+
+    :return: A tuple of (image ID, width), or None if `key` is not such a key.
+    """
+    match = _KEY_PATTERN.fullmatch(key)
+    if match is None:
+        return None
+    image_id, width = match["image_id"], int(match["width"])
+    if width not in DERIVATIVE_WIDTHS or derivative_key(image_id, width) != key:
+        return None
+    return image_id, width
+
+def derivative_widths(source_width: int = None, widths: list = None) -> list:
+    """
+    Returns the widths of the ladder (or of `widths`) that an image `source_width` pixels wide
+    has derivatives for. Wider ones are skipped, so a derivative's label is always its real width.
+    """
+    return [width for width in widths or DERIVATIVE_WIDTHS if source_width is None or width <= source_width]
+
+def derivative_urls(image_id: str, source_width: int = None) -> dict:
+    """
+    Returns the URL of every derivative of an image by width. The URLs are known before the
+    derivatives exist; the image server makes missing ones on first request.
+
+    :param source_width: The width of the image, which leaves out the widths it is too narrow for.
+    """
+    storage = get_storage()
+    return {width: storage.url(derivative_key(image_id, width)) for width in derivative_widths(source_width)}
+
+def srcset(image_id: str, source_width: int = None) -> str:
+    """Returns the `srcset` attribute listing an image's derivatives."""
+    return ", ".join(f"{url} {width}w" for width, url in derivative_urls(image_id, source_width).items())
+
+def make_derivatives(image_id: str, widths: list = None) -> dict:
+    """
+    Resizes an image's original to each width (keeping its aspect ratio) and stores the
+    results. Widths larger than the original are skipped rather than enlarged.
+
+    :param image_id: Unique identifier of the image.
+    :param widths: The widths to make, by default the whole ladder.
+    :return: The size of each stored derivative in bytes, by storage key.
+    """
+    name = get_derivative_format()
+    options = DERIVATIVE_OPTIONS[name](DERIVATIVE_QUALITY)
+    source = open_image(image_id, "original").convert("RGB")
+    sizes = {}
+    for width in sorted(derivative_widths(source.width, widths), reverse=True):
+        # Each size is resized from the previous, larger one, which is much cheaper than
+        # resizing every size from the original
+        if width < source.width:
+            source = source.resize((width, max(1, round(source.height * width / source.width))), Image.LANCZOS)
+        buffer = io.BytesIO()
+        source.save(buffer, format=ENCODERS[name]["format"], **options)
+        key = derivative_key(image_id, width)
+        sizes[key] = get_storage().put(key, buffer.getvalue())
+    return sizes
+
+def record_derivatives(image_id: str, sizes: dict) -> None:
+    """Records stored derivatives in the image's metadata and in the writer's file index."""
+    storage = get_storage()
+    widths = {key: parse_derivative_key(key)[1] for key in sizes}
+    pipe = redis_client.pipeline()
+    for key in sizes:
+        pipe.hget(files_key(image_id), key)
+    previous = pipe.execute()
+    pipe = redis_client.pipeline()
+    pipe.hset(derivatives_key(image_id), mapping={width: storage.url(key) for key, width in widths.items()})
+    pipe.hset(files_key(image_id), mapping=sizes)
+    pipe.incrby(BYTES_KEY, sum(sizes.values()) - sum(int(size or 0) for size in previous))
+    pipe.execute()
+
+class DerivativeMaker:
+    """
+    Makes derivatives on demand in a process pool, for the image server.
+
+    Concurrent requests for a derivative that is already being made share its job instead of
+    starting another one.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(DerivativeMaker, cls).__new__(cls)
+            cls._instance._executor = None
+            cls._instance._pending = {}  # Future making each derivative, by storage key
+            cls._instance._lock = threading.Lock()
+        return cls._instance
+
+    def _get_executor(self):
+        # Created on first use so pools are never inherited across a fork
+        if self._executor is None:
+            pool = ProcessPoolExecutor if DERIVATIVE_POOL == "process" else ThreadPoolExecutor
+            self._executor = pool(max_workers=DERIVATIVE_WORKERS)
+            logger.info(f"Derivative maker started with {DERIVATIVE_WORKERS} {DERIVATIVE_POOL} workers")
+        return self._executor
+
+    def submit(self, image_id: str, widths: list = None) -> dict:
+        """
+        Makes derivatives of an image, joining jobs already making some of them.
+
+        :return: A Future for each derivative, by storage key, resolving to the sizes made by its job.
+        """
+        futures, missing, future = {}, [], None
+        with self._lock:
+            for width in widths or DERIVATIVE_WIDTHS:
+                key = derivative_key(image_id, width)
+                if key in self._pending:
+                    futures[key] = self._pending[key]
+                else:
+                    missing.append(width)
+            if missing:
+                future = self._get_executor().submit(make_derivatives, image_id, missing)
+                keys = [derivative_key(image_id, width) for width in missing]
+                for key in keys:
+                    self._pending[key] = futures[key] = future
+        if future is not None:
+            # Added outside the lock: a job that is already done runs its callback right away
+            future.add_done_callback(lambda f: self._completed(image_id, keys, f))
+        return futures
+
+    def _completed(self, image_id: str, keys: list, future) -> None:
+        with self._lock:
+            for key in keys:
+                self._pending.pop(key, None)
+        if future.exception() is not None:
+            logger.error(f"Failed to make derivatives of image {image_id}: {future.exception()}")
+            return
+        try:
+            record_derivatives(image_id, future.result())
+        except Exception as e:
+            logger.error(f"Failed to record derivatives of image {image_id}: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -0,0 +1,53 @@
+import os
+from app.inference.image.aspect_ratio import get_aspect_ratio_dimensions
+
+# Generation settings shared by the worker and the API. Kept free of torch/diffusers imports
+# so the API process can derive cache keys without loading the models.
+FLUX_VERSION = os.getenv("FLUX_VERSION", "default_version")
+MAX_SEQUENCE_LENGTH = 255
+NUM_INFERENCE_STEPS = 16
+GUIDANCE_SCALE = 100
+MAX_SEED = 2**32 - 1
+MAX_VARIATIONS = int(os.getenv("FLUX_MAX_VARIATIONS", 8))  # Images per prompt in one batch generation request
+
+# Flux latents are packed in 2x2 patches of 1/8-scale latents, so sizes must be multiples of 16
+DIMENSION_MULTIPLE = 16
+
+# Speed tiers. 'draft' renders a cheap preview at a fraction of the resolution with few steps;
+# 'final' refines a chosen draft at full resolution with an img2img pass that re-runs only the
+# last `strength` share of the schedule; 'standard' is a full text-to-image run.
+TIERS = {
+    "draft": {
+        "steps": int(os.getenv("DRAFT_STEPS", 4)),
+        "scale": float(os.getenv("DRAFT_SCALE", 0.5)),
+    },
+    "standard": {
+        "steps": NUM_INFERENCE_STEPS,
+        "scale": 1.0,
+    },
+    "final": {
+        "steps": NUM_INFERENCE_STEPS,
+        "scale": 1.0,
+        "strength": float(os.getenv("FINAL_REFINE_STRENGTH", 0.6)),
+    },
+}
+DEFAULT_TIER = "standard"
+
+def get_tier_dimensions(aspect_ratio: str, tier: str = DEFAULT_TIER) -> tuple:
+    """
+    Returns the generation size of an aspect ratio bucket in a tier. Tiers that scale the
+    resolution round the scaled size down to a size Flux accepts; full-resolution tiers use the
+    bucket size as is.
+
+    :param aspect_ratio: The aspect ratio string (e.g., '16:9', '4:3').
+    :param tier: The speed tier name.
+    :return: A tuple containing the width and height.
+    """
+    width, height = get_aspect_ratio_dimensions(aspect_ratio)
+    scale = TIERS[tier]["scale"]
+    if scale == 1.0:
+        return width, height
+    return tuple(
+        max(DIMENSION_MULTIPLE, int(side * scale) // DIMENSION_MULTIPLE * DIMENSION_MULTIPLE)
+        for side in (width, height)
+    )
@@ -1,8 +1,10 @@
 import uuid
 from PIL import Image
 import logging
-from app.inference.image.flux.model import FluxPipelineManager
-from app.inference.image.realesrgan.rescaler import upscale_and_resize_image
+from app.inference.image.aspect_ratio import get_aspect_ratio_dimensions
+from app.inference.image.flux.config import TIERS, DEFAULT_TIER, get_tier_dimensions
+from app.inference.registry import get_model
+from app.inference.image.writer import ImageWriter, open_image
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -15,63 +17,94 @@ def _get_aspect_ratio_dimensions(aspect_ratio: str) -> tuple:
     :param aspect_ratio: The aspect ratio string (e.g., '16:9', '4:3').
     :return: A tuple containing the width and height for the specified aspect ratio.
     """
-    aspect_ratios = {
-        "1:1": (1024, 1024),
-        "2:3": (1024, 1536),
-        "3:2": (1536, 1024),
-        "4:3": (1280, 960),
-        "3:4": (960, 1280),
-        "16:9": (1920, 1080),
-        "21:9": (2520, 1080),
-        "32:9": (1280, 360),  # Updated after dividing by 4
-    }
-    
-    if aspect_ratio not in aspect_ratios:
-        logger.warning(f"Invalid aspect ratio '{aspect_ratio}'. Defaulting to '1:1'.")
-        aspect_ratio = "1:1"  # Default aspect ratio if invalid
-
-    return aspect_ratios[aspect_ratio]
+    return get_aspect_ratio_dimensions(aspect_ratio)
 
 def generate_image(prompt: str, aspect_ratio: str) -> str:
     """
-    Generates an image based on a prompt and aspect ratio, then upscales and saves the image.
+    Generates an image based on a prompt and aspect ratio, then saves the image.
 
     :param prompt: The text prompt to generate the image.
     :param aspect_ratio: The desired aspect ratio of the generated image (e.g., '16:9', '4:3').
     :return: A unique identifier for the generated image.
     """
-    logger.info(f"Generating image with prompt: '{prompt}' and aspect ratio: '{aspect_ratio}'")
+    return generate_images([prompt], aspect_ratio)[0]
 
-    initial_width, initial_height = _get_aspect_ratio_dimensions(aspect_ratio)
+def generate_images(prompts: list, aspect_ratio: str, on_saved=None, progress=None, seeds: list = None,
+                    tier: str = DEFAULT_TIER, draft_image_ids: list = None, num_images_per_prompt: int = 1,
+                    on_failed=None) -> list:
+    """
+    Generates `num_images_per_prompt` images per prompt in a single batched pipeline call, then saves each image.
+
+    Upscaling is a separate stage (see `upscale_image`), so the base images are available as soon as they are saved.
+
+    All prompts share the aspect ratio and tier, since the transformer can only batch latents of the same size.
+
+    :param prompts: The text prompts to generate images for.
+    :param aspect_ratio: The desired aspect ratio of the generated images (e.g., '16:9', '4:3').
+    :param on_saved: Optional callback, called with each image ID once its file has been written.
+    :param progress: Optional ProgressReporter receiving step-level progress and previews.
+    :param seeds: Optional seeds, one per image, prompt by prompt. Images without a seed get a random one.
+    :param tier: The speed tier ('draft', 'standard' or 'final'), which sets the resolution and step budget.
+    :param draft_image_ids: For the 'final' tier, the drafts to refine, one per prompt.
+    :param num_images_per_prompt: The number of variations per prompt; not supported by the 'final' tier.
+    :param on_failed: Optional callback, called with an image ID and the exception if its file could not be written.
+    :return: A list of unique image identifiers, prompt by prompt.
+    """
+    logger.info(f"Generating {len(prompts)} {tier} image(s) with aspect ratio: '{aspect_ratio}'")
+
+    initial_width, initial_height = get_tier_dimensions(aspect_ratio, tier)
     logger.info(f"Using dimensions: width={initial_width}, height={initial_height}")
 
-    logger.info("Generating image...")
-   
-    pipe = FluxPipelineManager()
-    
-    image = pipe.generate_image(prompt,initial_width,initial_height)   
+    pipe = get_model("flux")
+    settings = TIERS[tier]
 
-    image_id = str(uuid.uuid4())   
+    if tier == "final":
+        logger.info("Refining drafts...")
+        drafts = [open_image(draft_id, "original").convert("RGB") for draft_id in draft_image_ids]
+        images = pipe.refine_images(prompts, drafts, initial_width, initial_height, settings["strength"],
+                                    progress=progress, seeds=seeds, num_inference_steps=settings["steps"])
+    else:
+        logger.info("Generating image...")
+        images = pipe.generate_images(prompts, initial_width, initial_height, progress=progress, seeds=seeds,
+                                      num_inference_steps=settings["steps"], num_images_per_prompt=num_images_per_prompt)
+
+    image_ids = []
+    for image in images:
+        image_id = str(uuid.uuid4())
+        _save_image(image, image_id, on_saved=on_saved, on_failed=on_failed)  # Save the original image
+        image_ids.append(image_id)
+
+    return image_ids
+
+def upscale_image(image_id: str, on_saved=None) -> str:
+    """
+    Upscales a previously generated image and saves the result next to the original. Returns
+    once the upscaled file has been written, so its URL can be reported right away.
+
+    :param image_id: Unique identifier of the generated image.
+    :param on_saved: Optional callback, called with the image ID once the upscaled file has been written.
+    :return: The unique identifier of the image.
+    :raises Exception: If the upscaled file could not be written.
+    """
+    # Imported here so generation workers never load the Real-ESRGAN weights
+    from app.inference.image.realesrgan.rescaler import upscale_and_resize_image
 
-    image_id = str(uuid.uuid4())
-    _save_image(image, image_id)  # Save the original image
-    
+    image = open_image(image_id, "original").convert("RGB")
     logger.info("Upscaling and resizing image...")
     image_s = upscale_and_resize_image(image, 4)
-    _save_image(image_s, image_id, is_upscaled=True)  # Save the upscaled image
-    
+    # Save the upscaled image; the upscale worker has nothing else to overlap the write with
+    _save_image(image_s, image_id, is_upscaled=True, on_saved=on_saved).result()
     return image_id
 
-def _save_image(image: Image.Image, image_id: str, is_upscaled: bool = False) -> None:
+def _save_image(image: Image.Image, image_id: str, is_upscaled: bool = False, on_saved=None, on_failed=None):
     """
-    Saves the given image to a file.
+    Hands the given image to the image writer, which encodes and writes it in the background.
 
     :param image: The PIL Image to save.
     :param image_id: Unique identifier for the image.
     :param is_upscaled: If True, saves the image without a prefix.
+    :param on_saved: Optional callback, called with the image ID once the file has been written.
+    :param on_failed: Optional callback, called with the image ID and the exception if the write fails.
+    :return: A Future resolving to the size of the written file in bytes.
     """
-    prefix = "" if is_upscaled else "original_"
-    image_path = f"frontend/images/{prefix}{image_id}.png"
-    image.save(image_path)
-    logger.info(f"Saving image to '{image_path}'...")
-    logger.info("Image saved.")
+    return ImageWriter().submit(image, image_id, "upscaled" if is_upscaled else "original", on_done=on_saved, on_failed=on_failed)
@@ -0,0 +1,189 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import torch
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+PROMPT_EMBED_CACHE_MAX_BYTES = int(os.getenv("PROMPT_EMBED_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+PROMPT_EMBED_CACHE_DIR = os.getenv("PROMPT_EMBED_CACHE_DIR")  # Disk spill tier is disabled when unset
+
+def _tensor_bytes(tensor: torch.Tensor) -> int:
+    return tensor.numel() * tensor.element_size()
+
+class PromptEmbeddingCache:
+    """
+    Content-addressed cache of Flux `encode_prompt` outputs.
+
+    Entries are (prompt_embeds, pooled_prompt_embeds) pairs for a single prompt, kept on CPU and keyed
+    by a hash of the prompt, the model variant and the T5 sequence length. The in-memory tier is an LRU
+    bounded by tensor bytes; entries evicted from it are spilled to `disk_dir` when one is configured
+    and promoted back to memory on their next hit. Victims are picked under the lock and written
+    after it is released, so lookups never wait on disk writes. The disk tier may be shared by
+    several processes.
+    """
+
+    def __init__(self, max_bytes: int = PROMPT_EMBED_CACHE_MAX_BYTES, disk_dir: str = PROMPT_EMBED_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(prompt: str, model_variant: str, max_sequence_length: int) -> str:
+        """Builds the content address for a prompt under a given model variant and sequence length."""
+        payload = f"{model_variant}\0{max_sequence_length}\0{prompt}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.pt")
+
+    def _load_from_disk(self, key: str):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            return torch.load(path, map_location="cpu", weights_only=True)
+        except FileNotFoundError:
+            # Never spilled, or removed by another process since
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable prompt embedding cache file '{path}': {e}")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+
+    def _spill_to_disk(self, victims: list) -> None:
+        """Writes evicted entries to the disk tier; called without the lock held."""
+        if not self.disk_dir:
+            return
+        for key, value in victims:
+            path = self._disk_path(key)
+            if os.path.exists(path):
+                continue
+            # Write to a temporary file first so a concurrent reader never loads a partial file
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                torch.save(value, tmp_path)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Failed to spill prompt embedding cache entry '{key}' to disk: {e}")
+                try:
+                    os.remove(tmp_path)
+                except FileNotFoundError:
+                    pass
+
+    def _insert(self, key: str, value: tuple) -> list:
+        """Adds an entry to the memory tier; returns the (key, value) pairs to spill to disk."""
+        size = sum(_tensor_bytes(t) for t in value)
+        if size > self.max_bytes:
+            return [(key, value)]
+        if key in self._entries:
+            return []
+        self._entries[key] = value
+        self._bytes += size
+        victims = []
+        while self._bytes > self.max_bytes:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self._bytes -= sum(_tensor_bytes(t) for t in evicted)
+            victims.append((evicted_key, evicted))
+        return victims
+
+    def get(self, key: str):
+        """
+        Looks up an entry in memory, then on disk.
+
+        :param key: A key built with `make_key`.
+        :return: The cached (prompt_embeds, pooled_prompt_embeds) pair, or None on a miss.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+        value = self._load_from_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            victims = self._insert(key, value)
+        self._spill_to_disk(victims)
+        return value
+
+    def put(self, key: str, prompt_embeds: torch.Tensor, pooled_prompt_embeds: torch.Tensor) -> None:
+        """Stores a CPU copy of the embeddings for one prompt."""
+        value = (prompt_embeds.detach().to("cpu"), pooled_prompt_embeds.detach().to("cpu"))
+        with self._lock:
+            victims = self._insert(key, value)
+        self._spill_to_disk(victims)
+
+    def record_encode_time(self, seconds: float) -> None:
+        """Accumulates time spent in the text encoders on cache misses."""
+        with self._lock:
+            self.encode_seconds += seconds
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and an estimate of the text-encoder time saved by hits."""
+        with self._lock:
+            average_encode_seconds = self.encode_seconds / self.misses if self.misses else 0.0
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "encode_seconds": self.encode_seconds,
+                "estimated_seconds_saved": self.hits * average_encode_seconds,
+            }
+
+    def encode(self, pipe, prompts: list, model_variant: str, max_sequence_length: int) -> tuple:
+        """
+        Returns batched embeddings for `prompts`, running the text encoders only for uncached prompts.
+
+        :param pipe: The Flux pipeline whose `encode_prompt` produces the embeddings.
+        :param prompts: The prompts to encode, one embedding row per prompt.
+        :param model_variant: The model variant the embeddings belong to (e.g. FLUX_VERSION).
+        :param max_sequence_length: The T5 sequence length the embeddings were produced with.
+        :return: A tuple of (prompt_embeds, pooled_prompt_embeds) with batch size len(prompts).
+        """
+        keys = [self.make_key(prompt, model_variant, max_sequence_length) for prompt in prompts]
+        found = {key: self.get(key) for key in dict.fromkeys(keys)}
+        missing = [key for key, value in found.items() if value is None]
+
+        if missing:
+            missing_prompts = [prompts[keys.index(key)] for key in missing]
+            start = time.perf_counter()
+            with torch.no_grad():
+                prompt_embeds, pooled_prompt_embeds, _ = pipe.encode_prompt(
+                    prompt=missing_prompts,
+                    prompt_2=None,
+                    max_sequence_length=max_sequence_length,
+                )
+            self.record_encode_time(time.perf_counter() - start)
+            for i, key in enumerate(missing):
+                self.put(key, prompt_embeds[i:i + 1], pooled_prompt_embeds[i:i + 1])
+                found[key] = (prompt_embeds[i:i + 1].detach().to("cpu"), pooled_prompt_embeds[i:i + 1].detach().to("cpu"))
+
+        stats = self.stats()
+        logger.info(f"Prompt embedding cache: {stats['hits']} hits, {stats['misses']} misses, ~{stats['estimated_seconds_saved']:.1f}s of text encoding saved")
+        return (
+            torch.cat([found[key][0] for key in keys]),
+            torch.cat([found[key][1] for key in keys]),
+        )
@@ -1,11 +1,13 @@
-import os
 import torch
-from diffusers import FluxTransformer2DModel, FluxPipeline
+from diffusers import FluxTransformer2DModel, FluxPipeline, FluxImg2ImgPipeline
 from transformers import T5EncoderModel
 from optimum.quanto import freeze, qfloat8, quantize
 from PIL import Image as PIL
 import logging
 import random
+from app.inference.image.flux.embedding_cache import PromptEmbeddingCache
+from app.inference.image.flux.preview import latents_to_previews
+from app.inference.image.flux.config import FLUX_VERSION, MAX_SEQUENCE_LENGTH, NUM_INFERENCE_STEPS, GUIDANCE_SCALE, MAX_SEED
 
 class FluxPipelineManager:
     _instance = None
@@ -16,8 +18,11 @@ class FluxPipelineManager:
             cls._instance.logger = logging.getLogger()
             cls._instance.logger.setLevel(logging.INFO)
             cls._instance.pipe = None
+            cls._instance.img2img_pipe = None
             cls._instance.transformer = None
             cls._instance.text_encoder_2 = None
+            cls._instance.flux_version = FLUX_VERSION
+            cls._instance.embedding_cache = PromptEmbeddingCache()
             cls._instance._initialize_pipeline()  # Initialize the pipeline only once when instance is created
         return cls._instance
 
@@ -27,9 +32,8 @@ class FluxPipelineManager:
 
     def _initialize_pipeline(self):
         """Internal method to initialize the pipeline once."""
-        flux_version = os.getenv("FLUX_VERSION", "default_version")
-        self.logger.info(f"FLUX_VERSION environment variable is set to: {flux_version}")
-        if flux_version == "schnell":
+        self.logger.info(f"FLUX_VERSION environment variable is set to: {self.flux_version}")
+        if self.flux_version == "schnell":
             self._initialize_schnell_pipeline()
         else:
             self._initialize_default_pipeline()
@@ -91,15 +95,102 @@ class FluxPipelineManager:
 
     def generate_image(self, prompt: str, initial_width: int, initial_height: int) -> PIL:
         """Generates an image using the pre-loaded pipeline."""
-        self.logger.info(f"Generating image with prompt: '{prompt}' and dimensions: '{initial_width}x{initial_height}'")
-        image = self.pipe(
-            prompt=prompt,
-            guidance_scale=100,
+        return self.generate_images([prompt], initial_width, initial_height)[0]
+
+    def _progress_callback(self, progress, initial_width: int, initial_height: int):
+        """Builds a step-end callback that reports progress and, every few steps, latent previews."""
+        def callback(pipe, step_index, timestep, callback_kwargs):
+            step = step_index + 1
+            previews = None
+            if progress.wants_preview(step, pipe.num_timesteps):
+                latents = pipe._unpack_latents(callback_kwargs["latents"], initial_height, initial_width, pipe.vae_scale_factor)
+                latents = latents / pipe.vae.config.scaling_factor + pipe.vae.config.shift_factor
+                previews = latents_to_previews(latents)
+            progress.step(step, pipe.num_timesteps, previews)
+            return callback_kwargs
+        return callback
+
+    def _generators(self, seeds: list) -> list:
+        return [torch.Generator("cpu").manual_seed(seed if seed is not None else random.randint(1, MAX_SEED)) for seed in seeds]
+
+    def _encode(self, prompts: list, num_images_per_prompt: int = 1) -> dict:
+        prompt_embeds, pooled_prompt_embeds = self.embedding_cache.encode(
+            self.pipe, list(prompts), self.flux_version, MAX_SEQUENCE_LENGTH
+        )
+        if num_images_per_prompt > 1:
+            # The pipeline does not repeat precomputed embeddings, so each prompt's are repeated
+            # here, prompt by prompt, like the pipeline does for embeddings it encodes itself
+            prompt_embeds = prompt_embeds.repeat_interleave(num_images_per_prompt, dim=0)
+            pooled_prompt_embeds = pooled_prompt_embeds.repeat_interleave(num_images_per_prompt, dim=0)
+        device = self.pipe._execution_device
+        return {"prompt_embeds": prompt_embeds.to(device), "pooled_prompt_embeds": pooled_prompt_embeds.to(device)}
+
+    def generate_images(self, prompts: list, initial_width: int, initial_height: int, progress=None, seeds: list = None,
+                        num_inference_steps: int = NUM_INFERENCE_STEPS, num_images_per_prompt: int = 1) -> list:
+        """
+        Generates `num_images_per_prompt` images per prompt in a single batched pipeline call, each with its own seed.
+
+        Images are returned prompt by prompt, and `seeds` has one seed per image in the same order.
+        Seeds are drawn at random for images without one in `seeds`, so identical prompt/seed pairs reproduce the same image.
+
+        Prompt embeddings come from the embedding cache, so the text encoders only run for unseen prompts.
+        When a `ProgressReporter` is given, progress and latent previews are published after each step.
+        """
+        count = len(prompts) * num_images_per_prompt
+        self.logger.info(f"Generating {count} image(s) with dimensions: '{initial_width}x{initial_height}' in {num_inference_steps} steps")
+        images = self.pipe(
+            **self._encode(prompts, num_images_per_prompt),
+            guidance_scale=GUIDANCE_SCALE,
+            height=initial_height,
+            max_sequence_length=MAX_SEQUENCE_LENGTH,
+            width=initial_width,
+            num_inference_steps=num_inference_steps,
+            generator=self._generators(seeds or [None] * count),
+            callback_on_step_end=self._progress_callback(progress, initial_width, initial_height) if progress else None,
+        ).images
+        self.logger.info(f"{len(images)} image(s) generated successfully.")
+        return images
+
+    def refine_images(self, prompts: list, images: list, initial_width: int, initial_height: int, strength: float,
+                      progress=None, seeds: list = None, num_inference_steps: int = NUM_INFERENCE_STEPS) -> list:
+        """
+        Refines draft images at full resolution with an img2img pass.
+
+        The drafts are resized to the target size and noised to `strength` of the schedule, so only
+        `strength * num_inference_steps` denoising steps run. The img2img pipeline shares every
+        component (and the CPU offload hooks) with the text-to-image pipeline.
+        """
+        if self.img2img_pipe is None:
+            self.img2img_pipe = FluxImg2ImgPipeline.from_pipe(self.pipe)
+            self.img2img_pipe.set_progress_bar_config(**getattr(self.pipe, "_progress_bar_config", {}))
+        self.logger.info(f"Refining {len(prompts)} image(s) to '{initial_width}x{initial_height}' at strength {strength}")
+        refined = self.img2img_pipe(
+            **self._encode(prompts),
+            image=[image.resize((initial_width, initial_height), PIL.LANCZOS) for image in images],
+            strength=strength,
+            guidance_scale=GUIDANCE_SCALE,
+            height=initial_height,
+            max_sequence_length=MAX_SEQUENCE_LENGTH,
+            width=initial_width,
+            num_inference_steps=num_inference_steps,
+            generator=self._generators(seeds or [None] * len(prompts)),
+            callback_on_step_end=self._progress_callback(progress, initial_width, initial_height) if progress else None,
+        ).images
+        self.logger.info(f"{len(refined)} image(s) refined successfully.")
+        return refined
+
+    def warm_up(self, initial_width: int, initial_height: int) -> None:
+        """
+        Runs a one-step generation at the given size, so kernel selection and allocator growth
+        for that resolution bucket happen before the first real request.
+        """
+        self.logger.info(f"Warming up pipeline for '{initial_width}x{initial_height}'")
+        self.pipe(
+            prompt="warm-up",
+            guidance_scale=GUIDANCE_SCALE,
             height=initial_height,
-            max_sequence_length=255,
+            max_sequence_length=MAX_SEQUENCE_LENGTH,
             width=initial_width,
-            num_inference_steps=16,
-            generator=torch.Generator("cpu").manual_seed(random.randint(1, 123456))
-        ).images[0]
-        self.logger.info("Image generated successfully.")
-        return image
+            num_inference_steps=1,
+            generator=torch.Generator("cpu").manual_seed(0),
+        )
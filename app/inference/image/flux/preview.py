@@ -0,0 +1,45 @@
+import torch
+from PIL import Image
+
+# Approximate linear map from the 16 Flux VAE latent channels to RGB. Good enough to show
+# composition and colour while denoising, at a tiny fraction of the cost of a VAE decode.
+FLUX_LATENT_RGB_FACTORS = [
+    [-0.0346, 0.0244, 0.0681],
+    [0.0034, 0.0210, 0.0687],
+    [0.0275, -0.0668, -0.0433],
+    [-0.0174, 0.0160, 0.0617],
+    [0.0859, 0.0721, 0.0329],
+    [0.0004, 0.0383, 0.0115],
+    [0.0405, 0.0861, 0.0915],
+    [-0.0236, -0.0185, -0.0259],
+    [-0.0245, 0.0250, 0.1180],
+    [0.1008, 0.0755, -0.0421],
+    [-0.0515, 0.0201, 0.0011],
+    [0.0428, -0.0012, -0.0036],
+    [0.0817, 0.0765, 0.0749],
+    [-0.1264, -0.0522, -0.1103],
+    [-0.0280, -0.0881, -0.0499],
+    [-0.1262, -0.0982, -0.0778],
+]
+FLUX_LATENT_RGB_BIAS = [-0.0329, -0.0718, -0.0851]
+
+def latents_to_previews(latents: torch.Tensor) -> list:
+    """
+    Projects unpacked Flux latents to small RGB previews.
+
+    :param latents: Latents of shape (batch, channels, height / 8, width / 8).
+    :return: One PIL image per batch element, at 1/8 of the output resolution.
+    """
+    latents = latents.detach().float().cpu()
+    channels = latents.shape[1]
+    if channels == len(FLUX_LATENT_RGB_FACTORS):
+        factors = torch.tensor(FLUX_LATENT_RGB_FACTORS)
+        bias = torch.tensor(FLUX_LATENT_RGB_BIAS)
+    else:
+        # Unknown latent layout (e.g. a reduced test model): show the first channels as grey
+        factors = torch.zeros(channels, 3)
+        factors[0] = 1.0
+        bias = torch.zeros(3)
+    rgb = torch.einsum("bchw,cr->bhwr", latents, factors) + bias
+    rgb = ((rgb + 1) / 2).clamp(0, 1).mul(255).byte().numpy()
+    return [Image.fromarray(frame) for frame in rgb]
@@ -1,17 +1,19 @@
 from PIL import Image
 import logging
 from app.inference.image.realesrgan.model import load_realesrgan_model
+from app.inference.image.realesrgan.tiling import TiledUpscaler
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
 pipe = load_realesrgan_model(scale_factor=4)
+upscaler = TiledUpscaler(pipe.model, pipe.scale, pipe.device)
 
 def upscale_and_resize_image(image: Image.Image, scale_factor: int) -> Image.Image:
     """
-    Upscales the image using Real-ESRGAN.
+    Upscales the image using Real-ESRGAN, tile by tile to bound peak memory.
     """
     logger.info(f"Upscaling image with scale factor {scale_factor}...")
-    image = pipe.predict(image)
+    image = upscaler.upscale(image)
     logger.info("Image upscaled.")
     return image
@@ -0,0 +1,135 @@
+import os
+import math
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
+from PIL import Image
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Tiling configuration
+TILE_SIZE = int(os.getenv("REALESRGAN_TILE_SIZE", 256))
+TILE_OVERLAP = int(os.getenv("REALESRGAN_TILE_OVERLAP", 16))
+TILE_BATCH_SIZE = int(os.getenv("REALESRGAN_TILE_BATCH_SIZE", 4))
+CPU_WORKERS = int(os.getenv("REALESRGAN_CPU_WORKERS", min(4, os.cpu_count() or 1)))
+
+def set_cpu_threads(workers: int = None) -> None:
+    """
+    Gives each of `workers` tiling threads its share of the cores. torch's thread count is
+    process-wide, so this is only called by processes that do nothing but upscale on CPU (see
+    `app.workers.pool`), never on import or when an upscaler is built.
+    """
+    workers = CPU_WORKERS if workers is None else workers
+    if workers > 1 and not torch.cuda.is_available():
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        torch.set_num_threads(threads)
+        logger.info(f"Tiled upscaling on CPU with {workers} workers x {threads} torch threads")
+
+class TiledUpscaler:
+    """
+    Runs a super-resolution network over overlapping tiles instead of the whole frame.
+
+    The input is reflect-padded so every tile has the same shape (`tile_size` plus `overlap` of
+    context on each side), which lets tiles be stacked into batches of `batch_size`. Only the
+    upscaled core of each tile is kept; the `overlap` context is what the network needs to avoid
+    edge artifacts, and half of it is cross-faded with the neighbouring tiles to blend the seams.
+
+    Peak memory is bounded by the uint8 output frame plus `batch_size` tiles of activations per
+    in-flight batch, independent of the input resolution. On CPU, batches are spread over a thread
+    pool of `workers` threads; `set_cpu_threads` gives each its share of the cores.
+    """
+
+    def __init__(self, model: torch.nn.Module, scale: int, device: torch.device,
+                 tile_size: int = TILE_SIZE, overlap: int = TILE_OVERLAP,
+                 batch_size: int = TILE_BATCH_SIZE, workers: int = None):
+        self.model = model
+        self.scale = scale
+        self.device = torch.device(device)
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.blend = overlap // 2
+        self.batch_size = max(1, batch_size)
+        if workers is None:
+            workers = CPU_WORKERS if self.device.type == "cpu" else 1
+        self.workers = max(1, workers)
+
+    def _tile_origins(self, height: int, width: int) -> list:
+        rows = math.ceil(height / self.tile_size)
+        cols = math.ceil(width / self.tile_size)
+        return [(r * self.tile_size, c * self.tile_size) for r in range(rows) for c in range(cols)]
+
+    def _run_batch(self, batch: np.ndarray) -> np.ndarray:
+        tensor = torch.from_numpy(batch).permute(0, 3, 1, 2).to(self.device, dtype=torch.float32).div_(255)
+        with torch.no_grad():
+            if self.device.type == "cuda":
+                with torch.autocast("cuda", dtype=torch.float16):
+                    output = self.model(tensor)
+            else:
+                output = self.model(tensor)
+        return output.float().clamp_(0, 1).permute(0, 2, 3, 1).cpu().numpy()
+
+    def _ramp(self, length: int) -> np.ndarray:
+        # Weight of the incoming tile across a blend band, rising from 0 to 1
+        return (np.arange(length, dtype=np.float32) + 0.5) / length
+
+    def _paste(self, output: np.ndarray, tile: np.ndarray, y: int, x: int) -> None:
+        """Writes the upscaled core of a tile, cross-fading into the tiles above and to the left."""
+        s, o, b = self.scale, self.overlap, self.blend
+        out_h, out_w = output.shape[:2]
+        blend_top = b if y > 0 else 0
+        blend_left = b if x > 0 else 0
+
+        top, left = (y - blend_top) * s, (x - blend_left) * s
+        bottom, right = min((y + self.tile_size) * s, out_h), min((x + self.tile_size) * s, out_w)
+        src_top, src_left = (o - blend_top) * s, (o - blend_left) * s
+        region = tile[src_top:src_top + bottom - top, src_left:src_left + right - left] * 255
+
+        weight_y = np.ones(bottom - top, dtype=np.float32)
+        weight_y[:blend_top * s] = self._ramp(blend_top * s)
+        weight_x = np.ones(right - left, dtype=np.float32)
+        weight_x[:blend_left * s] = self._ramp(blend_left * s)
+        weight = (weight_y[:, None] * weight_x[None, :])[..., None]
+
+        existing = output[top:bottom, left:right].astype(np.float32)
+        output[top:bottom, left:right] = np.rint(region * weight + existing * (1 - weight)).astype(np.uint8)
+
+    def upscale(self, image: Image.Image) -> Image.Image:
+        """
+        Upscales an image tile by tile.
+
+        :param image: The PIL image to upscale.
+        :return: The upscaled PIL image, `scale` times larger on each side.
+        """
+        pixels = np.asarray(image.convert("RGB"))
+        height, width = pixels.shape[:2]
+        o, t = self.overlap, self.tile_size
+        pad_bottom = math.ceil(height / t) * t - height
+        pad_right = math.ceil(width / t) * t - width
+        padded = np.pad(pixels, ((o, o + pad_bottom), (o, o + pad_right), (0, 0)), mode="reflect")
+
+        origins = self._tile_origins(height, width)
+        batches = [origins[i:i + self.batch_size] for i in range(0, len(origins), self.batch_size)]
+        logger.info(f"Upscaling {width}x{height} in {len(origins)} tiles of {t}px, {len(batches)} batches")
+
+        def tiles_for(batch_origins):
+            return np.stack([padded[y:y + t + 2 * o, x:x + t + 2 * o] for y, x in batch_origins])
+
+        output = np.zeros((height * self.scale, width * self.scale, 3), dtype=np.uint8)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # At most `workers` batches are in flight, and results are pasted in submission (raster)
+            # order, so every blend band overlaps a neighbour that has already been written
+            pending = deque()
+            for batch_origins in batches:
+                pending.append((batch_origins, executor.submit(self._run_batch, tiles_for(batch_origins))))
+                if len(pending) >= self.workers:
+                    self._paste_batch(output, *pending.popleft())
+            while pending:
+                self._paste_batch(output, *pending.popleft())
+        return Image.fromarray(output)
+
+    def _paste_batch(self, output: np.ndarray, batch_origins: list, future) -> None:
+        for (y, x), tile in zip(batch_origins, future.result()):
+            self._paste(output, tile, y, x)
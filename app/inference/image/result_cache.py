@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from app.db.redis_config import redis_client
+from app.inference.image.storage import get_storage
+from app.inference.image.writer import image_key, files_key, durable_key
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 20 * 1024 * 1024 * 1024))
+PENDING_TTL_SECONDS = 3600  # Entries whose original is never written are forgotten after this
+
+class ResultCache:
+    """
+    Content-addressed cache of finished generations, stored in Redis.
+
+    Keys hash every input that determines the output image (model variant, prompt, aspect ratio,
+    seed, steps and guidance), so a hit can be served without running the pipeline. Each entry is
+    charged the stored size of its image files, recorded once they have been written, and the
+    least recently used entries are evicted once the total passes RESULT_CACHE_MAX_BYTES.
+    Eviction only forgets entries: the files belong to users' galleries and are left in place.
+    Entries whose original file has disappeared from storage are dropped on lookup.
+
+    An entry only becomes visible once its original file is durable: `put` holds it back until
+    the image writer reports the write (see `commit`), so a lookup never races the write and an
+    entry never points at a file whose write failed.
+    """
+
+    def __init__(self, client=redis_client, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.redis_client = client
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def make_key(model_variant: str, prompt: str, aspect_ratio: str, seed: int, steps: int, guidance: float,
+                 extra: dict = None) -> str:
+        """Builds the content address of a generation from its inputs, plus any mode-specific `extra` inputs."""
+        inputs = [model_variant, prompt, aspect_ratio, seed, steps, guidance]
+        if extra:
+            inputs.append(extra)
+        payload = json.dumps(inputs, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_key(self, key: str) -> str:
+        return f"result_cache:entry:{key}"
+
+    def _image_key(self, image_id: str) -> str:
+        return f"result_cache:image:{image_id}"
+
+    def _pending_key(self, image_id: str) -> str:
+        return f"result_cache:pending:{image_id}"
+
+    _lru_key = "result_cache:lru"
+    _bytes_key = "result_cache:bytes"
+
+    def get(self, key: str):
+        """
+        Looks up a finished generation.
+
+        :param key: A key built with `make_key`.
+        :return: The stored task result, or None on a miss.
+        """
+        entry = self.redis_client.hgetall(self._entry_key(key))
+        if not entry:
+            return None
+        result = json.loads(entry[b"result"])
+        if not get_storage().exists(image_key(result["imageId"], "original")):
+            logger.info(f"Dropping result cache entry {key}: image {result['imageId']} is no longer stored")
+            self._remove(key, result["imageId"], int(entry.get(b"bytes", 0)))
+            return None
+        self.redis_client.zadd(self._lru_key, {key: time.time()})
+        return result
+
+    def put(self, key: str, result: dict) -> None:
+        """
+        Records a finished generation, as soon as its original file is durable: right away if
+        it already is, otherwise when the image writer calls `commit`. Its size is charged later
+        by `account_files`.
+        """
+        image_id = result["imageId"]
+        self.redis_client.set(self._pending_key(image_id), json.dumps({"key": key, "result": result}), ex=PENDING_TTL_SECONDS)
+        # Checked after holding the entry back, so a write completing in between is never missed
+        if self.redis_client.hexists(durable_key(image_id), "original"):
+            self.commit(image_id)
+
+    def commit(self, image_id: str) -> None:
+        """Makes the entry held back for an image visible; called once its original file is durable."""
+        pending = self.redis_client.getdel(self._pending_key(image_id))
+        if pending is None:
+            return
+        pending = json.loads(pending)
+        key = pending["key"]
+        pipe = self.redis_client.pipeline()
+        pipe.hset(self._entry_key(key), mapping={"result": json.dumps(pending["result"]), "bytes": 0})
+        pipe.set(self._image_key(image_id), key)
+        pipe.zadd(self._lru_key, {key: time.time()})
+        pipe.execute()
+
+    def account_files(self, image_id: str) -> None:
+        """
+        Charges a cached image's entry with the current size of its files, as recorded in the
+        image writer's file index, then evicts least recently used entries until the cache fits its budget.
+        """
+        key = self.redis_client.get(self._image_key(image_id))
+        if key is None:
+            return
+        key = key.decode()
+        size = sum(int(file_size) for file_size in self.redis_client.hvals(files_key(image_id)))
+        previous = int(self.redis_client.hget(self._entry_key(key), "bytes") or 0)
+        pipe = self.redis_client.pipeline()
+        pipe.hset(self._entry_key(key), "bytes", size)
+        pipe.incrby(self._bytes_key, size - previous)
+        pipe.execute()
+        self.evict()
+
+    def forget_image(self, image_id: str) -> None:
+        """Drops the entry of an image that is being deleted."""
+        self.redis_client.delete(self._pending_key(image_id))
+        key = self.redis_client.get(self._image_key(image_id))
+        if key is None:
+            return
+        key = key.decode()
+        self._remove(key, image_id, int(self.redis_client.hget(self._entry_key(key), "bytes") or 0))
+
+    def evict(self) -> int:
+        """
+        Evicts least recently used entries while the cache is over budget.
+
+        :return: The number of evicted entries.
+        """
+        evicted = 0
+        while int(self.redis_client.get(self._bytes_key) or 0) > self.max_bytes:
+            oldest = self.redis_client.zpopmin(self._lru_key)
+            if not oldest:
+                break
+            key = oldest[0][0].decode()
+            entry = self.redis_client.hgetall(self._entry_key(key))
+            if entry:
+                image_id = json.loads(entry[b"result"])["imageId"]
+                self._remove(key, image_id, int(entry.get(b"bytes", 0)))
+            evicted += 1
+        if evicted:
+            logger.info(f"Evicted {evicted} result cache entries")
+        return evicted
+
+    def _remove(self, key: str, image_id: str, size: int) -> None:
+        pipe = self.redis_client.pipeline()
+        pipe.delete(self._entry_key(key))
+        pipe.delete(self._image_key(image_id))
+        pipe.zrem(self._lru_key, key)
+        pipe.decrby(self._bytes_key, size)
+        pipe.execute()
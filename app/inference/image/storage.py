@@ -0,0 +1,225 @@
+import io
+import os
+import logging
+import mimetypes
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Storage configuration
+IMAGE_STORAGE = os.getenv("IMAGE_STORAGE", "local")  # 'local' or 's3'
+IMAGE_DIR = os.getenv("IMAGE_DIR", "frontend/images")
+IMAGE_BASE_URL = os.getenv("IMAGE_BASE_URL")  # e.g. a CDN in front of the store; defaults per backend
+IMAGE_SHARD_DEPTH = int(os.getenv("IMAGE_SHARD_DEPTH", 2))  # Directory levels of 2 ID characters each
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", 8))
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")  # For S3-compatible stores such as MinIO
+S3_REGION = os.getenv("S3_REGION")
+
+# The most keys a single S3 DeleteObjects request accepts
+S3_DELETE_BATCH = 1000
+
+def object_key(image_id: str, name: str) -> str:
+    """
+    Returns the storage key of an image file, sharded by the first characters of the image ID,
+    e.g. '3f/a2/original_3fa2....png', so no directory or key prefix grows without bound.
+    """
+    shards = [image_id[i * 2:i * 2 + 2] for i in range(IMAGE_SHARD_DEPTH)]
+    return "/".join([shard for shard in shards if shard] + [name])
+
+class StorageBackend:
+    """
+    Stores image files under keys such as '3f/a2/original_<id>.png'.
+
+    Backends implement single-key operations; bulk operations run them concurrently on a
+    thread pool shared by every backend of the process.
+    """
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    @classmethod
+    def _pool(cls) -> ThreadPoolExecutor:
+        # Created on first use so the pool is never inherited across a fork
+        with cls._executor_lock:
+            if StorageBackend._executor is None:
+                StorageBackend._executor = ThreadPoolExecutor(max_workers=STORAGE_WORKERS, thread_name_prefix="storage")
+            return StorageBackend._executor
+
+    def put(self, key: str, data: bytes) -> int:
+        """
+        Stores a file, replacing any previous content atomically.
+
+        :return: The size of the stored file in bytes.
+        """
+        raise NotImplementedError
+
+    def open(self, key: str):
+        """Returns a binary file object with the content of a file."""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def url(self, key: str) -> str:
+        """Returns the URL clients fetch a file from."""
+        raise NotImplementedError
+
+    def _delete(self, key: str):
+        """Deletes a file and returns its size, or None if it did not exist."""
+        raise NotImplementedError
+
+    def put_many(self, files: dict) -> dict:
+        """
+        Stores many files concurrently.
+
+        :param files: The content of each file by key.
+        :return: The size of each stored file by key.
+        """
+        keys = list(files)
+        return dict(zip(keys, self._pool().map(lambda key: self.put(key, files[key]), keys)))
+
+    def delete_many(self, keys: list) -> dict:
+        """
+        Deletes many files concurrently. Missing files are skipped.
+
+        :return: The size of each deleted file by key.
+        """
+        keys = list(dict.fromkeys(keys))
+        return {key: size for key, size in zip(keys, self._pool().map(self._delete, keys)) if size is not None}
+
+class LocalStorage(StorageBackend):
+    """Stores files in a directory tree, served under `base_url` (by default the API's '/images' mount)."""
+
+    def __init__(self, root: str = IMAGE_DIR, base_url: str = IMAGE_BASE_URL):
+        self.root = root
+        self.base_url = (base_url or "/images").rstrip("/")
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def put(self, key: str, data: bytes) -> int:
+        # Written to a temporary file next to the target and renamed into place, so a reader
+        # never sees a partially written file
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        return len(data)
+
+    def open(self, key: str):
+        return open(self.path(key), "rb")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+    def _delete(self, key: str):
+        path = self.path(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Failed to delete '{path}': {e}")
+            return None
+
+class S3Storage(StorageBackend):
+    """
+    Stores files in an S3 bucket, or any S3-compatible store through S3_ENDPOINT_URL.
+
+    Files are served by the store itself (or a CDN in front of it, through IMAGE_BASE_URL),
+    never through the API. boto3 is only needed when this backend is used.
+    """
+
+    def __init__(self, bucket: str = S3_BUCKET, client=None, base_url: str = IMAGE_BASE_URL):
+        if not bucket:
+            raise ValueError("S3_BUCKET environment variable is not set.")
+        if client is None:
+            import boto3
+            client = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL, region_name=S3_REGION)
+        self.client = client
+        self.bucket = bucket
+        if base_url is None:
+            base_url = f"{S3_ENDPOINT_URL.rstrip('/')}/{bucket}" if S3_ENDPOINT_URL else f"https://{bucket}.s3.amazonaws.com"
+        self.base_url = base_url.rstrip("/")
+
+    def put(self, key: str, data: bytes) -> int:
+        content_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=content_type)
+        return len(data)
+
+    def open(self, key: str):
+        return io.BytesIO(self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read())
+
+    def _size(self, key: str):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+        except self.client.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None
+            raise
+
+    def exists(self, key: str) -> bool:
+        return self._size(key) is not None
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+    def _delete(self, key: str):
+        size = self._size(key)
+        if size is not None:
+            self.client.delete_object(Bucket=self.bucket, Key=key)
+        return size
+
+    def delete_many(self, keys: list) -> dict:
+        # Sizes are looked up concurrently, then the files are deleted with one request per
+        # S3_DELETE_BATCH keys instead of one per file
+        keys = list(dict.fromkeys(keys))
+        sizes = {key: size for key, size in zip(keys, self._pool().map(self._size, keys)) if size is not None}
+        existing = list(sizes)
+        for start in range(0, len(existing), S3_DELETE_BATCH):
+            batch = existing[start:start + S3_DELETE_BATCH]
+            response = self.client.delete_objects(
+                Bucket=self.bucket, Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+            )
+            for error in response.get("Errors", []):
+                logger.warning(f"Failed to delete '{error['Key']}': {error.get('Message')}")
+                sizes.pop(error["Key"], None)
+        return sizes
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_storage() -> StorageBackend:
+    """
+    Returns the process's storage backend, configured by IMAGE_STORAGE.
+
+    :raises ValueError: If IMAGE_STORAGE names an unknown backend.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if IMAGE_STORAGE == "local":
+                _backend = LocalStorage()
+            elif IMAGE_STORAGE == "s3":
+                _backend = S3Storage()
+            else:
+                raise ValueError(f"Unknown image storage backend '{IMAGE_STORAGE}'.")
+            logger.info(f"Using '{IMAGE_STORAGE}' image storage")
+        return _backend
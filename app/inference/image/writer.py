@@ -0,0 +1,232 @@
+import io
+import os
+import time
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from PIL import Image
+from app.db.redis_config import redis_client
+from app.inference.image.storage import get_storage, object_key
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Writer configuration
+IMAGE_WRITER_POOL = os.getenv("IMAGE_WRITER_POOL", "thread")  # 'thread' or 'process'
+IMAGE_WRITER_WORKERS = int(os.getenv("IMAGE_WRITER_WORKERS", 2))
+IMAGE_WRITER_MAX_PENDING = int(os.getenv("IMAGE_WRITER_MAX_PENDING", 8))
+
+# Encoders by format name. 'level' is the compression effort: PNG compress_level (0-9),
+# lossless WebP method (0-6) and AVIF quality (0-100).
+ENCODERS = {
+    "png": {"format": "PNG", "extension": ".png", "media_type": "image/png", "default_level": 6,
+            "options": lambda level: {"compress_level": level}},
+    "webp": {"format": "WEBP", "extension": ".webp", "media_type": "image/webp", "default_level": 4,
+             "options": lambda level: {"lossless": True, "method": level}},
+    "avif": {"format": "AVIF", "extension": ".avif", "media_type": "image/avif", "default_level": 90,
+             "options": lambda level: {"quality": level}},
+}
+
+# Output format and compression level per variant
+OUTPUT_FORMATS = {
+    "original": (os.getenv("IMAGE_FORMAT_ORIGINAL", "png"), os.getenv("IMAGE_LEVEL_ORIGINAL")),
+    "upscaled": (os.getenv("IMAGE_FORMAT_UPSCALED", "png"), os.getenv("IMAGE_LEVEL_UPSCALED")),
+}
+
+# Formats also stored next to every image, in order of preference, so the image server can send
+# them to clients that accept them. Each is written at its default level.
+IMAGE_ALTERNATE_FORMATS = [name.strip().lower() for name in os.getenv("IMAGE_ALTERNATE_FORMATS", "webp").split(",") if name.strip()]
+
+# File name prefix per variant
+PREFIXES = {
+    "original": "original_",
+    "upscaled": "",
+}
+
+def encoder_available(name: str) -> bool:
+    Image.init()
+    return ENCODERS[name]["format"] in Image.SAVE
+
+def get_output_format(variant: str) -> tuple:
+    """
+    Resolves the encoder and compression level for an output variant, falling back to PNG
+    when the configured format is unknown or not supported by this Pillow build.
+
+    :param variant: The output variant ('original' or 'upscaled').
+    :return: A tuple of (encoder name, compression level).
+    """
+    name, level = OUTPUT_FORMATS[variant]
+    name = name.lower()
+    if name not in ENCODERS or not encoder_available(name):
+        logger.warning(f"Image format '{name}' is not available for '{variant}' images. Defaulting to 'png'.")
+        name, level = "png", None
+    return name, int(level) if level is not None else ENCODERS[name]["default_level"]
+
+def get_alternate_formats() -> list:
+    """Returns the alternate formats supported by this Pillow build, in order of preference."""
+    return [name for name in IMAGE_ALTERNATE_FORMATS if name in ENCODERS and encoder_available(name)]
+
+def alternate_key(key: str, name: str) -> str:
+    """Returns the storage key of a file's alternate in format `name`, e.g. '3f/a2/original_<id>.webp'."""
+    return os.path.splitext(key)[0] + ENCODERS[name]["extension"]
+
+def image_filename(image_id: str, variant: str) -> str:
+    """Returns the file name of an image variant, e.g. 'original_<id>.png'."""
+    name, _ = get_output_format(variant)
+    return f"{PREFIXES[variant]}{image_id}{ENCODERS[name]['extension']}"
+
+def image_key(image_id: str, variant: str) -> str:
+    """Returns the storage key an image variant is written to."""
+    return object_key(image_id, image_filename(image_id, variant))
+
+def image_url(image_id: str, variant: str) -> str:
+    """Returns the URL an image variant is served from."""
+    return get_storage().url(image_key(image_id, variant))
+
+def open_image(image_id: str, variant: str) -> Image.Image:
+    """Reads an image variant back from storage."""
+    with get_storage().open(image_key(image_id, variant)) as f:
+        image = Image.open(f)
+        image.load()
+    return image
+
+# File index: the files of every image with their sizes, when each image was first written
+# and the total size of indexed files. Lets the retention collector find and delete an image's
+# files without listing the storage backend.
+WRITTEN_KEY = "images:written"
+BYTES_KEY = "images:bytes"
+
+def durable_key(image_id: str) -> str:
+    return f"image:{image_id}:durable"
+
+def files_key(image_id: str) -> str:
+    """Returns the Redis hash listing an image's files (storage keys) with their sizes."""
+    return f"image:{image_id}:files"
+
+def get_durable_urls(image_id: str) -> dict:
+    """Returns the URLs of the variants of an image that have been fully written, by variant."""
+    return {variant.decode(): url.decode() for variant, url in redis_client.hgetall(durable_key(image_id)).items()}
+
+def get_durable_urls_many(image_ids: list) -> dict:
+    """Like `get_durable_urls` for many images in one round trip; returns the URLs by image ID."""
+    pipe = redis_client.pipeline()
+    for image_id in image_ids:
+        pipe.hgetall(durable_key(image_id))
+    return {
+        image_id: {variant.decode(): url.decode() for variant, url in urls.items()}
+        for image_id, urls in zip(image_ids, pipe.execute())
+    }
+
+def store_image(image: Image.Image, key: str, image_format: str, options: dict) -> int:
+    """
+    Encodes an image and stores it under `key` in the storage backend.
+
+    :return: The size of the stored file in bytes.
+    """
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return get_storage().put(key, buffer.getvalue())
+
+class ImageWriter:
+    """
+    Encodes and stores images off the inference thread.
+
+    Images are handed to a bounded thread (or process) pool; `submit` only blocks when
+    IMAGE_WRITER_MAX_PENDING writes are already queued, which bounds the decoded frames held in
+    memory. When a write completes, the variant's URL is recorded as durable in Redis.
+
+    Alternate formats are encoded by separate jobs queued behind the primary one, so they never
+    delay the moment an image becomes durable.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ImageWriter, cls).__new__(cls)
+            cls._instance._executor = None
+            cls._instance._slots = threading.BoundedSemaphore(IMAGE_WRITER_MAX_PENDING)
+            cls._instance._lock = threading.Lock()
+        return cls._instance
+
+    def _get_executor(self):
+        # Created on first use so pools are never inherited across a fork
+        with self._lock:
+            if self._executor is None:
+                pool = ProcessPoolExecutor if IMAGE_WRITER_POOL == "process" else ThreadPoolExecutor
+                self._executor = pool(max_workers=IMAGE_WRITER_WORKERS)
+                logger.info(f"Image writer started with {IMAGE_WRITER_WORKERS} {IMAGE_WRITER_POOL} workers")
+            return self._executor
+
+    def submit(self, image: Image.Image, image_id: str, variant: str, on_done=None, on_failed=None):
+        """
+        Queues an image variant for encoding and returns immediately.
+
+        :param image: The PIL Image to save.
+        :param image_id: Unique identifier for the image.
+        :param variant: The output variant ('original' or 'upscaled').
+        :param on_done: Optional callback, called with the image ID once the file is durable.
+        :param on_failed: Optional callback, called with the image ID and the exception if the write fails.
+        :return: A Future resolving to the size of the written file in bytes.
+        """
+        name, level = get_output_format(variant)
+        key = image_key(image_id, variant)
+        future = self._queue(image, image_id, key, name, level)
+
+        def _durable(f):
+            if f.exception() is not None:
+                if on_failed is not None:
+                    try:
+                        on_failed(image_id, f.exception())
+                    except Exception as e:
+                        logger.error(f"Image write failure callback failed for '{key}': {e}")
+                return
+            redis_client.hset(durable_key(image_id), variant, image_url(image_id, variant))
+            if on_done is not None:
+                try:
+                    on_done(image_id)
+                except Exception as e:
+                    logger.error(f"Image write callback failed for '{key}': {e}")
+
+        future.add_done_callback(_durable)
+        for alternate in get_alternate_formats():
+            if alternate != name:
+                self._queue(image, image_id, alternate_key(key, alternate), alternate, ENCODERS[alternate]["default_level"])
+        return future
+
+    def _queue(self, image: Image.Image, image_id: str, key: str, name: str, level: int):
+        """Queues one encoding of an image; once written, the file is added to the image's file index."""
+        encoder = ENCODERS[name]
+        self._slots.acquire()
+        try:
+            future = self._get_executor().submit(store_image, image, key, encoder["format"], encoder["options"](level))
+        except Exception:
+            self._slots.release()
+            raise
+        logger.info(f"Queued '{key}' for writing as {name} (level {level})")
+
+        def _completed(f):
+            self._slots.release()
+            if f.exception() is not None:
+                logger.error(f"Failed to write image '{key}': {f.exception()}")
+                return
+            size = f.result()
+            previous = redis_client.hget(files_key(image_id), key)
+            pipe = redis_client.pipeline()
+            pipe.hset(files_key(image_id), key, size)
+            pipe.zadd(WRITTEN_KEY, {image_id: time.time()}, nx=True)
+            pipe.incrby(BYTES_KEY, size - int(previous or 0))
+            pipe.execute()
+            logger.info(f"Image saved to '{key}' ({size} bytes).")
+
+        future.add_done_callback(_completed)
+        return future
+
+    def close(self):
+        """Waits for queued writes to finish."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+atexit.register(lambda: ImageWriter._instance and ImageWriter._instance.close())
@@ -1,4 +1,4 @@
-from app.inference.language.llama.model import LlamaModel
+from app.inference.registry import get_model
 import logging
 import redis
 from sqlalchemy.orm import Session
@@ -48,8 +48,7 @@ def generate_chat(user_uuid: str, user_prompt: str):
     """
     prompt = _generate_chat_prompt(user_uuid, user_prompt)
     # Usage:
-    llm_model = LlamaModel()
-    llm_model.load_llama_model()
+    llm_model = get_model("llama")
     answer = llm_model.generate_streaming_response(prompt=prompt, conversation_id=user_uuid)
     for chunk in answer:
         # Yield each chunk of the response.
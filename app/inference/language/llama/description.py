@@ -1,4 +1,4 @@
-from app.inference.language.llama.model import LlamaModel
+from app.inference.registry import get_model
 import logging
 
 # Set up logging configuration
@@ -40,8 +40,7 @@ def generate_description(user_prompt: str):
     :return: A string containing the generated product description.
     """
     prompt = _generate_description_prompt(user_prompt)
-    llm_model = LlamaModel()
-    llm_model.load_llama_model()    
+    llm_model = get_model("llama")
     answer = llm_model.generate_non_streaming_response(prompt)
     description = answer
     logger.info(f"Generated description: {description}")
@@ -1,4 +1,3 @@
-from llama_cpp import Llama
 import logging
 from app.utils.conversational_memory import ConversationalMemory
 
@@ -30,6 +29,8 @@ class LlamaModel:
         Loads and initializes a pre-trained LLaMA model with the specified configuration.
         """
         if self.llm is None:  # Check if model is already loaded
+            from llama_cpp import Llama  # Imported here so importing this module stays cheap
+
             self.logger.info(f"Loading LLaMA model '{self.model_name}' from file '{self.model_filename}'...")
             self.llm = Llama.from_pretrained(
                 repo_id=self.model_name,
@@ -1,4 +1,4 @@
-from app.inference.language.llama.model import LlamaModel
+from app.inference.registry import get_model
 import logging
 
 # Set up logging configuration
@@ -44,8 +44,7 @@ def refined_prompt(user_prompt: str):
     :return: The refined prompt as a string, based on the model's response.
     """
     prompt = _refine_prompt(user_prompt)
-    llm_model = LlamaModel()
-    llm_model.load_llama_model()    
+    llm_model = get_model("llama")
     answer = llm_model.generate_non_streaming_response(prompt)
     if isinstance(answer, str):
             # Directly use the string content
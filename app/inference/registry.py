@@ -0,0 +1,57 @@
+import sys
+import logging
+import threading
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+def _load_flux():
+    from app.inference.image.flux.model import FluxPipelineManager
+    return FluxPipelineManager()
+
+def _load_realesrgan():
+    from app.inference.image.realesrgan import rescaler
+    return rescaler.upscaler
+
+def _load_llama():
+    from app.inference.language.llama.model import LlamaModel
+    model = LlamaModel()
+    model.load_llama_model()
+    return model
+
+# Loader per model. Loaders import their modules on first use, so importing this registry (or
+# any module that depends on it) never pulls in torch, diffusers, transformers or llama_cpp.
+LOADERS = {
+    "flux": _load_flux,
+    "realesrgan": _load_realesrgan,
+    "llama": _load_llama,
+}
+
+# Modules the loaders import, so a process can check which inference libraries it has loaded
+HEAVY_MODULES = ("torch", "diffusers", "transformers", "llama_cpp")
+
+_models = {}
+_lock = threading.Lock()
+
+def get_model(name: str):
+    """
+    Returns a loaded model, importing and loading it on first use.
+
+    :param name: The model name, one of LOADERS.
+    :return: The loaded model.
+    :raises KeyError: If the model is unknown.
+    """
+    if name not in _models:
+        loader = LOADERS[name]
+        with _lock:
+            if name not in _models:
+                logger.info(f"Loading model '{name}'")
+                _models[name] = loader()
+    return _models[name]
+
+def is_loaded(name: str) -> bool:
+    return name in _models
+
+def loaded_heavy_modules() -> list:
+    """Returns the inference libraries imported by this process so far."""
+    return [module for module in HEAVY_MODULES if module in sys.modules]
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import socket
+import logging
+import threading
+from app.db.redis_config import redis_client
+from app.inference.registry import get_model
+from app.inference.image.aspect_ratio import ASPECT_RATIOS
+from app.inference.image.flux.config import get_tier_dimensions
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Warm-up configuration
+WARMUP_BUCKETS = [r.strip() for r in os.getenv("WARMUP_BUCKETS", ",".join(ASPECT_RATIOS)).split(",") if r.strip()]
+WARMUP_STATE_TTL_SECONDS = int(os.getenv("WARMUP_STATE_TTL", 120))
+WARMUP_NODES_KEY = "warmup:nodes"
+
+def configured_models(default: list) -> list:
+    """
+    Returns the models a process should warm up: WARMUP_MODELS when set (comma-separated,
+    'none' to disable warm-up), otherwise `default`.
+    """
+    value = os.getenv("WARMUP_MODELS")
+    if value is None:
+        return list(default)
+    return [name.strip() for name in value.split(",") if name.strip() and name.strip() != "none"]
+
+def _warm_flux(manager) -> dict:
+    timings = {}
+    # Drafts run at their own, smaller resolutions; refines run at the standard ones
+    buckets = [get_tier_dimensions(r, tier) for tier in ("draft", "standard") for r in WARMUP_BUCKETS]
+    for bucket in dict.fromkeys(buckets):
+        started = time.monotonic()
+        manager.warm_up(*bucket)
+        timings[f"{bucket[0]}x{bucket[1]}"] = round(time.monotonic() - started, 2)
+    return timings
+
+def _warm_realesrgan(upscaler) -> dict:
+    from PIL import Image
+
+    # Enough tiles to fill one batch, which is the largest shape the tiled upscaler ever runs
+    side = upscaler.tile_size * max(1, int(upscaler.batch_size ** 0.5 + 0.5))
+    started = time.monotonic()
+    upscaler.upscale(Image.new("RGB", (side, side)))
+    return {f"tile{upscaler.tile_size}": round(time.monotonic() - started, 2)}
+
+def _warm_llama(model) -> dict:
+    started = time.monotonic()
+    model.llm.create_completion("Hello", max_tokens=1)
+    return {"completion": round(time.monotonic() - started, 2)}
+
+# Warm-up function per model, called with the model loaded from the registry. Warm-up
+# functions run dummy inferences and return their timings, keyed by what they exercised
+# (e.g. the resolution bucket).
+WARMERS = {
+    "flux": _warm_flux,
+    "realesrgan": _warm_realesrgan,
+    "llama": _warm_llama,
+}
+
+class ModelWarmup:
+    """
+    Loads a process's models ahead of the first request and runs a dummy inference on each.
+
+    The first inference after a load pays for kernel selection and allocator growth, so running
+    it at boot keeps that cost off the first user. Per-model state ('pending', 'loading',
+    'warming', 'ready' or 'failed') and timings are published to Redis under this process's node
+    name, with a TTL that a heartbeat thread keeps refreshing, so the readiness endpoint only
+    reports live processes.
+    """
+
+    def __init__(self, role: str, models: list, client=redis_client):
+        self.node = f"{role}@{socket.gethostname()}:{os.getpid()}"
+        self.models = [name for name in models if name in WARMERS]
+        for name in set(models) - set(self.models):
+            logger.warning(f"Unknown warm-up model '{name}'. Skipping.")
+        self.redis_client = client
+        self.states = {}
+        self._heartbeat = None
+
+    def _node_key(self) -> str:
+        return f"warmup:node:{self.node}"
+
+    def _record(self, name: str, **state) -> None:
+        self.states[name] = dict(state, updatedAt=time.time())
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.hset(self._node_key(), name, json.dumps(self.states[name]))
+            pipe.expire(self._node_key(), WARMUP_STATE_TTL_SECONDS)
+            pipe.sadd(WARMUP_NODES_KEY, self.node)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to publish warm-up state of '{name}': {e}")
+
+    def run(self) -> bool:
+        """
+        Loads and warms every configured model, one after the other.
+
+        A model that fails is recorded as 'failed' and the others are still warmed.
+
+        :return: True if every model is ready.
+        """
+        for name in self.models:
+            self._record(name, state="pending")
+        for name in self.models:
+            warm = WARMERS[name]
+            try:
+                self._record(name, state="loading")
+                started = time.monotonic()
+                model = get_model(name)
+                load_seconds = round(time.monotonic() - started, 2)
+                self._record(name, state="warming", loadSeconds=load_seconds)
+                started = time.monotonic()
+                timings = warm(model)
+                warmup_seconds = round(time.monotonic() - started, 2)
+            except Exception as e:
+                logger.exception(f"Warm-up of '{name}' failed")
+                self._record(name, state="failed", error=str(e))
+                continue
+            self._record(name, state="ready", loadSeconds=load_seconds, warmupSeconds=warmup_seconds, timings=timings)
+            logger.info(f"Model '{name}' loaded in {load_seconds}s and warmed up in {warmup_seconds}s: {timings}")
+        self.start_heartbeat()
+        return self.is_ready()
+
+    def is_ready(self) -> bool:
+        return all(self.states.get(name, {}).get("state") == "ready" for name in self.models)
+
+    def start_heartbeat(self) -> None:
+        """Keeps this node's published state alive for as long as the process runs."""
+        if self._heartbeat is not None:
+            return
+
+        def _beat():
+            while True:
+                time.sleep(WARMUP_STATE_TTL_SECONDS / 3)
+                try:
+                    pipe = self.redis_client.pipeline()
+                    pipe.expire(self._node_key(), WARMUP_STATE_TTL_SECONDS)
+                    pipe.sadd(WARMUP_NODES_KEY, self.node)
+                    pipe.execute()
+                except Exception as e:
+                    logger.warning(f"Failed to refresh warm-up state: {e}")
+
+        self._heartbeat = threading.Thread(target=_beat, name="warmup-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+def readiness(client=redis_client) -> dict:
+    """
+    Collects the warm-up state of every live process.
+
+    :return: A dictionary with 'ready' (True when at least one process reported and all of
+             their models are ready) and 'nodes' (per-model state by node name).
+    """
+    nodes = {}
+    for node in sorted(member.decode() for member in client.smembers(WARMUP_NODES_KEY)):
+        states = client.hgetall(f"warmup:node:{node}")
+        if not states:
+            # The process stopped refreshing its state, i.e. it is gone
+            client.srem(WARMUP_NODES_KEY, node)
+            continue
+        nodes[node] = {name.decode(): json.loads(state) for name, state in states.items()}
+    ready = bool(nodes) and all(
+        state["state"] == "ready" for models in nodes.values() for state in models.values()
+    )
+    return {"ready": ready, "nodes": nodes}
@@ -0,0 +1,113 @@
+import os
+import time
+import uuid
+import logging
+from app.workers.scheduler import FairScheduler, DEFAULT_LANE, job_cost
+from app.inference.image.flux.config import DEFAULT_TIER, TIERS, get_tier_dimensions
+
+# Set up logging configuration
+logger = logging.getLogger(__name__)
+
+# Batching configuration
+BATCH_WINDOW_SECONDS = float(os.getenv("FLUX_BATCH_WINDOW_MS", 250)) / 1000
+MAX_BATCH_SIZE = int(os.getenv("FLUX_MAX_BATCH_SIZE", 4))
+POLL_INTERVAL_SECONDS = 0.02
+
+class MicroBatcher:
+    """
+    Groups queued image jobs that share a bucket (speed tier and resolution) into a single pipeline call.
+
+    Jobs are queued in the `FairScheduler`, which decides whose job runs next. A worker takes
+    the next job as the leader of a batch, then fills the batch with further jobs of the same
+    bucket for up to `window_seconds`, or until `max_batch_size` jobs are collected. The jobs
+    that fill a batch are charged to their users like any other, so batching never lets a user
+    jump their fair share.
+    """
+
+    def __init__(self, scheduler: FairScheduler, window_seconds: float = BATCH_WINDOW_SECONDS, max_batch_size: int = MAX_BATCH_SIZE):
+        self.scheduler = scheduler
+        self.window_seconds = window_seconds
+        self.max_batch_size = max(1, max_batch_size)
+
+    @staticmethod
+    def bucket(aspect_ratio: str, tier: str = DEFAULT_TIER) -> str:
+        """Returns the bucket name for an aspect ratio and tier, e.g. '1920x1080' or 'draft:960x540'."""
+        width, height = get_tier_dimensions(aspect_ratio, tier)
+        return f"{width}x{height}" if tier == DEFAULT_TIER else f"{tier}:{width}x{height}"
+
+    @staticmethod
+    def cost(aspect_ratio: str, tier: str = DEFAULT_TIER) -> float:
+        """Returns the scheduling cost of a job; refines only run the last `strength` share of the steps."""
+        settings = TIERS[tier]
+        return job_cost(*get_tier_dimensions(aspect_ratio, tier), settings["steps"] * settings.get("strength", 1.0))
+
+    def submit(self, task_id: str, prompt: str, aspect_ratio: str, seed: int = None, tier: str = DEFAULT_TIER,
+               draft_image_id: str = None, user_id: str = "anonymous", lane: str = DEFAULT_LANE, on_admitted=None) -> None:
+        """
+        Queues a job for the user. Must be called before a worker is signalled to take it.
+
+        :param on_admitted: Optional callback run once the job is admitted, before workers can take it.
+        :raises AdmissionError: If the scheduler refuses the job.
+        """
+        self.scheduler.submit({
+            "task_id": task_id, "prompt": prompt, "aspect_ratio": aspect_ratio, "seed": seed,
+            "tier": tier, "draft_image_id": draft_image_id,
+            "bucket": self.bucket(aspect_ratio, tier), "cost": self.cost(aspect_ratio, tier),
+            "queued_at": time.time(),
+        }, user_id, lane, on_admitted)
+
+    def submit_variations(self, task_ids: list, prompts: list, aspect_ratio: str, seeds: list, tier: str = DEFAULT_TIER,
+                          user_id: str = "anonymous", lane: str = DEFAULT_LANE, on_admitted=None) -> list:
+        """
+        Queues one job per prompt, each producing `len(seeds)` variations of its prompt, one per
+        seed; the results of prompt `i` are stored under the task IDs in `task_ids[i]`. The
+        variations of a prompt share one prompt encoding and one denoising loop
+        (`num_images_per_prompt`). Jobs only batch with jobs producing the same number of
+        variations. The jobs are admitted together, counting every image, so a request is either
+        queued whole or refused.
+
+        :param on_admitted: Optional callback run once the jobs are admitted, before workers can take them.
+        :return: The IDs of the jobs.
+        :raises AdmissionError: If the scheduler refuses the jobs.
+        """
+        count = len(seeds)
+        jobs = [{
+            "task_id": str(uuid.uuid4()), "task_ids": list(ids), "prompt": prompt, "aspect_ratio": aspect_ratio,
+            "seeds": list(seeds), "tier": tier, "draft_image_id": None, "images": count,
+            "bucket": f"{self.bucket(aspect_ratio, tier)}:x{count}", "cost": self.cost(aspect_ratio, tier) * count,
+            "queued_at": time.time(),
+        } for ids, prompt in zip(task_ids, prompts)]
+        self.scheduler.submit_many(jobs, user_id, lane, on_admitted)
+        return [job["task_id"] for job in jobs]
+
+    def next_batch(self, claimant: str = None) -> list:
+        """
+        Takes the next job from the scheduler and more jobs of its bucket, up to `max_batch_size`
+        images in total, waiting at most `window_seconds` for them. A job with more variations
+        than `max_batch_size` runs on its own.
+
+        :param claimant: The worker taking the batch; the jobs stay claimed in its name until it
+                         calls `FairScheduler.finish` (see `FairScheduler.recover`).
+
+        :return: A list of job dictionaries with 'task_id', 'prompt', 'aspect_ratio', 'seed', 'tier',
+                 'draft_image_id', 'user_id', 'lane' and 'queued_at' keys, and for variation jobs
+                 'task_ids', 'seeds' and 'images'; empty when nothing is queued.
+        """
+        leader = self.scheduler.pop(claimant=claimant)
+        if leader is None:
+            return []
+        jobs = [leader]
+        images = leader.get("images", 1)
+        capacity = max(self.max_batch_size, images)
+        deadline = time.monotonic() + self.window_seconds
+        while (len(jobs) + 1) * images <= capacity:
+            job = self.scheduler.pop(bucket=leader["bucket"], claimant=claimant)
+            if job is not None:
+                jobs.append(job)
+                continue
+            if time.monotonic() + POLL_INTERVAL_SECONDS > deadline:
+                break
+            time.sleep(POLL_INTERVAL_SECONDS)
+        if len(jobs) > 1:
+            logger.info(f"Collected {len(jobs) - 1} additional job(s) for bucket '{leader['bucket']}'")
+        return jobs
@@ -6,13 +6,22 @@ celery = Celery(
     'celery_app',
     broker=os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0'),
     backend=os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0'),
-    include=['app.workers.celery_config'],
+    include=['app.workers.celery_config', 'app.workers.warmup', 'app.workers.pool', 'app.workers.retention', 'app.workers.metadata'],
     task_serializer='json',
     result_serializer='json',
     accept_content=['json'],
     timezone='UTC'
 )
 
+# Upscaling and derivatives run on their own queues so diffusion workers never wait behind them
+celery.conf.task_routes = {
+    'app.workers.images.upscale_image_task': {'queue': 'upscale'},
+    'app.workers.images.derive_image_task': {'queue': 'derivatives'},
+}
+
+# Prefork children are pinned and warm up their models before reporting as started (see app/workers/pool.py)
+celery.conf.worker_proc_alive_timeout = float(os.getenv('WARMUP_TIMEOUT', 1800))
+
 # # Use task name prefix
 # celery.conf.task_routes = {
 #     'app.workers.*': {'queue': 'default', 'task_prefix': 'celery_task.'}
@@ -1,11 +1,41 @@
+import os
+import json
 import logging
+import uuid
+import random
+import time
+import threading
+from collections import Counter
 import requests
+from celery import signals
+from celery.exceptions import WorkerLostError
+from celery.result import AsyncResult, GroupResult
 from app.workers.celery_config import celery
+from app.workers.batching import MicroBatcher
+from app.workers.scheduler import FairScheduler, DEFAULT_LANE
+from app.workers.progress import ProgressReporter
+from app.workers.telemetry import QueueTelemetry
+from app.workers.retention import schedule_expiry
+from app.workers.metadata import MetadataBuffer
+from app.db.redis_config import redis_client
+from app.inference.image.result_cache import ResultCache
+from app.inference.image.flux.config import FLUX_VERSION, GUIDANCE_SCALE, MAX_SEED, TIERS, DEFAULT_TIER, get_tier_dimensions
 
 # Set up logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# How long the inputs of each image are kept, for refining drafts
+GENERATION_RECORD_TTL_SECONDS = int(float(os.getenv("GENERATION_RECORD_TTL_DAYS", 30)) * 86400)
+# How often workers look for jobs claimed by generation workers that stopped heartbeating
+CLAIM_RECOVERY_INTERVAL_SECONDS = float(os.getenv("SCHED_RECOVERY_INTERVAL_SECONDS", 15))
+
+scheduler = FairScheduler(redis_client)
+batcher = MicroBatcher(scheduler)
+result_cache = ResultCache()
+telemetry = QueueTelemetry(redis_client)
+metadata_buffer = MetadataBuffer(redis_client)
+
 # Utility function to handle REST API POST requests
 def make_post_request(url: str, payload: dict):
     try:
@@ -16,33 +46,368 @@ def make_post_request(url: str, payload: dict):
         logger.error(f"Request to {url} failed: {e}")
         return None
 
-@celery.task(name='app.workers.images.generate_image_task')
-def generate_image_task(prompt: str, aspect_ratio: str):
+def generation_cache_key(user_id: str, prompt: str, aspect_ratio: str, seed: int, tier: str = DEFAULT_TIER,
+                         draft_image_id: str = None) -> str:
+    """
+    Returns the result cache key of a generation, covering every input that determines the image.
+    Keys are scoped by user, so a hit always returns one of the user's own images.
     """
-    Celery task to generate an image based on a given prompt and aspect ratio.
+    width, height = get_tier_dimensions(aspect_ratio, tier)
+    settings = TIERS[tier]
+    extra = {"draft": draft_image_id, "strength": settings["strength"]} if tier == "final" else None
+    key = ResultCache.make_key(FLUX_VERSION, prompt, f"{width}x{height}", seed, settings["steps"], GUIDANCE_SCALE, extra)
+    return f"{user_id}:{key}"
 
-    Parameters:
-    - prompt (str): The text prompt for generating the image.
-    - aspect_ratio (str): The desired aspect ratio for the generated image.
+def random_seed() -> int:
+    return random.randint(1, MAX_SEED)
+
+def _generation_key(image_id: str) -> str:
+    return f"image:{image_id}:generation"
+
+def get_generation(image_id: str):
+    """
+    Returns the inputs an image was generated from ('prompt', 'aspectRatio', 'seed', 'tier' and
+    'userId'), or None for unknown images. Used to refine a draft with its own seed and framing.
+    """
+    record = redis_client.get(_generation_key(image_id))
+    return json.loads(record) if record else None
+
+def image_owners(image_ids: list) -> dict:
+    """
+    Returns the ID of the user each image belongs to, by image ID: from the generation records,
+    then from the `images` table for images whose record has expired. Unknown images are left out.
+    """
+    records = redis_client.mget([_generation_key(image_id) for image_id in image_ids]) if image_ids else []
+    owners = {image_id: json.loads(record).get('userId') for image_id, record in zip(image_ids, records) if record}
+    missing = [image_id for image_id in image_ids if image_id not in owners]
+    if missing:
+        owners.update(metadata_buffer.owners(missing))
+    return owners
+
+def enqueue_generate_image(prompt: str, aspect_ratio: str, seed: int, tier: str = DEFAULT_TIER, draft_image_id: str = None,
+                           user_id: str = "anonymous", lane: str = DEFAULT_LANE):
+    """
+    Queues an image job in the user's fair queue and signals a generation worker to take the next job.
+
+    :param prompt: The text prompt for generating the image.
+    :param aspect_ratio: The desired aspect ratio for the generated image.
+    :param seed: The seed for the generation.
+    :param tier: The speed tier ('draft', 'standard' or 'final').
+    :param draft_image_id: For the 'final' tier, the draft to refine.
+    :param user_id: The user the job is scheduled for.
+    :param lane: The priority lane ('interactive' or 'batch').
+    :return: The AsyncResult the job's result is stored under.
+    :raises AdmissionError: If the user is at their in-flight cap or the queue is too long.
+    """
+    task_id = str(uuid.uuid4())
+    # Published once admitted but before the job is visible to workers, so refused jobs never
+    # appear as queued and the state never overwrites a later one
+    batcher.submit(task_id, prompt, aspect_ratio, seed, tier, draft_image_id, user_id, lane,
+                   on_admitted=lambda: ProgressReporter([task_id]).state('QUEUED', lane=lane))
+    telemetry.queued(lane)
+    # The Celery message carries no job: whichever worker runs it takes the job the scheduler picks
+    generate_image_task.apply_async()
+    return AsyncResult(task_id, app=celery)
+
+def enqueue_generate_variations(prompts: list, count: int, aspect_ratio: str, seed: int = None, tier: str = DEFAULT_TIER,
+                                user_id: str = "anonymous", lane: str = DEFAULT_LANE) -> GroupResult:
+    """
+    Queues `count` variations of each prompt as one job per prompt, so each prompt is encoded
+    once and its variations are denoised together, and saves the images' task IDs as a group.
+
+    Variation `i` of a prompt uses seed `seed + i`; without a seed, the base seed is drawn at
+    random. Either way every image can be reproduced on its own with its seed.
+
+    :param prompts: The text prompts.
+    :param count: The number of variations per prompt.
+    :param aspect_ratio: The desired aspect ratio for the generated images.
+    :param seed: The seed of the first variation.
+    :param tier: The speed tier ('draft' or 'standard').
+    :param user_id: The user the jobs are scheduled for.
+    :param lane: The priority lane ('interactive' or 'batch').
+    :return: The saved GroupResult of the image tasks, prompt by prompt.
+    :raises AdmissionError: If the user cannot queue that many jobs or the queue is too long.
+    """
+    base = seed if seed is not None else random_seed()
+    seeds = [(base + i) % (MAX_SEED + 1) for i in range(count)]
+    task_ids = [[str(uuid.uuid4()) for _ in range(count)] for _ in prompts]
+    # Published once admitted but before the jobs are visible to workers (see enqueue_generate_image)
+    progress = ProgressReporter([task_id for ids in task_ids for task_id in ids])
+    batcher.submit_variations(task_ids, prompts, aspect_ratio, seeds, tier, user_id, lane,
+                              on_admitted=lambda: progress.state('QUEUED', lane=lane))
+    for _ in prompts:
+        telemetry.queued(lane)
+        generate_image_task.apply_async()
+    group = GroupResult(str(uuid.uuid4()), [AsyncResult(task_id, app=celery) for ids in task_ids for task_id in ids], app=celery)
+    group.save()
+    return group
+
+def serve_cached_result(result: dict) -> str:
+    """
+    Stores a cached result under a new task ID, so clients can poll it like any other task.
+
+    :return: The new task ID.
+    """
+    task_id = str(uuid.uuid4())
+    generate_image_task.backend.store_result(task_id, result, 'SUCCESS')
+    ProgressReporter([task_id]).finish('SUCCESS', {task_id: result})
+    return task_id
+
+def _image_result(image_id: str, seed: int, tier: str = DEFAULT_TIER, width: int = None) -> dict:
+    from app.inference.image.writer import image_url
+    from app.inference.image.derivatives import derivative_urls, srcset
+
+    return {
+        'imageId': image_id,
+        'imageUrl': image_url(image_id, 'original'),
+        # Resized copies for `srcset`; any not made yet is made on first request
+        'derivatives': derivative_urls(image_id, width),
+        'srcset': srcset(image_id, width),
+        # Drafts are not upscaled; they are either discarded or refined by a 'final' request
+        'upscaleTaskId': _upscale_task_id(image_id) if tier != 'draft' else None,
+        'seed': seed,
+        'tier': tier,
+    }
+
+def _on_original_saved(image_id: str) -> None:
+    _enqueue_upscale(image_id)
+    derive_image_task.apply_async((image_id,), task_id=_derive_task_id(image_id))
+    _on_draft_saved(image_id)
+
+def _on_original_failed(image_id: str, error: Exception) -> None:
+    # The follow-up tasks read the original, so they are failed rather than left pending forever
+    error = RuntimeError(f"The original of image {image_id} could not be written: {error}")
+    for task_id in (_upscale_task_id(image_id), _derive_task_id(image_id)):
+        upscale_image_task.backend.mark_as_failure(task_id, error)
+    ProgressReporter([_upscale_task_id(image_id)]).finish('FAILURE')
+
+def _on_draft_saved(image_id: str) -> None:
+    # The result cache entry only becomes visible once the original is durable
+    result_cache.commit(image_id)
+    result_cache.account_files(image_id)
+
+def _upscale_task_id(image_id: str) -> str:
+    # Derived from the image ID so it can be reported before the upscale task is enqueued
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"upscale:{image_id}"))
+
+def _derive_task_id(image_id: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"derive:{image_id}"))
+
+def _enqueue_upscale(image_id: str) -> None:
+    # Called once the original is on disk, since the upscale worker reads it from there
+    ProgressReporter([_upscale_task_id(image_id)]).state('QUEUED')
+    upscale_image_task.apply_async((image_id,), task_id=_upscale_task_id(image_id))
+    telemetry.queued('upscale')
+
+@celery.task(name='app.workers.images.generate_image_task', bind=True)
+def generate_image_task(self):
+    """
+    Celery task that generates the next batch of queued image jobs.
+
+    Jobs are not carried by the Celery message: one task is sent per queued job, and each task
+    takes whatever the `FairScheduler` picks next, so the order in which users are served is
+    decided by the scheduler rather than by the broker. Queued jobs in the same bucket (speed
+    tier and resolution) are generated together in one pipeline call (see `MicroBatcher`); a task
+    that finds the queue already drained by an earlier batch returns without doing anything.
+    Variation jobs produce several images of one prompt in the same call. Results are stored under
+    each image's own task ID. Each image is upscaled by its own
+    `upscale_image_task` on the 'upscale' queue, enqueued once its base image has been written.
+
+    Each job's result is a dictionary containing:
+    - 'imageId' (str): Unique identifier of the generated image.
+    - 'imageUrl' (str): URL of the generated (base) image.
+    - 'derivatives' (dict): URLs of the resized copies of the image, by width.
+    - 'srcset' (str): The derivatives as a `srcset` attribute.
+    - 'upscaleTaskId' (str): ID of the task producing the upscaled image.
+    - 'seed' (int): The seed the image was generated with.
+    - 'tier' (str): The speed tier the image was generated in.
+
+    The jobs are claimed in the task's name and kept alive by a heartbeat until their results are
+    stored; if the worker dies first, `recover_lost_jobs` queues them again.
 
     Returns:
-    - dict: A dictionary containing:
-        - 'image_url' (str): URL of the generated image.
+    - list: The task IDs of the images generated.
 
     Raises:
     - Exception: Logs and raises any exceptions encountered during the task execution.
     """
-    from app.inference.image.flux.diffuser import generate_image
-
+    claimant = self.request.id or str(uuid.uuid4())
+    jobs = batcher.next_batch(claimant)
+    if not jobs:
+        return []
     try:
-        # Generate the image based on the refined or original prompt and aspect ratio
-        image_id = generate_image(prompt, aspect_ratio)
+        with scheduler.heartbeat(claimant):
+            return _generate_batch(self, jobs)
+    finally:
+        # Only once every result is stored (or failed), so a lost worker's jobs are never dropped
+        scheduler.finish(jobs, claimant)
 
-        # Construct the image URL
-        image_url = f"/images/original_{image_id}.png"
+def _generate_batch(task, jobs: list) -> list:
+    from app.inference.image.flux.diffuser import generate_images
 
-        return {'imageUrl': image_url}
+    tier, aspect_ratio = jobs[0]['tier'], jobs[0]['aspect_ratio']
+    lanes = Counter(job['lane'] for job in jobs)
+    started = time.time()
+    for lane, count in lanes.items():
+        telemetry.started(lane, count)
+    for job in jobs:
+        telemetry.record_duration('wait', job['aspect_ratio'], started - job['queued_at'])
+    # Every image of the batch, prompt by prompt, as the pipeline returns them
+    images = [
+        (job, task_id, seed if seed is not None else random_seed())
+        for job in jobs for task_id, seed in _job_images(job)
+    ]
+    progress = ProgressReporter([task_id for _, task_id, _ in images])
+    progress.state('STARTED')
+    try:
+        # Generate the image based on the refined or original prompt and aspect ratio
+        image_ids = generate_images(
+            [job['prompt'] for job in jobs],
+            aspect_ratio,
+            on_saved=_on_original_saved if tier != 'draft' else _on_draft_saved,
+            progress=progress,
+            seeds=[seed for _, _, seed in images],
+            tier=tier,
+            draft_image_ids=[job['draft_image_id'] for job in jobs],
+            num_images_per_prompt=jobs[0].get('images', 1),
+            on_failed=_on_original_failed if tier != 'draft' else None,
+        )
     except Exception as e:
         # Log the error or handle it as needed
         logger.error(f"Error in generate_image_task: {e}")
+        progress.finish('FAILURE')
+        for _, task_id, _ in images:
+            task.backend.mark_as_failure(task_id, e)
+        raise e
+    finally:
+        for lane, count in lanes.items():
+            telemetry.finished(lane, count)
+    finished = time.time()
+    for job in jobs:
+        telemetry.record_duration('generate', job['aspect_ratio'], finished - started)
+
+    results, rows = {}, []
+    width, _ = get_tier_dimensions(aspect_ratio, tier)
+    for (job, task_id, seed), image_id in zip(images, image_ids):
+        results[task_id] = _image_result(image_id, seed, tier, width)
+        redis_client.set(_generation_key(image_id), json.dumps({
+            'prompt': job['prompt'], 'aspectRatio': job['aspect_ratio'], 'seed': seed, 'tier': tier,
+            'userId': job['user_id'],
+        }), ex=GENERATION_RECORD_TTL_SECONDS)
+        schedule_expiry(image_id, tier)
+        cache_key = generation_cache_key(job['user_id'], job['prompt'], job['aspect_ratio'], seed, tier, job['draft_image_id'])
+        result_cache.put(cache_key, results[task_id])
+        task.backend.store_result(task_id, results[task_id], 'SUCCESS')
+        rows.append({
+            'id': image_id, 'url': results[task_id]['imageUrl'], 'prompt': job['prompt'],
+            'aspectRatio': job['aspect_ratio'], 'user_id': job.get('user_id'), 'seed': seed, 'tier': tier,
+            'wait_seconds': started - job['queued_at'], 'generate_seconds': finished - started, 'created_at': finished,
+        })
+    progress.finish('SUCCESS', results)
+    # Written to the database in batches by the metadata flusher, never from the GPU task
+    metadata_buffer.add(rows)
+
+    return list(results)
+
+def recover_lost_jobs() -> tuple:
+    """
+    Queues the jobs of generation workers that died mid-batch again, and fails those that have
+    already been lost too many times (see `FairScheduler.recover`).
+
+    :return: A tuple of the number of jobs requeued and failed.
+    """
+    requeued, failed = scheduler.recover()
+    for job in requeued:
+        telemetry.requeued(job['lane'])
+        # One task per job, as when it was first queued
+        generate_image_task.apply_async()
+    for job in failed:
+        telemetry.finished(job['lane'])
+        task_ids = [task_id for task_id, _ in _job_images(job)]
+        error = WorkerLostError(f"Image job {job['task_id']} was lost with its worker {job['attempts']} times")
+        for task_id in task_ids:
+            generate_image_task.backend.mark_as_failure(task_id, error)
+        ProgressReporter(task_ids).finish('FAILURE')
+    return len(requeued), len(failed)
+
+def _recover_forever() -> None:
+    while True:
+        time.sleep(CLAIM_RECOVERY_INTERVAL_SECONDS)
+        try:
+            recover_lost_jobs()
+        except Exception:
+            logger.exception("Recovering lost image jobs failed")
+        try:
+            # After recovery, so requeued jobs count as queued
+            telemetry.reconcile(scheduler.depths())
+        except Exception:
+            logger.exception("Reconciling queue telemetry failed")
+
+@signals.worker_init.connect
+def start_claim_recovery(sender=None, **kwargs):
+    """
+    Starts the recovery of lost jobs in every worker, which also resets the queue telemetry to the
+    scheduler's real queue lengths; the scheduler lock makes concurrent passes safe.
+    """
+    threading.Thread(target=_recover_forever, name="claim-recovery", daemon=True).start()
+
+def _job_images(job: dict) -> list:
+    """Returns the (task ID, seed) of every image a job produces."""
+    if 'task_ids' in job:
+        return list(zip(job['task_ids'], job['seeds']))
+    return [(job['task_id'], job['seed'])]
+
+@celery.task(name='app.workers.images.upscale_image_task')
+def upscale_image_task(image_id: str):
+    """
+    Celery task to upscale a generated image. Routed to the 'upscale' queue so it can be
+    scaled independently of the generation workers.
+
+    Parameters:
+    - image_id (str): Unique identifier of the generated image.
+
+    Returns:
+    - dict: A dictionary containing:
+        - 'upscaledImageUrl' (str): URL of the upscaled image, whose file is written by the time the task succeeds.
+    """
+    from app.inference.image.flux.diffuser import upscale_image
+    from app.inference.image.writer import image_url
+
+    task_id = _upscale_task_id(image_id)
+    progress = ProgressReporter([task_id])
+    progress.state('STARTED')
+    telemetry.started('upscale')
+    started = time.time()
+    try:
+        upscale_image(image_id, on_saved=result_cache.account_files)
+        generation = get_generation(image_id)
+        if generation:
+            telemetry.record_duration('upscale', generation['aspectRatio'], time.time() - started)
+        result = {'upscaledImageUrl': image_url(image_id, 'upscaled')}
+        progress.finish('SUCCESS', {task_id: result})
+        return result
+    except Exception as e:
+        logger.error(f"Error in upscale_image_task: {e}")
+        progress.finish('FAILURE')
         raise e
+    finally:
+        telemetry.finished('upscale')
+
+@celery.task(name='app.workers.images.derive_image_task')
+def derive_image_task(image_id: str):
+    """
+    Celery task that makes the resized copies of a generated image (see `make_derivatives`).
+    Routed to the 'derivatives' queue, whose prefork workers keep this CPU work off the GPU workers.
+
+    Parameters:
+    - image_id (str): Unique identifier of the generated image.
+
+    Returns:
+    - dict: The size of each derivative in bytes, by storage key.
+    """
+    from app.inference.image.derivatives import make_derivatives, record_derivatives
+
+    sizes = make_derivatives(image_id)
+    record_derivatives(image_id, sizes)
+    result_cache.account_files(image_id)
+    return sizes
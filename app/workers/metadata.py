@@ -0,0 +1,323 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from celery import signals
+from sqlalchemy.exc import InterfaceError, OperationalError, StatementError
+from app.db.redis_config import redis_client
+from app.inference.image.writer import files_key, image_key
+
+# Set up logging configuration
+logger = logging.getLogger(__name__)
+
+# Write-behind configuration
+METADATA_BATCH_SIZE = int(os.getenv("METADATA_BATCH_SIZE", 500))  # Rows per INSERT; a full batch is flushed right away
+METADATA_FLUSH_SECONDS = float(os.getenv("METADATA_FLUSH_SECONDS", 5))  # Longest a row waits for a flush
+METADATA_POLL_SECONDS = float(os.getenv("METADATA_POLL_SECONDS", 0.5))
+METADATA_SIZE_GRACE_SECONDS = float(os.getenv("METADATA_SIZE_GRACE_SECONDS", 600))  # Longest a row waits for its file size
+
+# Rows wait in a Redis list, so they outlive the worker that produced them
+BUFFER_KEY = "images:pending_rows"
+LOCK_KEY = "images:pending_rows:lock"
+LOCK_TTL_SECONDS = 60
+# Image IDs of rows inserted before the writer finished their original, by time inserted;
+# their size is filled in by later flushes
+UNSIZED_KEY = "images:unsized_rows"
+
+# The lock is renewed and the buffer trimmed only by the flusher holding it, so a flusher whose
+# lock expired never trims rows the next flusher has not inserted yet
+RENEW_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+TRIM_IF_OWNER = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('LTRIM', KEYS[2], ARGV[2], -1)
+    return 1
+end
+return 0
+"""
+RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Errors caused by the rows themselves (constraint violations, values a column cannot take):
+# the rows are inserted one by one and the bad ones dropped. Errors reaching the database
+# (OperationalError, InterfaceError) leave the batch in the buffer for the next flush.
+ROW_ERRORS = (StatementError, ValueError, TypeError, OverflowError)
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+def _uuids(image_ids: list) -> list:
+    """Parses image IDs for the `images` table, skipping IDs that are not UUIDs."""
+    valid = []
+    for image_id in dict.fromkeys(image_ids):
+        try:
+            valid.append(uuid.UUID(image_id))
+        except ValueError:
+            continue
+    return valid
+
+class MetadataBuffer:
+    """
+    Write-behind buffer of rows for the `images` table.
+
+    Generation workers append rows to a Redis list, which costs one round trip and never waits
+    on Postgres. A flusher inserts them with one multi-row INSERT per batch of `batch_size` rows,
+    once a full batch is waiting or the oldest row has waited `flush_seconds`.
+
+    A batch is only trimmed from the list after its INSERT commits, so rows survive any restart.
+    Rows are keyed by image ID and inserted with ON CONFLICT DO NOTHING, so a batch that is
+    inserted again (after a crash between the commit and the trim) adds no duplicates. Rows that
+    cannot be inserted are logged and dropped, so one bad row never holds the buffer up. A Redis
+    lock lets a single flusher run at a time; a watchdog thread renews it while a batch is being
+    inserted, and a flusher that lost it stops without trimming.
+
+    Rows are inserted without waiting for the writer: when the original is not written yet, the
+    row goes in without its size, which a later flush fills in (for up to `size_grace_seconds`,
+    after which the write is taken to have failed).
+    """
+
+    def __init__(self, client=redis_client, engine=None, batch_size: int = METADATA_BATCH_SIZE,
+                 flush_seconds: float = METADATA_FLUSH_SECONDS, lock_ttl_seconds: float = LOCK_TTL_SECONDS,
+                 size_grace_seconds: float = METADATA_SIZE_GRACE_SECONDS):
+        self.redis_client = client
+        self._engine = engine
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.lock_ttl_seconds = lock_ttl_seconds
+        self.size_grace_seconds = size_grace_seconds
+        self._last_flush = time.monotonic()
+        self._renew_lock = client.register_script(RENEW_LOCK)
+        self._trim_if_owner = client.register_script(TRIM_IF_OWNER)
+        self._release_lock = client.register_script(RELEASE_LOCK)
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            # Imported on first flush, so producers never need a database connection
+            from app.db.database import engine
+            self._engine = engine
+        return self._engine
+
+    def add(self, rows: list) -> int:
+        """
+        Buffers rows for the `images` table.
+
+        :param rows: Column values by name; 'id' (the image ID) is required. 'size_bytes' is filled
+                     in from the writer's file index at flush time when missing.
+        :return: The number of rows waiting.
+        """
+        if not rows:
+            return self.pending()
+        return self.redis_client.rpush(BUFFER_KEY, *(json.dumps(row) for row in rows))
+
+    def pending(self) -> int:
+        return self.redis_client.llen(BUFFER_KEY)
+
+    def due(self) -> bool:
+        """
+        Returns whether a flush is due: a full batch is waiting, or some row has waited long enough
+        to be inserted or to get its size.
+        """
+        waiting = self.pending()
+        if waiting >= self.batch_size:
+            return True
+        if time.monotonic() - self._last_flush < self.flush_seconds:
+            return False
+        return waiting > 0 or self.redis_client.zcard(UNSIZED_KEY) > 0
+
+    @contextmanager
+    def _watchdog(self, token: str):
+        """Renews the flush lock while the flusher holding it works."""
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(self.lock_ttl_seconds / 3):
+                try:
+                    if not self._renew_lock(keys=[LOCK_KEY], args=[token, max(1, int(self.lock_ttl_seconds))]):
+                        return
+                except Exception as e:
+                    logger.warning(f"Failed to renew the metadata flush lock: {e}")
+
+        thread = threading.Thread(target=renew, name="metadata-flush-watchdog", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def flush(self) -> int:
+        """
+        Inserts every waiting row, a batch at a time, and fills in the sizes of rows inserted before
+        their original was written, unless another flusher is running.
+
+        :return: The number of rows inserted (rows already in the table are not counted).
+        """
+        token = uuid.uuid4().hex
+        if not self.redis_client.set(LOCK_KEY, token, nx=True, ex=max(1, int(self.lock_ttl_seconds))):
+            return 0
+        inserted = 0
+        try:
+            with self._watchdog(token):
+                while True:
+                    batch = self.redis_client.lrange(BUFFER_KEY, 0, self.batch_size - 1)
+                    if not batch:
+                        break
+                    inserted += self._insert(batch)
+                    # Only the rows just inserted; producers keep appending at the other end
+                    if not self._trim_if_owner(keys=[LOCK_KEY, BUFFER_KEY], args=[token, len(batch)]):
+                        # The next flusher inserts the batch again, which adds no duplicates
+                        logger.warning("Lost the metadata flush lock, leaving the buffer to the next flusher")
+                        return inserted
+                self._fill_sizes()
+        finally:
+            self._last_flush = time.monotonic()
+            self._release_lock(keys=[LOCK_KEY], args=[token])
+            if inserted:
+                logger.info(f"Recorded {inserted} images")
+        return inserted
+
+    def _prepare(self, batch: list) -> list:
+        """Parses buffered rows into column values, dropping the rows that cannot be parsed."""
+        rows = []
+        for entry in batch:
+            try:
+                row = json.loads(entry)
+                row["id"], row["user_id"] = uuid.UUID(row["id"]), uuid.UUID(row["user_id"])
+                if row.get("created_at") is not None:
+                    row["created_at"] = datetime.fromtimestamp(row["created_at"], timezone.utc).replace(tzinfo=None)
+            except (KeyError, *ROW_ERRORS) as e:
+                # e.g. jobs of the 'anonymous' user, which has no row in `users`
+                logger.warning(f"Not recording image metadata {entry[:200]!r}: {e!r}")
+                continue
+            rows.append(row)
+
+        missing = [row for row in rows if row.get("size_bytes") is None]
+        pipe = self.redis_client.pipeline()
+        for row in missing:
+            pipe.hget(files_key(str(row["id"])), image_key(str(row["id"]), "original"))
+        for row, size in zip(missing, pipe.execute()):
+            row["size_bytes"] = int(size) if size is not None else None
+        unsized = [str(row["id"]) for row in missing if row["size_bytes"] is None]
+        if unsized:
+            # Recorded before the INSERT, so a flusher dying in between leaves no row unsized for good
+            now = time.time()
+            self.redis_client.zadd(UNSIZED_KEY, {image_id: now for image_id in unsized}, nx=True)
+        return rows
+
+    def _fill_sizes(self) -> int:
+        """
+        Sets the size of rows inserted before their original was written, once the writer has
+        indexed it. Rows still without a size after `size_grace_seconds` are given up on.
+
+        :return: The number of rows updated.
+        """
+        from sqlalchemy import bindparam, update
+        from app.db.models import Image
+        waiting = self.redis_client.zrange(UNSIZED_KEY, 0, self.batch_size - 1, withscores=True)
+        if not waiting:
+            return 0
+        image_ids = [member.decode() for member, _ in waiting]
+        pipe = self.redis_client.pipeline()
+        for image_id in image_ids:
+            pipe.hget(files_key(image_id), image_key(image_id, "original"))
+        sizes = pipe.execute()
+
+        deadline = time.time() - self.size_grace_seconds
+        sized = [{"image_id": uuid.UUID(image_id), "size": int(size)} for image_id, size in zip(image_ids, sizes) if size is not None]
+        expired = [image_id for image_id, size, (_, queued) in zip(image_ids, sizes, waiting) if size is None and queued <= deadline]
+        updated = 0
+        if sized:
+            table = Image.__table__
+            statement = update(table).where(table.c.id == bindparam("image_id")).values(size_bytes=bindparam("size"))
+            with self.engine.begin() as connection:
+                updated = connection.execute(statement, sized).rowcount
+        done = [str(row["image_id"]) for row in sized] + expired
+        if expired:
+            logger.warning(f"Gave up on the file size of {len(expired)} images")
+        if done:
+            self.redis_client.zrem(UNSIZED_KEY, *done)
+        return updated
+
+    def _statement(self, rows: list):
+        from app.db.models import Image
+        if self.engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        return insert(Image).values(rows).on_conflict_do_nothing(index_elements=["id"])
+
+    def _insert(self, batch: list) -> int:
+        rows = self._prepare(batch)
+        if not rows:
+            return 0
+        try:
+            with self.engine.begin() as connection:
+                return connection.execute(self._statement(rows)).rowcount
+        except TRANSIENT_ERRORS:
+            raise
+        except ROW_ERRORS as e:
+            # One bad row (e.g. a user that has been deleted) fails the whole statement; insert
+            # the rows one by one so only the bad ones are dropped
+            logger.warning(f"Batch insert of {len(rows)} images failed, inserting them one by one: {e!r}")
+        inserted = 0
+        for row in rows:
+            try:
+                with self.engine.begin() as connection:
+                    inserted += connection.execute(self._statement([row])).rowcount
+            except TRANSIENT_ERRORS:
+                raise
+            except ROW_ERRORS as e:
+                logger.error(f"Dropping metadata of image {row['id']}: {e!r}")
+        return inserted
+
+    def delete(self, image_ids: list) -> int:
+        """
+        Deletes the rows of deleted images. Rows still waiting in the buffer are left alone, since
+        removing them would shift the batch being flushed; images are deleted long after their row
+        is flushed.
+
+        :return: The number of rows deleted from the table.
+        """
+        from sqlalchemy import delete
+        from app.db.models import Image
+        valid = _uuids(image_ids)
+        if not valid:
+            return 0
+        with self.engine.begin() as connection:
+            return connection.execute(delete(Image).where(Image.id.in_(valid))).rowcount
+
+    def owners(self, image_ids: list) -> dict:
+        """Returns the ID of the user each image belongs to, by image ID; images without a row are left out."""
+        from sqlalchemy import select
+        from app.db.models import Image
+        valid = _uuids(image_ids)
+        if not valid:
+            return {}
+        with self.engine.connect() as connection:
+            rows = connection.execute(select(Image.id, Image.user_id).where(Image.id.in_(valid))).all()
+        return {str(image_id): str(user_id) for image_id, user_id in rows}
+
+    def run_forever(self) -> None:
+        while True:
+            time.sleep(METADATA_POLL_SECONDS)
+            try:
+                if self.due():
+                    self.flush()
+            except Exception:
+                logger.exception("Image metadata flush failed")
+
+@signals.worker_init.connect
+def start_flusher(sender=None, **kwargs):
+    """Starts the metadata flusher in every worker; the Redis lock lets one flush run at a time fleet-wide."""
+    threading.Thread(target=MetadataBuffer().run_forever, name="metadata-flusher", daemon=True).start()
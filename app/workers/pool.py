@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import socket
+import logging
+import threading
+from multiprocessing.sharedctypes import RawArray
+from celery import signals
+from app.workers.celery_config import celery
+from app.db.redis_config import redis_client
+from app.workers.warmup import is_prefork, warm_up
+
+# Set up logging configuration
+logger = logging.getLogger(__name__)
+
+# Pool configuration
+WORKER_DEVICES = os.getenv("WORKER_DEVICES", "auto")  # 'auto', 'cpu' or a list such as 'cuda:0,cuda:1'
+WORKER_CPU_SETS = os.getenv("WORKER_CPU_SETS")  # e.g. '0-7;8-15'; defaults to an even split of the usable cores
+UTILIZATION_INTERVAL_SECONDS = float(os.getenv("WORKER_UTILIZATION_INTERVAL", 30))
+UTILIZATION_TTL_SECONDS = int(UTILIZATION_INTERVAL_SECONDS * 3)
+
+# Pinning and utilization only apply to the GPU workers, i.e. those consuming the generation queue
+GENERATION_QUEUE = "celery"
+UPSCALE_QUEUE = "upscale"
+
+# Per-child counters shared with the parent: busy seconds, finished tasks and the start time
+# of the running task (0 when idle), indexed by the pool's child index
+_FIELDS = 3
+_stats = None
+_processes = 0
+_assignments = []
+
+def parse_cpu_set(text: str) -> list:
+    """Parses a CPU list such as '0-3,8' into [0, 1, 2, 3, 8]."""
+    cpus = []
+    for part in text.split(","):
+        part = part.strip()
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+def usable_cpus() -> list:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def detect_devices(setting: str = WORKER_DEVICES) -> list:
+    """
+    Resolves WORKER_DEVICES into a device list. 'auto' uses every CUDA device, or the CPU when
+    there is none.
+    """
+    if setting != "auto":
+        return [device.strip() for device in setting.split(",") if device.strip()]
+    import torch
+    count = torch.cuda.device_count()  # Queries the driver without creating a CUDA context
+    return [f"cuda:{i}" for i in range(count)] or ["cpu"]
+
+def assign(index: int, processes: int, devices: list, cpus: list, cpu_sets: list = None) -> dict:
+    """
+    Picks the device and CPU cores of one pool child.
+
+    Devices are assigned round-robin. Cores come from `cpu_sets` when given, otherwise the usable
+    cores are split into `processes` disjoint, contiguous sets.
+
+    :return: A dictionary with 'index', 'device' and 'cpus' keys.
+    """
+    device = devices[index % len(devices)]
+    if cpu_sets:
+        own = cpu_sets[index % len(cpu_sets)]
+    else:
+        share = max(1, len(cpus) // max(1, processes))
+        start = (index * share) % len(cpus)
+        own = cpus[start:start + share]
+    return {"index": index, "device": device, "cpus": list(own)}
+
+def pin(assignment: dict) -> None:
+    """
+    Pins the current process to its device and cores. Must run before CUDA is initialised: the
+    device is selected by narrowing CUDA_VISIBLE_DEVICES, so 'cuda' means the pinned device to
+    every model in the process.
+    """
+    device = assignment["device"]
+    if device.startswith("cuda"):
+        os.environ["CUDA_VISIBLE_DEVICES"] = device.partition(":")[2] or "0"
+    elif device == "cpu":
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, assignment["cpus"])
+    import torch
+    torch.set_num_threads(len(assignment["cpus"]))
+    logger.info(f"Pool child {assignment['index']} pinned to {device} and CPUs {assignment['cpus']}")
+
+def _child_index() -> int:
+    from billiard.process import current_process
+    return getattr(current_process(), "index", 0) or 0
+
+def plan(processes: int) -> list:
+    """Returns the device and core assignment of every pool child, from the pool settings."""
+    cpu_sets = [parse_cpu_set(cpus) for cpus in WORKER_CPU_SETS.split(";")] if WORKER_CPU_SETS else None
+    devices, cpus = detect_devices(), usable_cpus()
+    return [assign(index, processes, devices, cpus, cpu_sets) for index in range(processes)]
+
+def consumes_generation(app) -> bool:
+    """Returns whether the worker consumes the generation queue (and not only e.g. derivatives)."""
+    return GENERATION_QUEUE in app.amqp.queues.consume_from
+
+def upscales_only(app) -> bool:
+    """Returns whether the worker consumes the upscale queue and not the generation queue."""
+    queues = app.amqp.queues.consume_from
+    return UPSCALE_QUEUE in queues and GENERATION_QUEUE not in queues
+
+def _set_upscale_threads() -> None:
+    from app.inference.image.realesrgan.tiling import set_cpu_threads
+    set_cpu_threads()
+
+def _slot(index: int) -> int:
+    return (index % max(1, _processes)) * _FIELDS
+
+def utilization_report(stats, processes: int, previous: dict, now: float) -> dict:
+    """
+    Computes each child's utilization since the previous report: the share of wall time it spent
+    running tasks, counting a task still running up to `now`.
+
+    :param previous: The busy seconds and time of the previous report by child index; updated in place.
+    :return: The report by child index.
+    """
+    report = {}
+    for index in range(processes):
+        busy, tasks, running_since = stats[index * _FIELDS:(index + 1) * _FIELDS]
+        if running_since:
+            busy += now - running_since
+        last_busy, last_time = previous.get(index, (0.0, now - UTILIZATION_INTERVAL_SECONDS))
+        elapsed = max(now - last_time, 1e-9)
+        report[index] = {
+            "utilization": round(min(1.0, max(0.0, (busy - last_busy) / elapsed)), 3),
+            "busySeconds": round(busy, 2),
+            "tasks": int(tasks),
+            "running": bool(running_since),
+        }
+        previous[index] = (busy, now)
+    return report
+
+def _monitor(processes: int) -> None:
+    key = f"worker:utilization:{socket.gethostname()}:{os.getpid()}"
+    previous = {}
+    while True:
+        time.sleep(UTILIZATION_INTERVAL_SECONDS)
+        report = utilization_report(_stats, processes, previous, time.time())
+        logger.info("Pool utilization: " + ", ".join(f"child {i}: {r['utilization']:.0%}" for i, r in report.items()))
+        try:
+            pipe = redis_client.pipeline()
+            pipe.set(key, json.dumps(report), ex=UTILIZATION_TTL_SECONDS)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to publish pool utilization: {e}")
+
+@signals.worker_init.connect
+def start_pool_monitor(sender=None, **kwargs):
+    """
+    Plans the children's pinning and allocates their shared counters in the parent, before the
+    children are forked. Other prefork workers, such as the derivatives worker, are left alone.
+    """
+    global _stats, _processes, _assignments
+    if not is_prefork(sender.pool_cls) or not consumes_generation(sender.app):
+        return
+    _processes = sender.concurrency
+    _assignments = plan(_processes)
+    for assignment in _assignments:
+        logger.info(f"Pool child {assignment['index']}: {assignment['device']}, CPUs {assignment['cpus']}")
+    _stats = RawArray("d", _processes * _FIELDS)
+    threading.Thread(target=_monitor, args=(_processes,), name="pool-monitor", daemon=True).start()
+
+@signals.worker_init.connect
+def init_upscale_worker(sender=None, **kwargs):
+    """Splits the cores between the tiling threads of solo and thread pool upscale workers."""
+    if not is_prefork(sender.pool_cls) and upscales_only(sender.app):
+        _set_upscale_threads()
+
+@signals.worker_process_init.connect
+def init_pool_child(**kwargs):
+    """
+    Pins a prefork child of a generation worker to its device and cores, then warms up its own
+    models. Children of an upscale worker split their cores between their tiling threads.
+    """
+    if upscales_only(celery):
+        _set_upscale_threads()
+        return
+    if not consumes_generation(celery):
+        return
+    if _assignments:
+        pin(_assignments[_child_index() % len(_assignments)])
+    warm_up(celery)
+
+@signals.task_prerun.connect
+def _task_started(**kwargs):
+    if _stats is not None:
+        _stats[_slot(_child_index()) + 2] = time.time()
+
+@signals.task_postrun.connect
+def _task_finished(**kwargs):
+    if _stats is not None:
+        slot = _slot(_child_index())
+        started = _stats[slot + 2]
+        if started:
+            _stats[slot] += time.time() - started
+        _stats[slot + 1] += 1
+        _stats[slot + 2] = 0
@@ -0,0 +1,105 @@
+import os
+import io
+import json
+import time
+import base64
+import logging
+from app.db.redis_config import redis_client
+
+# Set up logging configuration
+logger = logging.getLogger(__name__)
+
+# Progress configuration
+PREVIEW_EVERY_STEPS = int(os.getenv("PROGRESS_PREVIEW_EVERY", 4))  # 0 disables previews
+PREVIEW_MAX_SIZE = int(os.getenv("PROGRESS_PREVIEW_SIZE", 256))
+PROGRESS_TTL_SECONDS = 3600
+TERMINAL_STATES = ("SUCCESS", "FAILURE")
+
+def progress_channel(task_id: str) -> str:
+    """Returns the Redis pub/sub channel progress events for a task are published on."""
+    return f"task:{task_id}:progress"
+
+def progress_key(task_id: str) -> str:
+    """Returns the Redis key holding the latest progress event for a task."""
+    return f"task:{task_id}:progress:latest"
+
+def _encode_preview(image) -> str:
+    image.thumbnail((PREVIEW_MAX_SIZE, PREVIEW_MAX_SIZE))
+    buffer = io.BytesIO()
+    image.save(buffer, format="WEBP", quality=60)
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+class ProgressReporter:
+    """
+    Publishes step-level progress for the tasks of one pipeline call.
+
+    Each event carries the step number, elapsed seconds and an ETA extrapolated from the
+    average step time so far. Events are published on the task's channel and the latest one is
+    also stored, so clients that connect mid-run start from the current state.
+    """
+
+    def __init__(self, task_ids: list, preview_every: int = PREVIEW_EVERY_STEPS):
+        self.task_ids = list(task_ids)
+        self.preview_every = preview_every
+        self.started_at = time.monotonic()
+
+    def _publish(self, task_id: str, event: dict) -> None:
+        payload = json.dumps(event)
+        try:
+            pipe = redis_client.pipeline()
+            pipe.publish(progress_channel(task_id), payload)
+            pipe.set(progress_key(task_id), payload, ex=PROGRESS_TTL_SECONDS)
+            pipe.execute()
+        except Exception as e:
+            # Progress is best effort and must never fail a generation
+            logger.warning(f"Failed to publish progress for task {task_id}: {e}")
+
+    def state(self, state: str, **fields) -> None:
+        """
+        Publishes a state transition such as 'QUEUED' or 'STARTED' for every task.
+
+        :param state: The new state.
+        :param fields: Extra fields to include in the event.
+        """
+        for task_id in self.task_ids:
+            self._publish(task_id, dict(fields, state=state))
+
+    def wants_preview(self, step: int, total_steps: int) -> bool:
+        """Checks whether a preview should be rendered after this step."""
+        return bool(self.preview_every) and step % self.preview_every == 0 and step < total_steps
+
+    def step(self, step: int, total_steps: int, previews: list = None) -> None:
+        """
+        Publishes progress after a completed denoising step.
+
+        :param step: The number of completed steps.
+        :param total_steps: The total number of steps in the run.
+        :param previews: Optional PIL preview images, one per task, in task order.
+        """
+        elapsed = time.monotonic() - self.started_at
+        eta = elapsed / step * (total_steps - step) if step else None
+        for i, task_id in enumerate(self.task_ids):
+            event = {
+                "state": "PROGRESS",
+                "step": step,
+                "totalSteps": total_steps,
+                "elapsedSeconds": round(elapsed, 2),
+                "etaSeconds": round(eta, 2) if eta is not None else None,
+            }
+            if previews is not None and i < len(previews):
+                event["preview"] = _encode_preview(previews[i])
+            self._publish(task_id, event)
+
+    def finish(self, state: str = "SUCCESS", results: dict = None) -> None:
+        """
+        Publishes the terminal event so streaming clients can stop listening.
+
+        :param state: 'SUCCESS' or 'FAILURE'.
+        :param results: Optional task results by task ID, included in each task's final event.
+        """
+        elapsed = time.monotonic() - self.started_at
+        for task_id in self.task_ids:
+            event = {"state": state, "elapsedSeconds": round(elapsed, 2)}
+            if results and task_id in results:
+                event["result"] = results[task_id]
+            self._publish(task_id, event)
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from celery import signals
+from app.db.redis_config import redis_client
+from app.inference.image.storage import get_storage
+from app.inference.image.derivatives import DERIVATIVE_WIDTHS, derivative_key, derivatives_key
+from app.inference.image.writer import PREFIXES, WRITTEN_KEY, BYTES_KEY, image_filename, image_key, files_key, durable_key
+from app.inference.image.result_cache import ResultCache
+from app.workers.metadata import MetadataBuffer
+
+# Set up logging configuration
+logger = logging.getLogger(__name__)
+
+# Retention configuration
+IMAGE_RETENTION_SECONDS = float(os.getenv("IMAGE_RETENTION_DAYS", 0)) * 86400  # 0 keeps images forever
+DRAFT_RETENTION_SECONDS = float(os.getenv("DRAFT_RETENTION_HOURS", 24)) * 3600
+ORPHAN_GRACE_SECONDS = float(os.getenv("ORPHAN_GRACE_HOURS", 6)) * 3600
+GC_INTERVAL_SECONDS = float(os.getenv("GC_INTERVAL_SECONDS", 600))  # 0 disables the background collector
+GC_BATCH_SIZE = int(os.getenv("GC_BATCH_SIZE", 200))
+GC_BATCH_PAUSE_SECONDS = float(os.getenv("GC_BATCH_PAUSE_SECONDS", 1.0))
+GC_MAX_BATCHES = int(os.getenv("GC_MAX_BATCHES", 50))  # Per pass; the rest waits for the next pass
+
+# Generation workers schedule each image's expiry here according to its tier; the image writer
+# maintains the rest of the index (WRITTEN_KEY, BYTES_KEY and the per-image file lists)
+EXPIRY_KEY = "images:expiry"
+REPORT_KEY = "gc:last_report"
+LOCK_KEY = "gc:lock"
+
+def retention_seconds(tier: str) -> float:
+    """Returns how long images of a tier are kept, or 0 to keep them forever."""
+    return DRAFT_RETENTION_SECONDS if tier == "draft" else IMAGE_RETENTION_SECONDS
+
+def schedule_expiry(image_id: str, tier: str, client=redis_client, now: float = None) -> None:
+    """Records when a generated image expires under the retention policy of its tier."""
+    seconds = retention_seconds(tier)
+    if seconds > 0:
+        client.zadd(EXPIRY_KEY, {image_id: (time.time() if now is None else now) + seconds})
+
+def _generation_key(image_id: str) -> str:
+    return f"image:{image_id}:generation"
+
+class ImageGarbageCollector:
+    """
+    Deletes expired and orphaned images, with every file and Redis key that belongs to them.
+
+    Candidates come from the Redis index, never from listing the storage backend:
+    - expired images are those whose time in the expiry index has passed;
+    - orphaned images are those written more than ORPHAN_GRACE_SECONDS ago that never got a
+      generation record (e.g. the worker died before recording the batch). Written images that
+      do have a record are dropped from the orphan check.
+
+    Files are listed per image in the index by the writer, so every variant and derivative is
+    removed, with one concurrent bulk delete per batch. Deletion runs in batches of `batch_size` with a pause in between, so a large
+    backlog does not saturate the disk.
+    """
+
+    def __init__(self, client=redis_client, batch_size: int = GC_BATCH_SIZE, pause_seconds: float = GC_BATCH_PAUSE_SECONDS,
+                 max_batches: int = GC_MAX_BATCHES, orphan_grace_seconds: float = ORPHAN_GRACE_SECONDS):
+        self.redis_client = client
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self.max_batches = max_batches
+        self.orphan_grace_seconds = orphan_grace_seconds
+        self.result_cache = ResultCache(client)
+        self.metadata = MetadataBuffer(client)
+
+    def _expired(self, now: float) -> list:
+        return [member.decode() for member in self.redis_client.zrangebyscore(EXPIRY_KEY, "-inf", now, start=0, num=self.batch_size)]
+
+    def _orphans(self, now: float) -> tuple:
+        """Returns the orphans among the next batch of candidates, and the number of candidates checked."""
+        candidates = [
+            member.decode() for member in
+            self.redis_client.zrangebyscore(WRITTEN_KEY, "-inf", now - self.orphan_grace_seconds, start=0, num=self.batch_size)
+        ]
+        if not candidates:
+            return [], 0
+        pipe = self.redis_client.pipeline()
+        for image_id in candidates:
+            pipe.exists(_generation_key(image_id))
+        recorded = pipe.execute()
+        confirmed = [image_id for image_id, exists in zip(candidates, recorded) if exists]
+        if confirmed:
+            # Past the grace period with a record: no longer an orphan candidate
+            self.redis_client.zrem(WRITTEN_KEY, *confirmed)
+        return [image_id for image_id, exists in zip(candidates, recorded) if not exists], len(candidates)
+
+    def delete(self, image_ids: list) -> dict:
+        """
+        Deletes images: every file listed in their index entry (plus the standard variants), their
+        `image:<id>:*` keys, their index entries, their result cache entries and their rows in
+        the `images` table.
+
+        :return: A report with the number of 'images', 'files' and 'bytes' deleted, and the IDs of
+                 the images that had files in 'deleted'.
+        """
+        pipe = self.redis_client.pipeline()
+        for image_id in image_ids:
+            pipe.hgetall(files_key(image_id))
+        listed = pipe.execute()
+
+        owners = {}  # Image ID by storage key
+        indexed_bytes = 0
+        for image_id, files in zip(image_ids, listed):
+            indexed_bytes += sum(int(size) for size in files.values())
+            keys = [key.decode() for key in files]
+            for variant in PREFIXES:
+                # Files the index missed, in the sharded and in the flat layout used before sharding
+                keys += [image_key(image_id, variant), image_filename(image_id, variant)]
+            keys += [derivative_key(image_id, width) for width in DERIVATIVE_WIDTHS]
+            owners.update((key, image_id) for key in keys)
+        deleted = get_storage().delete_many(list(owners))
+
+        found = {owners[key] for key in deleted}
+        report = {
+            "images": len(found),
+            "files": len(deleted),
+            "bytes": sum(deleted.values()),
+            "deleted": [image_id for image_id in image_ids if image_id in found],
+        }
+        for image_id in image_ids:
+            self.result_cache.forget_image(image_id)
+
+        pipe = self.redis_client.pipeline()
+        for image_id in image_ids:
+            pipe.delete(_generation_key(image_id), durable_key(image_id), files_key(image_id), derivatives_key(image_id))
+        if image_ids:
+            pipe.zrem(EXPIRY_KEY, *image_ids)
+            pipe.zrem(WRITTEN_KEY, *image_ids)
+        pipe.decrby(BYTES_KEY, indexed_bytes)
+        pipe.execute()
+        try:
+            self.metadata.delete(image_ids)
+        except Exception as e:
+            # The files are gone either way; rows left behind point at missing files
+            logger.error(f"Failed to delete the rows of {len(image_ids)} images: {e}")
+        return report
+
+    def run(self, now: float = None) -> dict:
+        """
+        Runs one collection pass of up to `max_batches` batches.
+
+        :return: A report with 'expired' and 'orphaned' image counts, 'files' and 'bytes'
+                 deleted, 'seconds' taken and 'remaining' (True if the pass stopped at its batch limit).
+        """
+        started = time.monotonic()
+        totals = {"expired": 0, "orphaned": 0, "files": 0, "bytes": 0, "remaining": False}
+        for batch in range(self.max_batches):
+            moment = time.time() if now is None else now
+            expired, (orphans, checked) = self._expired(moment), self._orphans(moment)
+            if not expired and not checked:
+                break
+            report = self.delete(list(dict.fromkeys(expired + orphans)))
+            totals["expired"] += len(expired)
+            totals["orphaned"] += len(orphans)
+            totals["files"] += report["files"]
+            totals["bytes"] += report["bytes"]
+            if batch == self.max_batches - 1:
+                totals["remaining"] = True
+            elif self.pause_seconds:
+                time.sleep(self.pause_seconds)
+        totals["seconds"] = round(time.monotonic() - started, 2)
+        if totals["files"] or totals["expired"] or totals["orphaned"]:
+            logger.info(
+                f"Image GC deleted {totals['expired']} expired and {totals['orphaned']} orphaned images "
+                f"({totals['files']} files), reclaiming {totals['bytes'] / 1024 ** 2:.1f} MB in {totals['seconds']}s"
+            )
+        return totals
+
+    def usage(self) -> dict:
+        """Returns the indexed disk usage and the number of images waiting to expire or be checked."""
+        pipe = self.redis_client.pipeline()
+        pipe.get(BYTES_KEY)
+        pipe.zcard(EXPIRY_KEY)
+        pipe.zcard(WRITTEN_KEY)
+        total, expiring, unchecked = pipe.execute()
+        return {"bytes": int(total or 0), "expiring": expiring, "unchecked": unchecked}
+
+def run_pass(client=redis_client) -> dict:
+    """
+    Runs a collection pass unless another process is running one, and stores its report.
+
+    :return: The report, or None if another process holds the lock.
+    """
+    token = uuid.uuid4().hex
+    if not client.set(LOCK_KEY, token, nx=True, ex=int(GC_INTERVAL_SECONDS or 600) * 2):
+        return None
+    try:
+        collector = ImageGarbageCollector(client)
+        report = collector.run()
+        report.update(finishedAt=time.time(), usageBytes=collector.usage()["bytes"])
+        client.set(REPORT_KEY, json.dumps(report))
+        return report
+    finally:
+        if client.get(LOCK_KEY) == token.encode():
+            client.delete(LOCK_KEY)
+
+def _collect_forever() -> None:
+    while True:
+        time.sleep(GC_INTERVAL_SECONDS)
+        try:
+            run_pass()
+        except Exception:
+            logger.exception("Image GC pass failed")
+
+@signals.worker_init.connect
+def start_collector(sender=None, **kwargs):
+    """Starts the background collector in every worker; the Redis lock lets one pass run at a time fleet-wide."""
+    if GC_INTERVAL_SECONDS > 0:
+        threading.Thread(target=_collect_forever, name="image-gc", daemon=True).start()
+
+if __name__ == "__main__":
+    # Runs a single pass, e.g. from cron when the background collector is disabled
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(run_pass(), indent=2))
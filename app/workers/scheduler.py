@@ -0,0 +1,385 @@
+import os
+import json
+import math
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from app.db.redis_config import redis_client
+from app.inference.image.flux.config import NUM_INFERENCE_STEPS
+
+# Set up logging configuration
+logger = logging.getLogger(__name__)
+
+# Scheduling configuration
+LANES = ("interactive", "batch")
+DEFAULT_LANE = "interactive"
+FAIR_QUEUE_QUANTUM = float(os.getenv("FAIR_QUEUE_QUANTUM", 1.0))  # Cost credited per round, in standard jobs
+BATCH_LANE_EVERY = int(os.getenv("BATCH_LANE_EVERY", 4))  # A waiting batch job goes next after this many interactive jobs in a row
+MAX_INFLIGHT_PER_USER = int(os.getenv("MAX_INFLIGHT_PER_USER", 32))  # In images, so the largest batch request fits
+MAX_QUEUE_WAIT_SECONDS = float(os.getenv("MAX_QUEUE_WAIT_SECONDS", 900))
+SECONDS_PER_COST_UNIT = float(os.getenv("SECONDS_PER_COST_UNIT", 20))  # Fleet-wide seconds per standard job
+INFLIGHT_TTL_SECONDS = 3600
+CLAIM_TTL_SECONDS = float(os.getenv("SCHED_CLAIM_TTL_SECONDS", 60))  # Claims of a worker silent for this long are recovered
+MAX_CLAIM_ATTEMPTS = int(os.getenv("SCHED_MAX_CLAIM_ATTEMPTS", 2))  # Jobs whose worker died this many times fail instead
+LOCK_TIMEOUT_SECONDS = 10
+
+# Releases the scheduler lock only if it is still held under the caller's token, so a holder that
+# outlived the lock's expiry never releases the lock of the process that took it over
+RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+def job_cost(width: int, height: int, steps: int) -> float:
+    """Returns the relative GPU cost of a job; a standard-tier 1024x1024 generation costs 1."""
+    return width * height * steps / (1024 * 1024 * NUM_INFERENCE_STEPS)
+
+def _image_ids(job: dict) -> list:
+    """Returns the task IDs of the images a job produces; each takes an in-flight slot."""
+    return job.get("task_ids") or [job["task_id"]]
+
+class AdmissionError(Exception):
+    """Raised when a job is refused; `retry_after` is the suggested wait in seconds."""
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class FairScheduler:
+    """
+    Per-user fair queue for image jobs, kept in Redis in front of the workers.
+
+    Each user has a FIFO queue per lane. Within a lane, users are served by deficit round-robin:
+    users are visited in a ring and credited FAIR_QUEUE_QUANTUM per visit, and a job is served
+    once its user's credit covers the job's cost. A user who submits hundreds of jobs therefore
+    gets the same share as everyone else instead of the whole queue, and cheap jobs (drafts)
+    go through proportionally more often.
+
+    The 'interactive' lane is served before the 'batch' lane, except that a waiting batch job
+    goes next after BATCH_LANE_EVERY interactive jobs in a row, so batch work is never starved.
+
+    Admission control refuses new jobs (see `AdmissionError`) when the user already has
+    MAX_INFLIGHT_PER_USER images queued or running, or when the estimated wait of the lane passes
+    MAX_QUEUE_WAIT_SECONDS.
+
+    Jobs a worker takes are claimed in its name until it finishes them. Workers heartbeat while
+    they run; `recover` puts the claims of a worker that stopped heartbeating (e.g. it crashed or
+    was killed mid-batch) back at the head of their users' queues, so no job is lost with its worker.
+    """
+
+    def __init__(self, client=redis_client, quantum: float = FAIR_QUEUE_QUANTUM, batch_lane_every: int = BATCH_LANE_EVERY,
+                 max_inflight: int = MAX_INFLIGHT_PER_USER, max_wait_seconds: float = MAX_QUEUE_WAIT_SECONDS,
+                 seconds_per_cost_unit: float = SECONDS_PER_COST_UNIT, claim_ttl_seconds: float = CLAIM_TTL_SECONDS,
+                 max_claim_attempts: int = MAX_CLAIM_ATTEMPTS):
+        if quantum <= 0:
+            raise ValueError(f"The fair queue quantum must be positive, got {quantum}")
+        self.redis_client = client
+        self.quantum = quantum
+        self.batch_lane_every = batch_lane_every
+        self.max_inflight = max_inflight
+        self.max_wait_seconds = max_wait_seconds
+        self.seconds_per_cost_unit = seconds_per_cost_unit
+        self.claim_ttl_seconds = claim_ttl_seconds
+        self.max_claim_attempts = max_claim_attempts
+        self._release_lock = client.register_script(RELEASE_LOCK)
+
+    def _ring_key(self, lane: str) -> str:
+        return f"sched:{lane}:users"
+
+    def _queue_key(self, lane: str, user_id: str) -> str:
+        return f"sched:{lane}:user:{user_id}"
+
+    def _deficit_key(self, lane: str) -> str:
+        return f"sched:{lane}:deficit"
+
+    def _cost_key(self, lane: str) -> str:
+        return f"sched:{lane}:queued_cost"
+
+    def _inflight_key(self, user_id: str) -> str:
+        return f"sched:inflight:{user_id}"
+
+    def _claim_key(self, claimant: str) -> str:
+        return f"sched:claim:{claimant}"
+
+    _streak_key = "sched:interactive_streak"
+    # Heartbeat deadline of every worker holding claims
+    _claimants_key = "sched:claimants"
+
+    @contextmanager
+    def _lock(self):
+        # Queue updates read and rewrite several keys, so API and worker processes take turns.
+        # The lock expires on its own if its holder dies. Waiting for it blocks, so the API calls
+        # into the scheduler from its thread pool, never from the event loop.
+        token = uuid.uuid4().hex
+        while not self.redis_client.set("sched:lock", token, nx=True, ex=LOCK_TIMEOUT_SECONDS):
+            time.sleep(0.005)
+        try:
+            yield
+        finally:
+            self._release_lock(keys=["sched:lock"], args=[token])
+
+    def queued_cost(self, lane: str) -> float:
+        return max(0.0, float(self.redis_client.get(self._cost_key(lane)) or 0))
+
+    def estimated_wait(self, lane: str = DEFAULT_LANE) -> float:
+        """
+        Estimates how long a new job in `lane` waits before it starts. Interactive jobs only
+        wait for interactive work; batch jobs wait for both lanes.
+        """
+        lanes = LANES[:LANES.index(lane) + 1]
+        return sum(self.queued_cost(name) for name in lanes) * self.seconds_per_cost_unit
+
+    def depths(self) -> dict:
+        """
+        Counts the jobs of every lane from the queues themselves: 'queued' in the users' queues and
+        'running' in the claims of workers.
+        """
+        depths = {lane: {"queued": 0, "running": 0} for lane in LANES}
+        pipe = self.redis_client.pipeline()
+        for lane in LANES:
+            pipe.lrange(self._ring_key(lane), 0, -1)
+        pipe.zrange(self._claimants_key, 0, -1)
+        *rings, claimants = pipe.execute()
+
+        pipe = self.redis_client.pipeline()
+        for lane, users in zip(LANES, rings):
+            for user_id in dict.fromkeys(users):
+                pipe.llen(self._queue_key(lane, user_id.decode()))
+        for claimant in claimants:
+            pipe.lrange(self._claim_key(claimant.decode()), 0, -1)
+        results = iter(pipe.execute())
+        for lane, users in zip(LANES, rings):
+            depths[lane]["queued"] = sum(next(results) for _ in dict.fromkeys(users))
+        for claimed in results:
+            for job in claimed:
+                lane = json.loads(job).get("lane", DEFAULT_LANE)
+                if lane in depths:
+                    depths[lane]["running"] += 1
+        return depths
+
+    def inflight(self, user_id: str) -> int:
+        """Returns the number of the user's images that are queued or running."""
+        key = self._inflight_key(user_id)
+        # Entries of jobs whose worker died are never finished; they expire instead
+        self.redis_client.zremrangebyscore(key, 0, time.time() - INFLIGHT_TTL_SECONDS)
+        return self.redis_client.zcard(key)
+
+    def admit(self, user_id: str, lane: str = DEFAULT_LANE, jobs: int = 1) -> None:
+        """
+        Checks whether new jobs of the user may be queued.
+
+        :param jobs: The number of images the new jobs produce; each takes an in-flight slot.
+        :raises AdmissionError: If the jobs would pass the user's in-flight cap or the lane is too backed up.
+        """
+        if self.inflight(user_id) + jobs > self.max_inflight:
+            raise AdmissionError(
+                f"Too many jobs in flight (limit {self.max_inflight})",
+                retry_after=max(1, math.ceil(self.seconds_per_cost_unit)),
+            )
+        wait = self.estimated_wait(lane)
+        if wait > self.max_wait_seconds:
+            raise AdmissionError(
+                f"Queue is full (estimated wait {wait:.0f}s)",
+                retry_after=max(1, math.ceil(wait - self.max_wait_seconds)),
+            )
+
+    def submit(self, job: dict, user_id: str, lane: str = DEFAULT_LANE, on_admitted=None) -> None:
+        """
+        Admits and queues a job.
+
+        :param job: The job, with at least 'task_id', 'bucket' and 'cost' keys.
+        :param on_admitted: Optional callback, see `submit_many`.
+        :raises AdmissionError: If the job is refused (see `admit`).
+        """
+        self.submit_many([job], user_id, lane, on_admitted)
+
+    def submit_many(self, jobs: list, user_id: str, lane: str = DEFAULT_LANE, on_admitted=None) -> None:
+        """
+        Admits and queues jobs of one request together: either all of them are queued or none is.
+
+        :param jobs: The jobs, each with at least 'task_id', 'bucket' and 'cost' keys. A job producing
+                     several images lists their task IDs in 'task_ids'.
+        :param on_admitted: Optional callback, called with no arguments once the jobs are admitted
+                            and before any worker can take them, e.g. to publish their 'QUEUED' state.
+                            Refused jobs never reach it.
+        :raises AdmissionError: If the jobs are refused (see `admit`).
+        """
+        jobs = [dict(job, user_id=user_id, lane=lane) for job in jobs]
+        now = time.time()
+        slots = {task_id: now for job in jobs for task_id in _image_ids(job)}
+        with self._lock():
+            # Checked under the lock that guards the counters, so concurrent submissions cannot
+            # all pass a check that only some of them fit under
+            self.admit(user_id, lane, jobs=len(slots))
+            if on_admitted is not None:
+                # Workers only pop under the lock, so nothing they publish can come before this
+                on_admitted()
+            queue_length = self.redis_client.rpush(self._queue_key(lane, user_id), *[json.dumps(job) for job in jobs])
+            pipe = self.redis_client.pipeline()
+            if queue_length == len(jobs):
+                # The user had nothing queued in this lane, so they are not in the ring yet
+                pipe.rpush(self._ring_key(lane), user_id)
+            pipe.zadd(self._inflight_key(user_id), slots)
+            pipe.expire(self._inflight_key(user_id), INFLIGHT_TTL_SECONDS)
+            pipe.incrbyfloat(self._cost_key(lane), sum(job["cost"] for job in jobs))
+            pipe.execute()
+
+    def finish(self, jobs: list, claimant: str = None) -> None:
+        """Releases the in-flight slots of finished (or failed) jobs, and the claim they were taken under."""
+        pipe = self.redis_client.pipeline()
+        for job in jobs:
+            pipe.zrem(self._inflight_key(job["user_id"]), *_image_ids(job))
+        if claimant is not None:
+            pipe.delete(self._claim_key(claimant))
+            pipe.zrem(self._claimants_key, claimant)
+        pipe.execute()
+
+    @contextmanager
+    def heartbeat(self, claimant: str):
+        """Keeps the claim of a worker alive while it runs the jobs it took."""
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.claim_ttl_seconds / 3):
+                try:
+                    self.redis_client.zadd(self._claimants_key, {claimant: time.time() + self.claim_ttl_seconds}, xx=True)
+                except Exception as e:
+                    logger.warning(f"Failed to renew the claim of {claimant}: {e}")
+
+        thread = threading.Thread(target=beat, name="claim-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def recover(self, now: float = None) -> tuple:
+        """
+        Takes back the jobs of workers that stopped heartbeating. Each job goes back to the head of
+        its user's queue, in the order it was taken, and keeps its in-flight slots; a job whose
+        worker has died MAX_CLAIM_ATTEMPTS times is failed instead, since it may be what kills them.
+
+        :return: A tuple of the requeued jobs and the failed jobs. The failed jobs' slots are released.
+        """
+        now = time.time() if now is None else now
+        requeued, failed = [], []
+        with self._lock():
+            for claimant in self.redis_client.zrangebyscore(self._claimants_key, "-inf", now):
+                claimant = claimant.decode()
+                jobs = [json.loads(job) for job in self.redis_client.lrange(self._claim_key(claimant), 0, -1)]
+                pipe = self.redis_client.pipeline()
+                for job in reversed(jobs):
+                    job["attempts"] = job.get("attempts", 0) + 1
+                    if job["attempts"] >= self.max_claim_attempts:
+                        failed.append(job)
+                        pipe.zrem(self._inflight_key(job["user_id"]), *_image_ids(job))
+                        continue
+                    requeued.append(job)
+                    lane, user_id = job["lane"], job["user_id"]
+                    pipe.lpush(self._queue_key(lane, user_id), json.dumps(job))
+                    # Re-added in case the user's queue was empty; duplicates are removed below
+                    pipe.rpush(self._ring_key(lane), user_id)
+                    pipe.zadd(self._inflight_key(user_id), {task_id: now for task_id in _image_ids(job)})
+                    pipe.expire(self._inflight_key(user_id), INFLIGHT_TTL_SECONDS)
+                    pipe.incrbyfloat(self._cost_key(lane), job["cost"])
+                pipe.delete(self._claim_key(claimant))
+                pipe.zrem(self._claimants_key, claimant)
+                pipe.execute()
+                logger.warning(f"Recovered {len(jobs)} job(s) of lost worker {claimant}")
+            for lane in {job["lane"] for job in requeued}:
+                users = [user.decode() for user in self.redis_client.lrange(self._ring_key(lane), 0, -1)]
+                pipe = self.redis_client.pipeline()
+                pipe.delete(self._ring_key(lane))
+                pipe.rpush(self._ring_key(lane), *dict.fromkeys(users))
+                pipe.execute()
+        requeued.reverse()
+        failed.reverse()
+        return requeued, failed
+
+    def _lane_order(self) -> tuple:
+        streak = int(self.redis_client.get(self._streak_key) or 0)
+        if streak >= self.batch_lane_every:
+            return tuple(reversed(LANES))
+        return LANES
+
+    def pop(self, bucket: str = None, claimant: str = None):
+        """
+        Takes the next job to run.
+
+        :param bucket: When given, only a job of this bucket is taken, from the first user in the
+                       ring whose next job matches; the cost is still charged to that user, so
+                       jobs taken to fill a batch count against their user's share.
+        :param claimant: The worker taking the job, e.g. its task ID. The job is claimed in its
+                         name until `finish`, and recovered if it stops heartbeating first.
+        :return: The job dictionary, or None if there is no (matching) job.
+        """
+        with self._lock():
+            for lane in self._lane_order():
+                job = self._pop_lane(lane, bucket)
+                if job is not None:
+                    pipe = self.redis_client.pipeline()
+                    if lane == DEFAULT_LANE:
+                        pipe.incr(self._streak_key)
+                    else:
+                        pipe.set(self._streak_key, 0)
+                    pipe.incrbyfloat(self._cost_key(lane), -job["cost"])
+                    if claimant is not None:
+                        pipe.rpush(self._claim_key(claimant), json.dumps(job))
+                        pipe.zadd(self._claimants_key, {claimant: time.time() + self.claim_ttl_seconds})
+                    pipe.execute()
+                    return job
+        return None
+
+    def _pop_lane(self, lane: str, bucket: str = None):
+        users = [user.decode() for user in self.redis_client.lrange(self._ring_key(lane), 0, -1)]
+        if not users:
+            return None
+        pipe = self.redis_client.pipeline()
+        for user in users:
+            pipe.lindex(self._queue_key(lane, user), 0)
+        heads = pipe.execute()
+        deficits = self.redis_client.hmget(self._deficit_key(lane), users)
+        ring = [
+            (user, json.loads(head), float(deficit or 0))
+            for user, head, deficit in zip(users, heads, deficits) if head is not None
+        ]
+        if not ring:
+            self.redis_client.delete(self._ring_key(lane))
+            return None
+
+        if bucket is not None:
+            matching = [i for i, (_, job, _) in enumerate(ring) if job["bucket"] == bucket]
+            if not matching:
+                return None
+            chosen = matching[0]
+        else:
+            # Deficit round-robin: rotate the ring, crediting each visited user, until the user
+            # at the front can afford their next job. The rounds that takes are computed in one
+            # step: the first user needing the fewest credits is served, users ahead of them in
+            # the ring are credited once more than the rest, and the ring then starts at them.
+            rounds = [max(0, math.ceil((job["cost"] - deficit) / self.quantum - 1e-9)) for _, job, deficit in ring]
+            first = min(range(len(ring)), key=lambda i: (rounds[i], i))
+            credits = [rounds[first] + (1 if i < first else 0) for i in range(len(ring))]
+            ring = [(user, job, deficit + self.quantum * credit) for (user, job, deficit), credit in zip(ring, credits)]
+            ring = ring[first:] + ring[:first]
+            chosen = 0
+        user, job, deficit = ring[chosen]
+        ring[chosen] = (user, job, deficit - job["cost"])
+
+        self.redis_client.lpop(self._queue_key(lane, user))
+        emptied = self.redis_client.llen(self._queue_key(lane, user)) == 0
+        pipe = self.redis_client.pipeline()
+        pipe.delete(self._ring_key(lane))
+        order = [entry for entry in ring if not (emptied and entry[0] == user)]
+        if order:
+            pipe.rpush(self._ring_key(lane), *[entry[0] for entry in order])
+            pipe.hset(self._deficit_key(lane), mapping={entry[0]: entry[2] for entry in order})
+        if emptied:
+            # An idle user starts from zero credit the next time they queue something
+            pipe.hdel(self._deficit_key(lane), user)
+        pipe.execute()
+        return job
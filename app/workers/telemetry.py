@@ -0,0 +1,176 @@
+import os
+import time
+import bisect
+import logging
+from app.db.redis_config import redis_client
+from app.workers.scheduler import LANES, DEFAULT_LANE
+
+# Set up logging configuration
+logger = logging.getLogger(__name__)
+
+# Telemetry configuration
+TELEMETRY_WINDOW_SECONDS = int(os.getenv("TELEMETRY_WINDOW_SECONDS", 300))
+TELEMETRY_WINDOWS = int(os.getenv("TELEMETRY_WINDOWS", 12))  # Durations are kept for WINDOWS * WINDOW_SECONDS (1 hour)
+QUEUES = LANES + ("upscale",)
+STAGES = ("wait", "generate", "upscale")
+
+# Upper bounds of the duration histogram buckets, in seconds; the last bucket is open-ended
+DURATION_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1800)
+
+# Resets counters that drifted below zero, e.g. after a reset while jobs were running
+CLAMP_COUNTERS = """
+for _, field in ipairs(ARGV) do
+    if tonumber(redis.call('HGET', KEYS[1], field) or 0) < 0 then
+        redis.call('HSET', KEYS[1], field, 0)
+    end
+end
+return 0
+"""
+
+class QueueTelemetry:
+    """
+    Constant-time queue and duration telemetry kept in Redis.
+
+    The enqueue path and the workers maintain per-queue 'queued' and 'running' counters, so
+    reading the queue depth never scans the queue. Stage durations ('wait' from enqueue to
+    start, 'generate', 'upscale') are recorded per aspect ratio in fixed-bucket histograms, one
+    per time window; reads add up the last TELEMETRY_WINDOWS windows, so old samples age out
+    without any cleanup and every read touches a fixed number of keys.
+
+    The counters drift when a process dies between a job's steps, so `reconcile` periodically
+    sets them from the scheduler's queues.
+    """
+
+    def __init__(self, client=redis_client):
+        self.redis_client = client
+        self._clamp_counters = client.register_script(CLAMP_COUNTERS)
+
+    def _counter_key(self, queue: str) -> str:
+        return f"telemetry:queue:{queue}"
+
+    def _histogram_key(self, stage: str, aspect_ratio: str, window: int) -> str:
+        return f"telemetry:duration:{stage}:{aspect_ratio}:{window}"
+
+    def _update(self, queue: str, queued: int = 0, running: int = 0) -> None:
+        try:
+            pipe = self.redis_client.pipeline()
+            if queued:
+                pipe.hincrby(self._counter_key(queue), "queued", queued)
+            if running:
+                pipe.hincrby(self._counter_key(queue), "running", running)
+            pipe.execute()
+        except Exception as e:
+            # Telemetry is best effort and must never fail a job
+            logger.warning(f"Failed to update telemetry of queue '{queue}': {e}")
+
+    def queued(self, queue: str, count: int = 1) -> None:
+        """Counts jobs added to a queue."""
+        self._update(queue, queued=count)
+
+    def started(self, queue: str, count: int = 1) -> None:
+        """Moves jobs of a queue from queued to running."""
+        self._update(queue, queued=-count, running=count)
+
+    def requeued(self, queue: str, count: int = 1) -> None:
+        """Moves running jobs of a queue back to queued, e.g. when their worker was lost."""
+        self._update(queue, queued=count, running=-count)
+
+    def finished(self, queue: str, count: int = 1) -> None:
+        """Counts running jobs of a queue as done, whether they succeeded or not."""
+        self._update(queue, running=-count)
+
+    def reconcile(self, depths: dict) -> None:
+        """
+        Sets the counters of the queues in `depths` (see `FairScheduler.depths`) to their real
+        'queued' and 'running' counts, and resets those of the other queues that went below zero.
+        """
+        try:
+            pipe = self.redis_client.pipeline()
+            for queue in QUEUES:
+                if queue in depths:
+                    counts = depths[queue]
+                    pipe.hset(self._counter_key(queue), mapping={
+                        "queued": max(0, counts["queued"]), "running": max(0, counts["running"]),
+                    })
+                else:
+                    self._clamp_counters(keys=[self._counter_key(queue)], args=["queued", "running"], client=pipe)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to reconcile queue telemetry: {e}")
+
+    def record_duration(self, stage: str, aspect_ratio: str, seconds: float, now: float = None) -> None:
+        """Adds a duration sample to the current window of the stage's histogram for the aspect ratio."""
+        window = int((time.time() if now is None else now) // TELEMETRY_WINDOW_SECONDS)
+        key = self._histogram_key(stage, aspect_ratio, window)
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.hincrby(key, bisect.bisect_left(DURATION_BUCKETS, seconds), 1)
+            pipe.hincrbyfloat(key, "sum", seconds)
+            pipe.expire(key, TELEMETRY_WINDOW_SECONDS * (TELEMETRY_WINDOWS + 1))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to record '{stage}' duration: {e}")
+
+    def counts(self) -> dict:
+        """Returns the 'queued' and 'running' counts of every queue."""
+        pipe = self.redis_client.pipeline()
+        for queue in QUEUES:
+            pipe.hmget(self._counter_key(queue), "queued", "running")
+        counts = {}
+        for queue, (queued, running) in zip(QUEUES, pipe.execute()):
+            # Clamped, since counters reset while jobs were running would go negative
+            counts[queue] = {"queued": max(0, int(queued or 0)), "running": max(0, int(running or 0))}
+        return counts
+
+    def duration_stats(self, stage: str, aspect_ratio: str, now: float = None) -> dict:
+        """
+        Summarizes the recent durations of a stage for an aspect ratio.
+
+        :return: A dictionary with 'count', 'mean', 'p50' and 'p90' (seconds, None without samples).
+                 Percentiles are the upper bound of the histogram bucket they fall in.
+        """
+        current = int((time.time() if now is None else now) // TELEMETRY_WINDOW_SECONDS)
+        pipe = self.redis_client.pipeline()
+        for window in range(current - TELEMETRY_WINDOWS + 1, current + 1):
+            pipe.hgetall(self._histogram_key(stage, aspect_ratio, window))
+        histogram, total = [0] * (len(DURATION_BUCKETS) + 1), 0.0
+        for fields in pipe.execute():
+            for field, value in fields.items():
+                if field == b"sum":
+                    total += float(value)
+                else:
+                    histogram[int(field)] += int(value)
+        count = sum(histogram)
+        if not count:
+            return {"count": 0, "mean": None, "p50": None, "p90": None}
+        return {
+            "count": count,
+            "mean": round(total / count, 2),
+            "p50": self._percentile(histogram, count, 0.5),
+            "p90": self._percentile(histogram, count, 0.9),
+        }
+
+    @staticmethod
+    def _percentile(histogram: list, count: int, fraction: float) -> float:
+        seen = 0
+        for index, bucket_count in enumerate(histogram):
+            seen += bucket_count
+            if seen >= fraction * count:
+                return DURATION_BUCKETS[min(index, len(DURATION_BUCKETS) - 1)]
+        return DURATION_BUCKETS[-1]
+
+    def estimated_wait(self, aspect_ratio: str, lane: str = DEFAULT_LANE, counts: dict = None) -> float:
+        """
+        Estimates the seconds until a new job starts: the jobs ahead of it, shared across the
+        generation processes currently busy, times the recent mean generation time of the aspect
+        ratio. Interactive jobs only wait for interactive work; batch jobs wait for both lanes.
+
+        :return: The estimate, or None while there are no generation samples for the aspect ratio.
+        """
+        counts = counts or self.counts()
+        ahead = sum(counts[name]["queued"] for name in LANES[:LANES.index(lane) + 1])
+        busy = sum(counts[name]["running"] for name in LANES)
+        mean = self.duration_stats("generate", aspect_ratio)["mean"]
+        if mean is None:
+            return None
+        return round(ahead / max(1, busy) * mean, 1)
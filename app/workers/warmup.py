@@ -0,0 +1,44 @@
+import logging
+from celery import signals
+from app.inference.warmup import ModelWarmup, configured_models
+
+# Set up logging configuration
+logger = logging.getLogger(__name__)
+
+# Models each queue needs, used when WARMUP_MODELS is not set
+QUEUE_MODELS = {
+    "celery": ["flux"],
+    "upscale": ["realesrgan"],
+}
+
+warmup = None
+
+def _queue_models(app) -> list:
+    queues = app.amqp.queues.consume_from
+    return list(dict.fromkeys(model for queue in queues for model in QUEUE_MODELS.get(queue, [])))
+
+def is_prefork(pool_cls) -> bool:
+    name = pool_cls if isinstance(pool_cls, str) else pool_cls.__module__
+    return name in ("prefork", "processes") or name.endswith(".prefork")
+
+def warm_up(app) -> None:
+    """Warms up the models of the worker's queues in the current process."""
+    global warmup
+    warmup = ModelWarmup("worker", configured_models(_queue_models(app)))
+    if warmup.models:
+        logger.info(f"Warming up {', '.join(warmup.models)} before consuming tasks")
+        warmup.run()
+
+@signals.worker_init.connect
+def warm_up_worker(sender=None, **kwargs):
+    """
+    Warms up solo and thread pool workers, which run tasks in the main process. The consumer
+    is only started after this handler returns, so no task is taken before the models are warm.
+    """
+    if not is_prefork(sender.pool_cls):
+        warm_up(sender.app)
+
+# Prefork children of the generation worker are pinned and then warmed up by
+# `app.workers.pool.init_pool_child`; other prefork workers (derivatives) need no model. They
+# are only handed tasks once it returns, and the parent never loads a model, so no CUDA
+# context is inherited across the fork.
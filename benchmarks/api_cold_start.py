@@ -0,0 +1,89 @@
+"""
+API cold start: time to import `main` and time from process start to the first served request.
+
+Each run starts a fresh interpreter, so nothing is shared between runs. The import measurement
+also lists which inference libraries (torch, diffusers, transformers, llama_cpp) the import pulled
+in, which should be none. The first-request measurement starts a single uvicorn worker and polls
+GET /openapi.json until it answers. Warm-up is disabled (WARMUP_MODELS=none) so the numbers only
+cover the web process itself.
+
+The app reads its usual environment (database URL, GOOGLE_CLIENT_ID, ...); no database or Redis
+connection is opened to serve the measured request.
+
+Usage:
+    python -m benchmarks.api_cold_start --modes enqueue full --runs 5
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+from app.inference.registry import loaded_heavy_modules
+print(json.dumps({"seconds": elapsed, "heavy": loaded_heavy_modules()}))
+"""
+
+def _environment(mode: str) -> dict:
+    env = dict(os.environ, API_MODE=mode, WARMUP_MODELS="none")
+    env.setdefault("GOOGLE_CLIENT_ID", "benchmark")
+    return env
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def measure_import(mode: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE], env=_environment(mode),
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def measure_first_request(mode: str, timeout: float = 60) -> float:
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=_environment(mode), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/openapi.json", timeout=1) as response:
+                    response.read()
+                return time.perf_counter() - started
+            except OSError:
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with status {server.returncode}")
+                time.sleep(0.01)
+        raise TimeoutError(f"No response within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=["enqueue", "full"])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'import s':>10}{'first request s':>18}  heavy modules")
+    for mode in args.modes:
+        imports = [measure_import(mode) for _ in range(args.runs)]
+        first_requests = [measure_first_request(mode) for _ in range(args.runs)]
+        heavy = sorted({module for run in imports for module in run["heavy"]})
+        print(f"{mode:<10}{statistics.median(r['seconds'] for r in imports):>10.2f}"
+              f"{statistics.median(first_requests):>18.2f}  {', '.join(heavy) or '-'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Async database path: request throughput and event-loop responsiveness as database latency grows.
+
+Serves an authenticated endpoint two ways, in-process through httpx's ASGI transport:
+- `blocking`: the previous `get_current_user`, a synchronous Session query inside an `async def`
+  dependency, so every lookup stalls the event loop for a full database round trip;
+- `async`: the current `get_current_user` on an AsyncSession, which awaits the round trip.
+
+Database latency is simulated on SQLite by sleeping in the driver before every statement, where
+a network round trip to Postgres would be spent: in the calling thread for the blocking driver,
+in aiosqlite's connection thread for the async one. Both engines use the pool settings from
+`app/db/database.py` (DB_MAX_OVERFLOW, DB_POOL_PRE_PING, ...), with `--pool-size` connections
+(the concurrency by default, so the pool is not what limits either mode). With a smaller pool the
+blocking mode can stall for DB_POOL_TIMEOUT: the event loop blocks waiting for a connection that
+only a session close, scheduled on that same loop, would return. While the load runs, a probe
+measures the event loop's lag: how late a task sleeping for 10 ms wakes up. Every other request
+the process serves (event streams, requests that never touch the database) waits that long too.
+
+Usage:
+    python -m benchmarks.async_db_concurrency --latencies-ms 0 5 20 50 --requests 500 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+import aiosqlite
+import httpx
+from fastapi import Depends, FastAPI, Request
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from app.api.auth import create_jwt_token, get_current_user, validate_jwt_token
+from app.db.database import POOL_OPTIONS, get_async_db
+from app.db.model.user import get_user_from_uuid
+from app.db.models import Image, User
+
+PROBE_INTERVAL_SECONDS = 0.01
+
+def _seed(path: str) -> uuid.UUID:
+    engine = create_engine(f"sqlite:///{path}")
+    User.metadata.create_all(engine, tables=[User.__table__, Image.__table__])
+    user_id = uuid.uuid4()
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{"uuid": user_id, "email": "bench@example.com", "name": "bench", "updated_at": datetime(2026, 1, 1)}])
+    engine.dispose()
+    return user_id
+
+def _app(mode: str, path: str, latency: float, pool: dict):
+    """Builds the app for one mode; returns it with a coroutine that disposes of its engine."""
+    delay = (lambda statement: time.sleep(latency)) if latency else None
+    app = FastAPI()
+
+    if mode == "blocking":
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, **pool)
+        if delay:
+            event.listen(engine, "connect", lambda connection, record: connection.set_trace_callback(delay))
+        sessions = sessionmaker(bind=engine)
+
+        def get_db():
+            db = sessions()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        async def current_user(request: Request, db: Session = Depends(get_db)):
+            # What get_current_user did before: a synchronous query inside `async def`
+            payload = validate_jwt_token(request.cookies["access_token"])
+            return get_user_from_uuid(uuid.UUID(payload["sub"]), db)
+
+        async def dispose():
+            engine.dispose()
+    else:
+        async def connect():
+            connection = await aiosqlite.connect(path)
+            if delay:
+                await connection.set_trace_callback(delay)
+            return connection
+
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}", async_creator=connect, **pool)
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+        async def override():
+            async with sessions() as db:
+                yield db
+
+        app.dependency_overrides[get_async_db] = override
+        current_user = get_current_user
+        dispose = engine.dispose
+
+    @app.get("/me")
+    async def me(user: User = Depends(current_user)):
+        return {"email": user.email}
+
+    return app, dispose
+
+async def _run(app, token: str, requests: int, concurrency: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies={"access_token": token}) as client:
+        await client.get("/me")  # Opens the first connection before timing
+        semaphore = asyncio.Semaphore(concurrency)
+        probes, running = [], True
+
+        async def request():
+            async with semaphore:
+                response = await client.get("/me")
+                response.raise_for_status()
+
+        async def probe():
+            while running:
+                started = time.perf_counter()
+                await asyncio.sleep(PROBE_INTERVAL_SECONDS)
+                probes.append(time.perf_counter() - started - PROBE_INTERVAL_SECONDS)
+
+        prober = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(request() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+        running = False
+        await prober
+    return {
+        "requestsPerSecond": round(requests / elapsed, 1),
+        "loopLagP50Ms": round(statistics.median(probes) * 1000, 2),
+        "loopLagMaxMs": round(max(probes) * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latencies-ms", type=float, nargs="+", default=[0, 5, 20, 50])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--pool-size", type=int, default=None, help="Connections per engine; the concurrency by default")
+    parser.add_argument("--modes", nargs="+", default=["blocking", "async"], choices=["blocking", "async"])
+    args = parser.parse_args()
+
+    pool = dict(POOL_OPTIONS, pool_size=args.pool_size or args.concurrency)
+    path = os.path.join(tempfile.mkdtemp(), "users.db")
+    user_id = _seed(path)
+    token = create_jwt_token({"sub": str(user_id), "email": "bench@example.com", "name": "bench"}, timedelta(hours=1))
+    results = []
+    for latency_ms in args.latencies_ms:
+        for mode in args.modes:
+            app, dispose = _app(mode, path, latency_ms / 1000, pool)
+
+            async def measure():
+                try:
+                    return await _run(app, token, args.requests, args.concurrency)
+                finally:
+                    await dispose()
+
+            result = {"mode": mode, "latencyMs": latency_ms, **asyncio.run(measure())}
+            results.append(result)
+            print(json.dumps(result))
+    print(json.dumps({"requests": args.requests, "concurrency": args.concurrency, "pool": pool, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
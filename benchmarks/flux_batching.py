@@ -0,0 +1,133 @@
+"""
+CPU benchmark: Flux throughput against batch size.
+
+Builds a tiny, randomly initialised Flux pipeline (same component layout as FLUX.1, a few
+thousand parameters) and times `FluxPipelineManager.generate_images` at increasing batch sizes.
+The absolute numbers are meaningless; the images/minute ratio between batch sizes is what the
+worker's micro-batching buys.
+
+Usage:
+    python -m benchmarks.flux_batching --batch-sizes 1 2 4 8 --repeats 3
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+import torch
+from diffusers import AutoencoderKL, FlowMatchEulerDiscreteScheduler, FluxPipeline, FluxTransformer2DModel
+from transformers import CLIPTextConfig, CLIPTextModel, CLIPTokenizer, T5Config, T5EncoderModel
+from app.inference.image.flux.embedding_cache import PromptEmbeddingCache
+from app.inference.image.flux.model import FluxPipelineManager
+
+def build_tiny_tokenizer(model_max_length: int) -> CLIPTokenizer:
+    """Builds a character-level tokenizer from a generated vocabulary, so no download is needed."""
+    symbols = [chr(i) for i in range(33, 127)]
+    vocab = {token: i for i, token in enumerate(symbols + [s + "</w>" for s in symbols] + ["<|startoftext|>", "<|endoftext|>"])}
+    directory = tempfile.mkdtemp(prefix="tiny-tokenizer-")
+    with open(os.path.join(directory, "vocab.json"), "w") as f:
+        json.dump(vocab, f)
+    with open(os.path.join(directory, "merges.txt"), "w") as f:
+        f.write("#version: 0.2\n")
+    return CLIPTokenizer(os.path.join(directory, "vocab.json"), os.path.join(directory, "merges.txt"), model_max_length=model_max_length)
+
+def build_tiny_pipeline() -> FluxPipeline:
+    """Builds a random-weight Flux pipeline small enough to run on CPU."""
+    torch.manual_seed(0)
+    tokenizer = build_tiny_tokenizer(model_max_length=77)
+    transformer = FluxTransformer2DModel(
+        patch_size=1,
+        in_channels=4,
+        num_layers=1,
+        num_single_layers=1,
+        attention_head_dim=16,
+        num_attention_heads=2,
+        joint_attention_dim=32,
+        pooled_projection_dim=32,
+        axes_dims_rope=[4, 4, 8],
+    )
+    text_encoder = CLIPTextModel(CLIPTextConfig(
+        bos_token_id=0,
+        eos_token_id=2,
+        hidden_size=32,
+        intermediate_size=37,
+        layer_norm_eps=1e-05,
+        num_attention_heads=4,
+        num_hidden_layers=5,
+        pad_token_id=1,
+        vocab_size=len(tokenizer),
+        hidden_act="gelu",
+        projection_dim=32,
+    ))
+    text_encoder_2 = T5EncoderModel(T5Config(
+        vocab_size=len(tokenizer),
+        d_model=32,
+        d_kv=8,
+        d_ff=37,
+        num_layers=2,
+        num_heads=4,
+    ))
+    vae = AutoencoderKL(
+        sample_size=32,
+        in_channels=3,
+        out_channels=3,
+        block_out_channels=(4,),
+        layers_per_block=1,
+        latent_channels=1,
+        norm_num_groups=1,
+        use_quant_conv=False,
+        use_post_quant_conv=False,
+        shift_factor=0.0609,
+        scaling_factor=1.5035,
+    )
+    return FluxPipeline(
+        scheduler=FlowMatchEulerDiscreteScheduler(),
+        vae=vae,
+        text_encoder=text_encoder,
+        tokenizer=tokenizer,
+        text_encoder_2=text_encoder_2,
+        tokenizer_2=build_tiny_tokenizer(model_max_length=512),
+        transformer=transformer,
+    )
+
+def build_manager(pipe: FluxPipeline) -> FluxPipelineManager:
+    """Wraps the tiny pipeline in a FluxPipelineManager without loading the real weights."""
+    manager = object.__new__(FluxPipelineManager)
+    manager.logger = logging.getLogger(__name__)
+    manager.pipe = pipe
+    manager.img2img_pipe = None
+    manager.flux_version = "tiny-random"
+    manager.embedding_cache = PromptEmbeddingCache()
+    pipe.set_progress_bar_config(disable=True)
+    FluxPipelineManager._instance = manager
+    return manager
+
+def run(batch_sizes: list, repeats: int, width: int, height: int) -> None:
+    manager = build_manager(build_tiny_pipeline())
+    manager.generate_images(["warm-up"], width, height)
+
+    print(f"{'batch':>6} {'s/batch':>10} {'images/min':>12} {'speedup':>8}")
+    baseline = None
+    for batch_size in batch_sizes:
+        prompts = [f"a photo of object {i}" for i in range(batch_size)]
+        start = time.perf_counter()
+        for _ in range(repeats):
+            manager.generate_images(prompts, width, height)
+        seconds_per_batch = (time.perf_counter() - start) / repeats
+        images_per_minute = 60 * batch_size / seconds_per_batch
+        baseline = baseline or images_per_minute
+        print(f"{batch_size:>6} {seconds_per_batch:>10.3f} {images_per_minute:>12.1f} {images_per_minute / baseline:>7.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--width", type=int, default=32)
+    parser.add_argument("--height", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    run(args.batch_sizes, args.repeats, args.width, args.height)
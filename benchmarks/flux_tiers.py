@@ -0,0 +1,61 @@
+"""
+CPU benchmark: compute spent by a draft-then-refine session against a session of standard generations.
+
+A typical session renders several candidates and keeps one. With the 'standard' tier every
+candidate is a full-resolution, full-step generation. With tiers, the candidates are drafts (at
+DRAFT_SCALE of the resolution, DRAFT_STEPS steps) and only the kept one is refined to full
+resolution with an img2img pass (FINAL_REFINE_STRENGTH of the schedule). Uses the tiny random Flux
+pipeline of `benchmarks.flux_batching`, so only the ratio between the two sessions is meaningful.
+
+Usage:
+    python -m benchmarks.flux_tiers --candidates 4 --width 64 --height 64
+"""
+import argparse
+import logging
+import time
+import torch
+from app.inference.image.flux.config import DIMENSION_MULTIPLE, TIERS
+from benchmarks.flux_batching import build_manager, build_tiny_pipeline
+
+def _scaled(side: int, scale: float) -> int:
+    return max(DIMENSION_MULTIPLE, int(side * scale) // DIMENSION_MULTIPLE * DIMENSION_MULTIPLE)
+
+def run(candidates: int, repeats: int, width: int, height: int) -> None:
+    manager = build_manager(build_tiny_pipeline())
+    draft, final = TIERS["draft"], TIERS["final"]
+    draft_width, draft_height = _scaled(width, draft["scale"]), _scaled(height, draft["scale"])
+    prompts = [f"a photo of object {i}" for i in range(candidates)]
+    manager.generate_images(["warm-up"], width, height)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        manager.generate_images(prompts, width, height, seeds=list(range(candidates)),
+                                num_inference_steps=TIERS["standard"]["steps"])
+    standard_seconds = (time.perf_counter() - start) / repeats
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        drafts = manager.generate_images(prompts, draft_width, draft_height, seeds=list(range(candidates)),
+                                         num_inference_steps=draft["steps"])
+        manager.refine_images(prompts[:1], drafts[:1], width, height, final["strength"], seeds=[0],
+                              num_inference_steps=final["steps"])
+    tiered_seconds = (time.perf_counter() - start) / repeats
+
+    print(f"{candidates} candidates at {width}x{height}, drafts at {draft_width}x{draft_height} in {draft['steps']} steps, "
+          f"refine strength {final['strength']}")
+    print(f"{'session':<20}{'s/session':>12}{'share':>8}")
+    print(f"{'standard':<20}{standard_seconds:>12.3f}{1:>8.2f}")
+    print(f"{'draft + refine':<20}{tiered_seconds:>12.3f}{tiered_seconds / standard_seconds:>8.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--width", type=int, default=64)
+    parser.add_argument("--height", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    run(args.candidates, args.repeats, args.width, args.height)
@@ -0,0 +1,59 @@
+"""
+CPU benchmark: Flux throughput of a pinned multi-process pool against the process count.
+
+Mirrors the prefork worker pool (see `app.workers.pool`): each process is pinned to a disjoint
+core set with a matching torch thread count, builds and warms its own tiny random Flux pipeline
+(see `benchmarks.flux_batching`), then all processes generate at the same time. The absolute
+numbers are meaningless; the images/minute ratio between process counts shows how throughput
+scales with the cores of the machine. Counts above the number of usable cores share cores.
+
+Usage:
+    python -m benchmarks.flux_worker_pool --processes 1 2 4 --images 8
+"""
+import argparse
+import logging
+import multiprocessing
+import time
+from app.workers.pool import assign, pin, usable_cpus
+
+def _child(index: int, processes: int, images: int, width: int, height: int, barrier, results) -> None:
+    logging.basicConfig(level=logging.WARNING)
+    pin(assign(index, processes, ["cpu"], usable_cpus()))
+    from benchmarks.flux_batching import build_manager, build_tiny_pipeline
+
+    manager = build_manager(build_tiny_pipeline())
+    manager.generate_images(["warm-up"], width, height)
+    barrier.wait()
+    start = time.perf_counter()
+    for i in range(images):
+        manager.generate_images([f"a photo of object {i}"], width, height)
+    results.put(time.perf_counter() - start)
+
+def run(process_counts: list, images: int, width: int, height: int) -> None:
+    context = multiprocessing.get_context("spawn")
+    print(f"usable CPUs: {len(usable_cpus())}")
+    print(f"{'processes':>10} {'s':>8} {'images/min':>12} {'speedup':>8}")
+    baseline = None
+    for processes in process_counts:
+        barrier, results = context.Barrier(processes), context.Queue()
+        children = [
+            context.Process(target=_child, args=(i, processes, images, width, height, barrier, results))
+            for i in range(processes)
+        ]
+        for child in children:
+            child.start()
+        seconds = max(results.get() for _ in children)
+        for child in children:
+            child.join()
+        images_per_minute = 60 * processes * images / seconds
+        baseline = baseline or images_per_minute
+        print(f"{processes:>10} {seconds:>8.2f} {images_per_minute:>12.1f} {images_per_minute / baseline:>7.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--width", type=int, default=64)
+    parser.add_argument("--height", type=int, default=64)
+    args = parser.parse_args()
+    run(args.processes, args.images, args.width, args.height)
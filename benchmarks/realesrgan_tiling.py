@@ -0,0 +1,98 @@
+"""
+CPU benchmark: peak RSS and seconds per megapixel of Real-ESRGAN upscaling per aspect ratio.
+
+Each case runs in a fresh process so its peak RSS is not polluted by earlier cases. A tile size of
+0 runs the whole frame through the network in one call, the way `RealESRGAN.predict` did before
+tiling. The network is the Real-ESRGAN RRDBNet with random weights when the RealESRGAN package is
+installed (speed and memory do not depend on the weights), and a small pixel-shuffle stand-in
+otherwise; `--num-block` shrinks the RRDBNet for quicker runs.
+
+Usage:
+    python -m benchmarks.realesrgan_tiling --aspect-ratios 1:1 16:9 21:9 --tile-sizes 0 128 256
+"""
+import argparse
+import multiprocessing
+import resource
+import time
+import numpy as np
+import torch
+from PIL import Image
+from app.inference.image.aspect_ratio import ASPECT_RATIOS
+from app.inference.image.realesrgan.tiling import TiledUpscaler
+
+SCALE = 4
+
+class PixelShuffleStandIn(torch.nn.Module):
+    """Small random-weight x4 network with the same input/output contract as RRDBNet."""
+    def __init__(self, features: int = 32):
+        super().__init__()
+        self.body = torch.nn.Sequential(
+            torch.nn.Conv2d(3, features, 3, padding=1),
+            torch.nn.LeakyReLU(0.2),
+            torch.nn.Conv2d(features, features, 3, padding=1),
+            torch.nn.LeakyReLU(0.2),
+            torch.nn.Conv2d(features, 3 * SCALE * SCALE, 3, padding=1),
+            torch.nn.PixelShuffle(SCALE),
+        )
+
+    def forward(self, x):
+        return self.body(x)
+
+def build_model(num_block: int) -> torch.nn.Module:
+    try:
+        from RealESRGAN.rrdbnet_arch import RRDBNet
+        model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=num_block, num_grow_ch=32, scale=SCALE)
+    except ImportError:
+        model = PixelShuffleStandIn()
+    return model.eval()
+
+def run_case(aspect_ratio: str, tile_size: int, args, queue) -> None:
+    torch.manual_seed(0)
+    model = build_model(args.num_block)
+    width, height = ASPECT_RATIOS[aspect_ratio]
+    width, height = int(width * args.input_scale), int(height * args.input_scale)
+    image = Image.fromarray(np.random.randint(0, 256, (height, width, 3), dtype=np.uint8))
+
+    start = time.perf_counter()
+    if tile_size:
+        upscaler = TiledUpscaler(model, SCALE, "cpu", tile_size=tile_size, overlap=args.overlap,
+                                 batch_size=args.batch_size, workers=args.workers)
+        upscaler.upscale(image)
+    else:
+        with torch.no_grad():
+            tensor = torch.from_numpy(np.array(image)).permute(2, 0, 1)[None].float().div_(255)
+            output = model(tensor).clamp_(0, 1).mul_(255).byte()[0].permute(1, 2, 0).numpy()
+            Image.fromarray(output)
+    seconds = time.perf_counter() - start
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((seconds, seconds / (width * height / 1e6), peak_rss_mb, f"{width}x{height}"))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--aspect-ratios", nargs="+", default=list(ASPECT_RATIOS))
+    parser.add_argument("--tile-sizes", type=int, nargs="+", default=[0, 256])
+    parser.add_argument("--overlap", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--num-block", type=int, default=23, help="RRDB blocks (23 in Real-ESRGAN)")
+    parser.add_argument("--input-scale", type=float, default=1.0, help="shrink the input frames for quick runs")
+    args = parser.parse_args()
+
+    if isinstance(build_model(1), PixelShuffleStandIn):
+        print("RealESRGAN is not installed; using the pixel-shuffle stand-in network")
+    context = multiprocessing.get_context("spawn")
+    print(f"{'ratio':>6} {'input':>10} {'tile':>5} {'seconds':>9} {'s/MP':>8} {'peak RSS MB':>12}")
+    for aspect_ratio in args.aspect_ratios:
+        for tile_size in args.tile_sizes:
+            queue = context.Queue()
+            process = context.Process(target=run_case, args=(aspect_ratio, tile_size, args, queue))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                print(f"{aspect_ratio:>6} {'':>10} {tile_size or 'full':>5} failed (exit code {process.exitcode}, likely out of memory)")
+                continue
+            seconds, seconds_per_mp, peak_rss_mb, size = queue.get()
+            print(f"{aspect_ratio:>6} {size:>10} {tile_size or 'full':>5} {seconds:>9.2f} {seconds_per_mp:>8.2f} {peak_rss_mb:>12.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,21 @@
 from fastapi import FastAPI, HTTPException
-from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
+import asyncio
 import os
-import torch
-from huggingface_hub import login
-from app.db.database import get_db, Base, engine
 from app.helpers.jwt import create_access_token, verify_token
 from app.utils.logging import JSONLoggingMiddleware
 
 load_dotenv()
 
-HF_TOKEN = os.getenv("HUGGINGFACE_TOKEN")
-if not HF_TOKEN:
-    raise ValueError("HUGGINGFACE_TOKEN environment variable is not set.")
-torch.cuda.empty_cache()
-
+# 'full' serves the language models from the API process; 'enqueue' only enqueues Celery
+# tasks and reads Redis, and never imports an inference library
+API_MODE = os.getenv("API_MODE", "full")
 
+# One-time setup (Hugging Face login, schema creation) runs in `python -m app.bootstrap`,
+# not here, so it is not repeated by every uvicorn worker.
 
 app = FastAPI()
 
@@ -33,8 +30,6 @@ app.add_middleware(
 #app.add_middleware(JSONLoggingMiddleware)
 
 
-login(token=HF_TOKEN, add_to_git_credential=True)
-
 # JWT Configuration
 class Settings(BaseModel):
     authjwt_secret_key: str = os.getenv("JWT_SECRET_KEY", "your_secret_key")
@@ -46,10 +41,6 @@ async def http_exception_handler(request, exc):
         content={"detail": exc.detail}
     )
 
-# # Mount the 'frontend' directory to serve static files
-# app.mount("/static", StaticFiles(directory="frontend"), name="static")
-app.mount("/images", StaticFiles(directory="frontend/images"), name="images")
-
 # @app.get("/{filename}")
 # async def serve_static(filename: str):
 #     specific_files = {
@@ -71,15 +62,42 @@ app.mount("/images", StaticFiles(directory="frontend/images"), name="images")
 
 from app.api.auth import router as auth_router
 from app.api.inference.image import router as image_router
-from app.api.inference.language import router as language_router
 from app.api.users import router as user_router
+from app.api.health import router as health_router, start_warmup
+from app.api.images import router as images_router
+from app.api.gallery import router as gallery_router
+from app.inference.image.storage import IMAGE_STORAGE
 
 app.include_router(auth_router, prefix="/auth")
 app.include_router(image_router, prefix="/inference/image")
-app.include_router(language_router, prefix="/inference/language")
+app.include_router(gallery_router, prefix="/gallery")
+if API_MODE != "enqueue":
+    from app.api.inference.language import router as language_router
+    app.include_router(language_router, prefix="/inference/language")
+app.include_router(health_router)
+# Images are only served by the API from local storage; object storage serves them itself
+if IMAGE_STORAGE == "local":
+    app.include_router(images_router)
 # app.include_router(user_router, prefix="/users")
 
-Base.metadata.create_all(bind=engine)
+@app.on_event("startup")
+async def warm_up_models():
+    if API_MODE != "enqueue":
+        start_warmup()
+
+@app.on_event("startup")
+async def listen_for_user_invalidations():
+    from app.db.user_cache import user_cache
+    app.state.user_cache_listener = asyncio.create_task(user_cache.listen())
+
+@app.on_event("shutdown")
+async def close_task_events():
+    from app.api.task_events import hub
+    await hub.close()
+
+@app.on_event("shutdown")
+async def stop_user_invalidations():
+    app.state.user_cache_listener.cancel()
 
 @app.get("/")
 async def read_root():
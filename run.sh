@@ -22,12 +22,18 @@ pip install -r requirements.txt > /dev/null
 # Start Docker containers
 docker-compose up -d
 
-# Start Celery worker
-celery -A app.workers.images worker --loglevel=info --pool=solo &
+# One-time setup: Hugging Face login and database schema
+python -m app.bootstrap
+
+# Start Celery workers (generation, upscaling and derivatives are scaled separately). Generation runs one
+# pinned process per device or core set; set GENERATE_PROCESSES to the number of GPUs.
+celery -A app.workers.images worker --loglevel=info --pool=prefork --concurrency=${GENERATE_PROCESSES:-1} --prefetch-multiplier=1 -Q celery -n generate@%h &
+celery -A app.workers.images worker --loglevel=info --pool=solo -Q upscale -n upscale@%h &
+celery -A app.workers.images worker --loglevel=info --pool=prefork --concurrency=${DERIVATIVE_PROCESSES:-2} -Q derivatives -n derivatives@%h &
 
 # Start Flower
 celery -A app.workers.images.celery  flower --pool=solo --loglevel=INFO &
 
-# Start Uvicorn server
+# Start Uvicorn server (API_MODE=enqueue keeps the web workers free of inference libraries)
 #uvicorn main:app --workers 8 --host 0.0.0.0 --log-config=logging_config.conf --port 8888 --reload
-uvicorn main:app --workers 8 --host 0.0.0.0  --port 8888 --reload
+API_MODE=enqueue uvicorn main:app --workers 8 --host 0.0.0.0  --port 8888 --reload
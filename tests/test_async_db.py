@@ -0,0 +1,71 @@
+# tests/test_async_db.py
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+import fakeredis
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.api import auth
+from app.api.auth import create_jwt_token, get_current_user
+from app.db.database import get_async_db
+from app.db.model.user import get_user_from_uuid_async
+from app.db.models import Image, User
+from app.db.user_cache import UserCache
+
+USER_ID = uuid.uuid4()
+
+@pytest.fixture(autouse=True)
+def user_cache(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(auth, "user_cache", UserCache(fakeredis.FakeRedis(server=server), fakeredis.FakeAsyncRedis(server=server)))
+
+@pytest.fixture
+def sessions(tmp_path):
+    path = tmp_path / "users.db"
+    engine = create_engine(f"sqlite:///{path}")
+    User.metadata.create_all(engine, tables=[User.__table__, Image.__table__])
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{"uuid": USER_ID, "email": "a@example.com", "name": "A", "updated_at": datetime(2026, 1, 1)}])
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    yield async_sessionmaker(async_engine, expire_on_commit=False)
+    asyncio.run(async_engine.dispose())
+
+def _client(sessions):
+    app = FastAPI()
+
+    @app.get("/me")
+    async def me(current_user: User = Depends(get_current_user)):
+        return {"email": current_user.email}
+
+    async def override():
+        async with sessions() as db:
+            yield db
+
+    app.dependency_overrides[get_async_db] = override
+    return TestClient(app)
+
+def _token(sub: str) -> str:
+    return create_jwt_token({"sub": sub, "email": "a@example.com", "name": "A"}, timedelta(minutes=5))
+
+def test_get_user_from_uuid_async(sessions):
+    async def lookup(user_uuid):
+        async with sessions() as db:
+            return await get_user_from_uuid_async(user_uuid, db)
+
+    assert asyncio.run(lookup(str(USER_ID))).email == "a@example.com"
+    assert asyncio.run(lookup(str(uuid.uuid4()))) is None
+    assert asyncio.run(lookup("not-a-uuid")) is None
+
+def test_current_user_is_read_through_the_async_session(sessions):
+    client = _client(sessions)
+    client.cookies.set("access_token", _token(str(USER_ID)))
+    response = client.get("/me")
+    assert response.status_code == 200 and response.json() == {"email": "a@example.com"}
+
+def test_unknown_user_is_unauthorized(sessions):
+    client = _client(sessions)
+    client.cookies.set("access_token", _token(str(uuid.uuid4())))
+    assert client.get("/me").status_code == 401
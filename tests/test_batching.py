@@ -0,0 +1,123 @@
+# tests/test_batching.py
+import time
+import fakeredis
+import pytest
+from app.workers.batching import MicroBatcher
+from app.workers.scheduler import AdmissionError, FairScheduler
+
+def make_batcher(max_batch_size=4):
+    return MicroBatcher(FairScheduler(fakeredis.FakeRedis()), window_seconds=0.05, max_batch_size=max_batch_size)
+
+def test_bucket_uses_aspect_ratio_dimensions():
+    assert MicroBatcher.bucket("16:9") == "1920x1080"
+    # Invalid aspect ratios fall back to 1:1, so they share its bucket
+    assert MicroBatcher.bucket("bogus") == MicroBatcher.bucket("1:1")
+
+def test_batch_takes_jobs_from_leader_bucket_only():
+    batcher = make_batcher()
+    batcher.submit("a", "cat", "1:1", user_id="alice")
+    batcher.submit("b", "dog", "16:9", user_id="bob")
+    batcher.submit("c", "owl", "1:1", user_id="carol")
+
+    assert [job["task_id"] for job in batcher.next_batch()] == ["a", "c"]
+    assert [job["task_id"] for job in batcher.next_batch()] == ["b"]
+    assert batcher.next_batch() == []
+
+def test_batch_respects_max_batch_size():
+    batcher = make_batcher(max_batch_size=2)
+    for task_id in "abcd":
+        batcher.submit(task_id, "cat", "1:1")
+
+    assert len(batcher.next_batch()) == 2
+    assert len(batcher.next_batch()) == 2
+
+def test_job_keeps_its_inputs():
+    batcher = make_batcher()
+    batcher.submit("a", "cat", "1:1", 7, user_id="alice", lane="batch")
+
+    job = batcher.next_batch()[0]
+    assert (job["prompt"], job["seed"], job["user_id"], job["lane"]) == ("cat", 7, "alice", "batch")
+
+def test_tiers_get_their_own_buckets():
+    assert MicroBatcher.bucket("16:9", "draft") == "draft:960x528"
+    assert MicroBatcher.bucket("16:9", "final") == "final:1920x1080"
+
+    batcher = make_batcher()
+    batcher.submit("a", "cat", "1:1", 1, "draft", user_id="alice")
+    batcher.submit("b", "cat", "1:1", 2, user_id="bob")
+    batcher.submit("c", "cat", "1:1", 3, "draft", user_id="carol")
+
+    assert [job["task_id"] for job in batcher.next_batch()] == ["a", "c"]
+
+def test_cost_follows_resolution_and_steps():
+    assert MicroBatcher.cost("1:1") == 1.0
+    assert MicroBatcher.cost("1:1", "draft") < MicroBatcher.cost("1:1") / 10
+    assert MicroBatcher.cost("1:1", "final") < MicroBatcher.cost("1:1")
+
+def test_variation_jobs_batch_by_image_count():
+    batcher = make_batcher()
+    batcher.submit_variations([["a1", "a2"]], ["cat"], "1:1", [1, 2], user_id="alice")
+    batcher.submit_variations([["c1", "c2"]], ["owl"], "1:1", [5, 6], user_id="carol")
+    batcher.submit_variations([["d1", "d2", "d3", "d4", "d5"]], ["elk"], "1:1", list(range(5)), user_id="dave")
+
+    # Two 2-variation jobs fill a batch of 4 images; other counts are kept apart
+    assert [job["task_ids"] for job in batcher.next_batch()] == [["a1", "a2"], ["c1", "c2"]]
+    assert [job["images"] for job in batcher.next_batch()] == [5]
+
+def test_variation_requests_are_admitted_whole_by_image_count():
+    batcher = MicroBatcher(FairScheduler(fakeredis.FakeRedis(), max_inflight=6), window_seconds=0.05)
+    batcher.submit_variations([["a1", "a2"], ["b1", "b2"]], ["cat", "dog"], "1:1", [1, 2], user_id="alice")
+    assert batcher.scheduler.inflight("alice") == 4
+
+    # The first prompt alone would still fit, but the request is refused as a whole
+    with pytest.raises(AdmissionError):
+        batcher.submit_variations([["c1", "c2"], ["d1", "d2"]], ["owl", "elk"], "1:1", [1, 2], user_id="alice")
+    assert batcher.scheduler.inflight("alice") == 4
+    assert len(batcher.next_batch()) == 2 and batcher.next_batch() == []
+
+def test_jobs_of_a_worker_killed_mid_batch_are_requeued():
+    scheduler = FairScheduler(fakeredis.FakeRedis(), max_inflight=2, claim_ttl_seconds=30)
+    batcher = MicroBatcher(scheduler, window_seconds=0.05)
+    batcher.submit("a", "cat", "1:1", user_id="alice")
+    batcher.submit("b", "owl", "1:1", user_id="alice")
+    batcher.submit("c", "elk", "1:1", user_id="bob")
+
+    # The worker dies after taking the batch, before storing any result or finishing it
+    taken = batcher.next_batch("worker-1")
+    assert [job["task_id"] for job in taken] == ["a", "b", "c"]
+    assert scheduler.recover() == ([], [])  # Still within its heartbeat deadline
+
+    requeued, failed = scheduler.recover(now=time.time() + 31)
+    assert [job["task_id"] for job in requeued] == ["a", "b", "c"] and failed == []
+    # The jobs are queued again and still hold their slots, so the user cannot go over the cap
+    with pytest.raises(AdmissionError):
+        batcher.submit("d", "fox", "1:1", user_id="alice")
+    retaken = batcher.next_batch("worker-2")
+    assert sorted(job["task_id"] for job in retaken) == ["a", "b", "c"]
+
+    scheduler.finish(retaken, "worker-2")
+    assert scheduler.inflight("alice") == 0 and scheduler.recover(now=time.time() + 31) == ([], [])
+
+def test_jobs_that_keep_losing_their_worker_are_failed():
+    scheduler = FairScheduler(fakeredis.FakeRedis(), claim_ttl_seconds=30, max_claim_attempts=2)
+    batcher = MicroBatcher(scheduler, window_seconds=0.05)
+    batcher.submit("a", "cat", "1:1", user_id="alice")
+
+    batcher.next_batch("worker-1")
+    assert len(scheduler.recover(now=time.time() + 31)[0]) == 1
+    batcher.next_batch("worker-2")
+    requeued, failed = scheduler.recover(now=time.time() + 31)
+
+    assert requeued == [] and [job["task_id"] for job in failed] == ["a"]
+    assert scheduler.inflight("alice") == 0 and batcher.next_batch() == []
+
+def test_heartbeat_keeps_a_running_batch_claimed():
+    scheduler = FairScheduler(fakeredis.FakeRedis(), claim_ttl_seconds=0.3)
+    batcher = MicroBatcher(scheduler, window_seconds=0.05)
+    batcher.submit("a", "cat", "1:1", user_id="alice")
+
+    jobs = batcher.next_batch("worker-1")
+    with scheduler.heartbeat("worker-1"):
+        time.sleep(0.5)
+        assert scheduler.recover() == ([], [])
+    scheduler.finish(jobs, "worker-1")
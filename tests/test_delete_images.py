@@ -0,0 +1,38 @@
+# tests/test_delete_images.py
+import uuid
+from types import SimpleNamespace
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import auth
+from app.api.inference import image
+
+OWNER, OTHER = uuid.uuid4(), uuid.uuid4()
+
+class FakeCollector:
+    def __init__(self, deleted):
+        self.deleted = deleted
+
+    def delete(self, image_ids):
+        self.deleted += image_ids
+        return {"images": len(image_ids), "files": len(image_ids), "bytes": 10 * len(image_ids), "deleted": image_ids}
+
+@pytest.fixture
+def client(monkeypatch):
+    owners = {"mine": str(OWNER), "theirs": str(OTHER)}
+    deleted = []
+    monkeypatch.setattr(image, "image_owners", lambda image_ids: {i: owners[i] for i in image_ids if i in owners})
+    monkeypatch.setattr(image, "ImageGarbageCollector", lambda: FakeCollector(deleted))
+    app = FastAPI()
+    app.include_router(image.router)
+    app.dependency_overrides[auth.get_current_user] = lambda: SimpleNamespace(uuid=OWNER)
+    yield TestClient(app), deleted
+
+def test_other_users_images_are_not_deleted(client):
+    client, deleted = client
+    response = client.request("DELETE", "/delete-images/", json={"image_ids": ["original_mine.png", "theirs", "unknown"]})
+
+    assert response.status_code == 200
+    assert deleted == ["mine"]
+    assert response.json()["deleted_files"] == ["mine"]
+    assert response.json()["not_found_files"] == ["theirs", "unknown"]
@@ -0,0 +1,75 @@
+# tests/test_derivatives.py
+import threading
+import fakeredis
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+from app.api import images
+from app.inference.image import derivatives, storage, writer
+from app.inference.image.derivatives import DerivativeMaker, derivative_key, derivative_urls, make_derivatives, parse_derivative_key, srcset
+
+IMAGE_ID = "3fa2c0de"
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_backend", storage.LocalStorage(str(tmp_path)))
+    monkeypatch.setattr(derivatives, "redis_client", fakeredis.FakeRedis())
+    monkeypatch.setattr(derivatives, "DERIVATIVE_POOL", "thread")
+    monkeypatch.setattr(DerivativeMaker, "_instance", None)
+    backend = storage.get_storage()
+    original = Image.new("RGB", (800, 400), "blue")
+    writer.store_image(original, writer.image_key(IMAGE_ID, "original"), "PNG", {})
+    return backend
+
+def test_ladder_keeps_aspect_ratio_and_skips_wider_widths(backend):
+    sizes = make_derivatives(IMAGE_ID)
+
+    assert list(sizes) == [derivative_key(IMAGE_ID, width) for width in (512, 256)]
+    with backend.open(derivative_key(IMAGE_ID, 256)) as f:
+        assert Image.open(f).size == (256, 128)
+    with backend.open(derivative_key(IMAGE_ID, 512)) as f:
+        image = Image.open(f)
+        assert image.format == "WEBP" and image.size == (512, 256)
+    assert not backend.exists(derivative_key(IMAGE_ID, 1024))
+    assert list(derivative_urls(IMAGE_ID, 800)) == [256, 512]
+    assert "1024w" not in srcset(IMAGE_ID, 800)
+
+def test_keys_of_the_ladder_are_recognized():
+    assert parse_derivative_key(derivative_key(IMAGE_ID, 512)) == (IMAGE_ID, 512)
+    assert parse_derivative_key(f"3f/a2/{IMAGE_ID}_300w.webp") is None  # Not on the ladder
+    assert parse_derivative_key(f"00/00/{IMAGE_ID}_512w.webp") is None  # Wrong shard
+    assert parse_derivative_key(writer.image_key(IMAGE_ID, "original")) is None
+
+def test_concurrent_requests_share_one_job(backend, monkeypatch):
+    release, calls = threading.Event(), []
+
+    def slow_make(image_id, widths=None):
+        calls.append(widths)
+        release.wait(5)
+        return make_derivatives(image_id, widths)
+    monkeypatch.setattr(derivatives, "make_derivatives", slow_make)
+    maker = DerivativeMaker()
+
+    first = maker.submit(IMAGE_ID)
+    second = maker.submit(IMAGE_ID, [256])
+    release.set()
+
+    assert second[derivative_key(IMAGE_ID, 256)] is first[derivative_key(IMAGE_ID, 256)]
+    first[derivative_key(IMAGE_ID, 256)].result()
+    maker.close()
+    assert calls == [[256, 512, 1024]]
+    recorded = derivatives.redis_client.hgetall(derivatives.derivatives_key(IMAGE_ID))
+    assert recorded[b"256"] == f"/images/{derivative_key(IMAGE_ID, 256)}".encode()
+    assert derivatives.redis_client.hexists(writer.files_key(IMAGE_ID), derivative_key(IMAGE_ID, 256))
+
+def test_missing_derivative_is_made_on_first_request(backend):
+    app = FastAPI()
+    app.include_router(images.router)
+    client = TestClient(app)
+
+    response = client.get(f"/images/{derivative_key(IMAGE_ID, 512)}")
+    assert response.status_code == 200 and response.headers["content-type"] == "image/webp"
+    assert backend.exists(derivative_key(IMAGE_ID, 512))
+    assert client.get(f"/images/{derivative_key('ffee0000', 512)}").status_code == 404
+    assert client.get(f"/images/{derivative_key(IMAGE_ID, 1024)}").status_code == 404  # Wider than the image
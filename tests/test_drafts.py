@@ -0,0 +1,37 @@
+# tests/test_drafts.py
+import uuid
+from types import SimpleNamespace
+import fakeredis
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import auth
+from app.api.inference import image
+from app.inference.image.result_cache import ResultCache
+
+OWNER = uuid.uuid4()
+
+@pytest.fixture
+def client(monkeypatch):
+    drafts = {"d1": {"prompt": "cat", "aspectRatio": "16:9", "seed": 5, "tier": "draft", "userId": str(OWNER)}}
+    queued = []
+    monkeypatch.setattr(image, "get_generation", drafts.get)
+    monkeypatch.setattr(image, "ResultCache", lambda: ResultCache(fakeredis.FakeRedis()))
+    monkeypatch.setattr(image, "enqueue_generate_image", lambda *args, **kwargs: queued.append(args) or SimpleNamespace(id="t1"))
+    app = FastAPI()
+    app.include_router(image.router)
+    user = SimpleNamespace(uuid=OWNER)
+    app.dependency_overrides[auth.get_current_user] = lambda: user
+    yield TestClient(app), user, queued
+
+def test_final_refines_the_users_own_draft(client):
+    client, _, queued = client
+    response = client.post("/generate-image", json={"userPrompt": "cat", "aspectRatio": "1:1", "tier": "final", "draftImageId": "d1"})
+    assert response.status_code == 200
+    assert queued == [("cat", "16:9", 5, "final", "d1")]
+
+def test_other_users_drafts_are_not_found(client):
+    client, user, queued = client
+    user.uuid = uuid.uuid4()
+    response = client.post("/generate-image", json={"userPrompt": "cat", "aspectRatio": "1:1", "tier": "final", "draftImageId": "d1"})
+    assert response.status_code == 404 and not queued
@@ -0,0 +1,78 @@
+# tests/test_embedding_cache.py
+import os
+import torch
+from app.inference.image.flux.embedding_cache import PromptEmbeddingCache
+
+class CountingPipe:
+    """Records which prompts reach the text encoders."""
+    def __init__(self):
+        self.encoded = []
+
+    def encode_prompt(self, prompt, prompt_2=None, max_sequence_length=512):
+        self.encoded.extend(prompt)
+        rows = torch.tensor([[float(len(p))] for p in prompt])
+        return rows.repeat(1, 4).unsqueeze(1), rows.repeat(1, 2), None
+
+def test_key_depends_on_variant_and_sequence_length():
+    key = PromptEmbeddingCache.make_key("a cat", "dev", 255)
+    assert key == PromptEmbeddingCache.make_key("a cat", "dev", 255)
+    assert key != PromptEmbeddingCache.make_key("a cat", "schnell", 255)
+    assert key != PromptEmbeddingCache.make_key("a cat", "dev", 512)
+
+def test_encode_only_runs_text_encoders_for_misses():
+    cache = PromptEmbeddingCache(max_bytes=1024 * 1024, disk_dir=None)
+    pipe = CountingPipe()
+
+    cache.encode(pipe, ["a cat", "a dog"], "dev", 255)
+    prompt_embeds, pooled = cache.encode(pipe, ["a dog", "a cow", "a dog"], "dev", 255)
+
+    assert pipe.encoded == ["a cat", "a dog", "a cow"]
+    assert prompt_embeds.shape == (3, 1, 4)
+    assert pooled.shape == (3, 2)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 3
+
+def test_lru_is_bounded_by_bytes():
+    entry = (torch.zeros(1, 1, 4), torch.zeros(1, 2))  # 24 bytes
+    cache = PromptEmbeddingCache(max_bytes=50, disk_dir=None)
+    for prompt in ["a", "b", "c"]:
+        cache.put(prompt, *entry)
+
+    assert cache.stats()["bytes"] <= 50
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+
+def test_evicted_entries_spill_to_disk_and_are_promoted(tmp_path):
+    entry = (torch.ones(1, 1, 4), torch.ones(1, 2))
+    cache = PromptEmbeddingCache(max_bytes=30, disk_dir=str(tmp_path))
+    cache.put("a", *entry)
+    cache.put("b", *entry)
+
+    assert (tmp_path / "a.pt").exists()
+    value = cache.get("a")
+    assert torch.equal(value[0], entry[0])
+    assert cache.stats()["disk_hits"] == 1
+
+def test_spill_happens_outside_the_lock(tmp_path, monkeypatch):
+    entry = (torch.ones(1, 1, 4), torch.ones(1, 2))
+    cache = PromptEmbeddingCache(max_bytes=30, disk_dir=str(tmp_path))
+    save = torch.save
+    locked = []
+    monkeypatch.setattr(torch, "save", lambda *args: locked.append(cache._lock.locked()) or save(*args))
+    cache.put("a", *entry)
+    cache.put("b", *entry)
+
+    assert locked == [False]
+
+def test_unreadable_file_removed_by_another_process_is_a_miss(tmp_path, monkeypatch):
+    cache = PromptEmbeddingCache(max_bytes=30, disk_dir=str(tmp_path))
+    (tmp_path / "a.pt").write_bytes(b"not a tensor")
+    remove = os.remove
+
+    def removed_by_another_process(path):
+        remove(path)
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(os, "remove", removed_by_another_process)
+
+    assert cache.get("a") is None and cache.get("b") is None
+    assert cache.stats()["misses"] == 2
@@ -0,0 +1,69 @@
+# tests/test_gallery.py
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app.api import gallery as gallery_api
+from app.api.auth import get_current_user
+from app.db.database import get_db
+from app.db.gallery import InvalidCursor, decode_cursor, encode_cursor, gallery_page
+from app.db.models import Image, User
+
+USER_ID, OTHER_USER_ID = uuid.uuid4(), uuid.uuid4()
+START = datetime(2026, 1, 1)
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'gallery.db'}")
+    User.metadata.create_all(engine, tables=[User.__table__, Image.__table__])
+    rows = []
+    for i in range(25):
+        # Pairs of images share a timestamp, as images of one batch do
+        rows.append({"id": uuid.uuid4(), "url": f"/images/{i}.png", "prompt": "cat", "aspectRatio": "1:1",
+                     "tier": "standard", "user_id": USER_ID, "created_at": START + timedelta(seconds=i // 2)})
+    rows.append({"id": uuid.uuid4(), "url": "/images/other.png", "prompt": "dog", "aspectRatio": "1:1",
+                 "tier": "standard", "user_id": OTHER_USER_ID, "created_at": START})
+    with engine.begin() as connection:
+        connection.execute(insert(Image), rows)
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+def test_pages_cover_every_image_once_newest_first(session):
+    seen, cursor = [], None
+    while True:
+        rows, cursor = gallery_page(session, USER_ID, 10, cursor)
+        seen.extend(rows)
+        if cursor is None:
+            break
+
+    assert len(seen) == 25 and len({row.id for row in seen}) == 25
+    assert [(row.created_at, row.id) for row in seen] == sorted(((row.created_at, row.id) for row in seen), reverse=True)
+    assert "/images/other.png" not in {row.url for row in seen}
+
+def test_last_full_page_has_no_next_cursor(session):
+    rows, cursor = gallery_page(session, USER_ID, 25)
+    assert len(rows) == 25 and cursor is None
+
+def test_cursor_round_trip_and_validation():
+    image_id = uuid.uuid4()
+    assert decode_cursor(encode_cursor(START, image_id)) == (START, image_id)
+    with pytest.raises(InvalidCursor):
+        decode_cursor("not-a-cursor")
+
+def test_gallery_endpoint(session):
+    app = FastAPI()
+    app.include_router(gallery_api.router, prefix="/gallery")
+    app.dependency_overrides[get_db] = lambda: session
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(uuid=USER_ID)
+    client = TestClient(app)
+
+    first = client.get("/gallery", params={"limit": 20}).json()
+    assert len(first["images"]) == 20 and first["images"][0]["imageUrl"] == "/images/24.png"
+    assert "256w" in first["images"][0]["srcset"]
+    second = client.get("/gallery", params={"limit": 20, "cursor": first["nextCursor"]}).json()
+    assert len(second["images"]) == 5 and second["nextCursor"] is None
+    assert client.get("/gallery", params={"cursor": "bogus"}).status_code == 400
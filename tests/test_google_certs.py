@@ -0,0 +1,125 @@
+# tests/test_google_certs.py
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt, jwt as google_jwt
+from app.helpers import google_certs
+from app.helpers.google_certs import GoogleTokenVerifier, max_age
+
+CLIENT_ID = "client.apps.googleusercontent.com"
+
+def _key_pair():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "test")])
+    now = datetime.now(timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(1).not_valid_before(now - timedelta(days=1)).not_valid_after(now + timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+    private = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    return private, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+KEYS = {kid: _key_pair() for kid in ("one", "two")}
+
+def _token(kid="one", **claims) -> str:
+    now = int(time.time())
+    payload = {"iss": "https://accounts.google.com", "aud": CLIENT_ID, "sub": "1", "email": "a@example.com", "iat": now, "exp": now + 300}
+    payload.update(claims)
+    return google_jwt.encode(crypt.RSASigner.from_string(KEYS[kid][0], kid), payload).decode()
+
+@pytest.fixture
+def cert_server():
+    """A stand-in for Google's certificate endpoint; `state` controls what it serves."""
+    state = {"kids": ["one"], "cache_control": "public, max-age=3600", "status": 200, "hits": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state["hits"] += 1
+            body = json.dumps({kid: KEYS[kid][1] for kid in state["kids"]}).encode()
+            self.send_response(state["status"])
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Cache-Control", state["cache_control"])
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state["url"] = f"http://127.0.0.1:{server.server_port}/certs"
+    yield state
+    server.shutdown()
+
+@pytest.fixture
+def make_verifier():
+    verifiers = []
+
+    def make(url):
+        verifiers.append(GoogleTokenVerifier(CLIENT_ID, url))
+        return verifiers[-1]
+
+    yield make
+    for verifier in verifiers:
+        verifier.stop()
+
+def test_max_age():
+    assert max_age({"Cache-Control": "public, max-age=20000, must-revalidate", "Age": "500"}) == 19500
+    assert max_age({"Cache-Control": "no-store"}) == 0
+    assert max_age({}) == google_certs.GOOGLE_CERTS_DEFAULT_TTL
+
+def test_tokens_are_verified_from_cached_certs(cert_server, make_verifier):
+    verifier = make_verifier(cert_server["url"])
+    assert verifier.verify(_token())["email"] == "a@example.com"
+    assert verifier.verify(_token())["sub"] == "1"
+    assert cert_server["hits"] == 1
+
+    with pytest.raises(ValueError):
+        verifier.verify(_token(aud="someone-else"))
+    with pytest.raises(ValueError):
+        verifier.verify(_token(iss="https://evil.example.com"))
+
+def test_concurrent_logins_share_one_download(cert_server, make_verifier):
+    verifier = make_verifier(cert_server["url"])
+    with ThreadPoolExecutor(16) as pool:
+        results = list(pool.map(lambda _: verifier.verify(_token())["sub"], range(32)))
+    assert results == ["1"] * 32 and cert_server["hits"] == 1
+
+def test_rotated_keys_are_fetched_early(cert_server, monkeypatch, make_verifier):
+    monkeypatch.setattr(google_certs, "GOOGLE_CERTS_RETRY_SECONDS", 0)
+    verifier = make_verifier(cert_server["url"])
+    verifier.verify(_token("one"))
+    cert_server["kids"] = ["one", "two"]
+    assert verifier.verify(_token("two"))["sub"] == "1"
+    assert cert_server["hits"] == 2
+
+def test_previous_certs_are_used_while_google_is_failing(cert_server, monkeypatch, make_verifier):
+    monkeypatch.setattr(google_certs, "GOOGLE_CERTS_RETRY_SECONDS", 0)
+    cert_server["cache_control"] = "max-age=0"
+    verifier = make_verifier(cert_server["url"])
+    verifier.verify(_token())
+    cert_server["status"] = 500
+    assert verifier.verify(_token())["sub"] == "1"
+    assert cert_server["hits"] >= 2
+
+def test_no_certs_at_all_is_an_error(cert_server, make_verifier):
+    cert_server["status"] = 500
+    with pytest.raises(ValueError):
+        make_verifier(cert_server["url"]).verify(_token())
+
+def test_certs_are_refreshed_in_the_background_before_they_expire(cert_server, monkeypatch, make_verifier):
+    monkeypatch.setattr(google_certs, "GOOGLE_CERTS_REFRESH_MARGIN", 1)
+    monkeypatch.setattr(google_certs, "GOOGLE_CERTS_RETRY_SECONDS", 0)
+    cert_server["cache_control"] = "max-age=2"
+    verifier = make_verifier(cert_server["url"])
+    verifier.verify(_token())
+    time.sleep(1.5)
+    assert cert_server["hits"] == 2
@@ -0,0 +1,56 @@
+# tests/test_images.py
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import images
+from app.inference.image import storage, writer
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_backend", storage.LocalStorage(str(tmp_path)))
+    monkeypatch.setattr(writer, "IMAGE_ALTERNATE_FORMATS", ["webp"])
+    backend = storage.get_storage()
+    backend.put("ab/cd/original_abcd.png", b"png-bytes" * 1000)
+    backend.put("ab/cd/original_abcd.webp", b"webp")
+    backend.put("ab/cd/abcd.png", b"upscaled")
+    app = FastAPI()
+    app.include_router(images.router)
+    return TestClient(app)
+
+def test_images_are_cached_as_immutable_with_a_content_etag(client):
+    response = client.get("/images/ab/cd/original_abcd.png")
+
+    assert response.status_code == 200 and response.content == b"png-bytes" * 1000
+    assert response.headers["cache-control"] == f"public, max-age={images.IMAGE_CACHE_MAX_AGE}, immutable"
+    assert response.headers["vary"] == "Accept"
+    # ETags follow the content
+    assert client.get("/images/ab/cd/abcd.png").headers["etag"] != response.headers["etag"]
+
+def test_revalidation_is_answered_with_304(client):
+    etag = client.get("/images/ab/cd/original_abcd.png").headers["etag"]
+
+    response = client.get("/images/ab/cd/original_abcd.png", headers={"If-None-Match": f'"other", W/{etag}'})
+    assert response.status_code == 304 and response.content == b""
+    assert response.headers["etag"] == etag
+    assert client.get("/images/ab/cd/original_abcd.png", headers={"If-None-Match": '"other"'}).status_code == 200
+
+def test_byte_ranges(client):
+    response = client.get("/images/ab/cd/original_abcd.png", headers={"Range": "bytes=9-17"})
+
+    assert response.status_code == 206 and response.content == b"png-bytes"
+    assert response.headers["content-range"] == "bytes 9-17/9000"
+
+def test_accepted_alternate_format_is_served(client):
+    webp = client.get("/images/ab/cd/original_abcd.png", headers={"Accept": "image/avif,image/webp,*/*;q=0.8"})
+    assert webp.content == b"webp" and webp.headers["content-type"] == "image/webp"
+
+    assert client.get("/images/ab/cd/original_abcd.png", headers={"Accept": "image/webp;q=0, */*"}).content.startswith(b"png")
+    # No alternate stored for this file
+    assert client.get("/images/ab/cd/abcd.png", headers={"Accept": "image/webp"}).content == b"upscaled"
+
+def test_missing_and_hidden_files_are_not_found(client, tmp_path):
+    (tmp_path / "ab" / "cd" / ".tmp-x").write_bytes(b"partial")
+
+    assert client.get("/images/ab/cd/missing.png").status_code == 404
+    assert client.get("/images/ab/cd/.tmp-x").status_code == 404
+    assert client.get("/images/ab/cd").status_code == 404
@@ -0,0 +1,157 @@
+# tests/test_metadata.py
+import time
+import uuid
+import fakeredis
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.exc import OperationalError
+from app.db.models import Image, User
+from app.inference.image import writer
+from app.workers.metadata import BUFFER_KEY, LOCK_KEY, UNSIZED_KEY, MetadataBuffer
+
+USER_ID = str(uuid.uuid4())
+
+@pytest.fixture
+def buffer(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'images.db'}")
+    User.metadata.create_all(engine, tables=[User.__table__, Image.__table__])
+    return MetadataBuffer(fakeredis.FakeRedis(), engine=engine, batch_size=2, flush_seconds=60)
+
+def row(**overrides):
+    values = {"id": str(uuid.uuid4()), "url": "/images/x.png", "prompt": "cat", "aspectRatio": "1:1",
+              "user_id": USER_ID, "seed": 7, "tier": "standard", "wait_seconds": 0.5, "generate_seconds": 3.0,
+              "created_at": 1700000000.0}
+    values.update(overrides)
+    return values
+
+def count(buffer):
+    with buffer.engine.connect() as connection:
+        return connection.execute(select(func.count()).select_from(Image)).scalar()
+
+def test_rows_are_inserted_in_batches_with_their_file_size(buffer):
+    rows = [row() for _ in range(5)]
+    buffer.redis_client.hset(writer.files_key(rows[0]["id"]), writer.image_key(rows[0]["id"], "original"), 1234)
+    buffer.add(rows)
+
+    assert buffer.flush() == 5
+    assert buffer.pending() == 0 and count(buffer) == 5
+    with buffer.engine.connect() as connection:
+        stored = connection.execute(select(Image).where(Image.id == uuid.UUID(rows[0]["id"]))).one()
+    assert stored.size_bytes == 1234 and stored.seed == 7 and stored.created_at.year == 2023
+
+def test_replayed_rows_are_not_duplicated(buffer):
+    rows = [row(), row()]
+    buffer.add(rows)
+    buffer.flush()
+    # A flusher that died after its commit but before trimming the buffer leaves the batch behind
+    buffer.add(rows + [row()])
+
+    assert buffer.flush() == 1
+    assert count(buffer) == 3 and buffer.pending() == 0
+
+def test_bad_rows_are_dropped_without_losing_the_batch(buffer):
+    buffer.add([row(), row(prompt=None), row(user_id="anonymous"), row()])
+
+    assert buffer.flush() == 2
+    assert count(buffer) == 2 and buffer.pending() == 0
+
+def test_rows_the_database_rejects_are_dropped_and_the_batch_trimmed(buffer):
+    buffer.add([row(), row(wait_seconds="slow"), row(tier=["standard"]), row(created_at="yesterday"), row()])
+    buffer.redis_client.rpush(BUFFER_KEY, "{not json")
+
+    assert buffer.flush() == 2
+    assert count(buffer) == 2 and buffer.pending() == 0
+
+def test_batch_is_kept_while_the_database_is_unreachable(buffer, tmp_path):
+    buffer._engine = create_engine(f"sqlite:///{tmp_path / 'missing' / 'images.db'}")
+    buffer.add([row(), row()])
+
+    with pytest.raises(OperationalError):
+        buffer.flush()
+    assert buffer.pending() == 2
+
+def test_flush_is_due_on_a_full_batch_or_after_the_interval(buffer):
+    assert not buffer.due()
+    buffer.add([row()])
+    assert not buffer.due()
+    buffer.add([row()])
+    assert buffer.due()
+
+    buffer.redis_client.delete(BUFFER_KEY)
+    buffer.add([row()])
+    buffer.flush_seconds = 0
+    assert buffer.due()
+
+def test_flush_waits_for_the_running_flusher(buffer):
+    buffer.add([row()])
+    buffer.redis_client.set("images:pending_rows:lock", "other")
+
+    assert buffer.flush() == 0 and buffer.pending() == 1
+
+def test_flusher_that_lost_its_lock_does_not_trim(buffer):
+    buffer.add([row(), row(), row()])
+    insert = buffer._insert
+
+    def insert_and_lose_the_lock(batch):
+        # The lock expired mid-insert and another flusher took it
+        buffer.redis_client.set(LOCK_KEY, "other")
+        return insert(batch)
+    buffer._insert = insert_and_lose_the_lock
+
+    assert buffer.flush() == 2
+    assert buffer.pending() == 3 and buffer.redis_client.get(LOCK_KEY) == b"other"
+
+def test_lock_is_renewed_during_a_slow_insert(buffer):
+    buffer.lock_ttl_seconds = 1
+    buffer.add([row()])
+    insert = buffer._insert
+
+    def slow_insert(batch):
+        time.sleep(1.5)
+        assert buffer.redis_client.exists(LOCK_KEY)
+        return insert(batch)
+    buffer._insert = slow_insert
+
+    assert buffer.flush() == 1
+    assert buffer.pending() == 0 and not buffer.redis_client.exists(LOCK_KEY)
+
+def size_of(buffer, image_id):
+    with buffer.engine.connect() as connection:
+        return connection.execute(select(Image.size_bytes).where(Image.id == uuid.UUID(image_id))).scalar()
+
+def test_size_of_rows_flushed_before_their_write_is_filled_in_later(buffer):
+    early = row()
+    buffer.add([early])
+    buffer.flush()
+    assert size_of(buffer, early["id"]) is None
+
+    buffer.redis_client.hset(writer.files_key(early["id"]), writer.image_key(early["id"], "original"), 4321)
+    buffer.flush_seconds = 0
+    assert buffer.due()
+    buffer.flush()
+
+    assert size_of(buffer, early["id"]) == 4321
+    assert buffer.redis_client.zcard(UNSIZED_KEY) == 0 and not buffer.due()
+
+def test_rows_whose_write_never_finishes_are_given_up_on(buffer):
+    buffer.size_grace_seconds = 0
+    buffer.add([row()])
+    buffer.flush()
+    buffer.flush()
+
+    assert buffer.redis_client.zcard(UNSIZED_KEY) == 0
+
+def test_rows_of_deleted_images_are_removed(buffer):
+    rows = [row(), row()]
+    buffer.add(rows)
+    buffer.flush()
+
+    assert buffer.delete([rows[0]["id"], "not-a-uuid"]) == 1
+    assert count(buffer) == 1
+
+def test_owners_of_recorded_images_are_looked_up(buffer):
+    rows = [row(), row()]
+    buffer.add(rows)
+    buffer.flush()
+
+    assert buffer.owners([rows[0]["id"], str(uuid.uuid4()), "not-a-uuid"]) == {rows[0]["id"]: USER_ID}
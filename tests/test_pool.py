@@ -0,0 +1,62 @@
+# tests/test_pool.py
+from types import SimpleNamespace
+import pytest
+from app.workers import pool
+
+def test_parse_cpu_set():
+    assert pool.parse_cpu_set("0-3,8") == [0, 1, 2, 3, 8]
+
+def test_cores_are_split_into_disjoint_sets():
+    cpus = list(range(8))
+    assignments = [pool.assign(i, 3, ["cpu"], cpus) for i in range(3)]
+
+    assert [a["cpus"] for a in assignments] == [[0, 1], [2, 3], [4, 5]]
+    assert {a["device"] for a in assignments} == {"cpu"}
+
+def test_devices_are_assigned_round_robin():
+    devices = ["cuda:0", "cuda:1"]
+    assert [pool.assign(i, 4, devices, list(range(4)))["device"] for i in range(4)] == ["cuda:0", "cuda:1", "cuda:0", "cuda:1"]
+
+def test_explicit_cpu_sets_win():
+    cpu_sets = [pool.parse_cpu_set("0-7"), pool.parse_cpu_set("8-15")]
+    assert pool.assign(1, 2, ["cpu"], list(range(16)), cpu_sets)["cpus"] == list(range(8, 16))
+
+def test_more_processes_than_cores_share_cores():
+    assert [pool.assign(i, 3, ["cpu"], [0, 1])["cpus"] for i in range(3)] == [[0], [1], [0]]
+
+def test_utilization_counts_running_tasks():
+    # Child 0 was busy 5s and has been running a task for 2s; child 1 is idle
+    stats = [5.0, 3, 98.0, 0.0, 0, 0.0]
+    previous = {0: (0.0, 90.0), 1: (0.0, 90.0)}
+    report = pool.utilization_report(stats, 2, previous, 100.0)
+
+    assert report[0] == {"utilization": 0.7, "busySeconds": 7.0, "tasks": 3, "running": True}
+    assert report[1]["utilization"] == 0.0
+    assert previous[0] == (7.0, 100.0)
+
+def test_only_generation_workers_are_pinned(monkeypatch):
+    def worker(*queues):
+        return SimpleNamespace(pool_cls="prefork", concurrency=2,
+                               app=SimpleNamespace(amqp=SimpleNamespace(queues=SimpleNamespace(consume_from={q: None for q in queues}))))
+    monkeypatch.setattr(pool, "plan", lambda processes: pytest.fail("derivatives workers must not be planned"))
+    monkeypatch.setattr(pool, "_stats", None)
+
+    assert pool.consumes_generation(worker("celery").app)
+    pool.start_pool_monitor(sender=worker("derivatives"))
+    assert pool._stats is None and pool._assignments == []
+
+def test_torch_threads_are_only_split_in_upscale_workers(monkeypatch):
+    import torch
+    from app.inference.image.realesrgan import tiling
+    def worker(pool_cls, *queues):
+        return SimpleNamespace(pool_cls=pool_cls, app=SimpleNamespace(amqp=SimpleNamespace(queues=SimpleNamespace(consume_from={q: None for q in queues}))))
+    calls = []
+    monkeypatch.setattr(torch, "set_num_threads", calls.append)
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: False)
+    monkeypatch.setattr(tiling, "CPU_WORKERS", 2)
+
+    pool.init_upscale_worker(sender=worker("solo", "celery", "upscale"))
+    pool.init_upscale_worker(sender=worker("prefork", "upscale"))
+    assert calls == []
+    pool.init_upscale_worker(sender=worker("solo", "upscale"))
+    assert len(calls) == 1
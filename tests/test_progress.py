@@ -0,0 +1,50 @@
+# tests/test_progress.py
+import json
+import fakeredis
+import pytest
+import torch
+from app.workers import progress
+from app.inference.image.flux.preview import latents_to_previews
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(progress, "redis_client", client)
+    return client
+
+def latest(client, task_id):
+    return json.loads(client.get(progress.progress_key(task_id)))
+
+def test_step_publishes_progress_for_every_task(redis_client):
+    reporter = progress.ProgressReporter(["a", "b"], preview_every=4)
+    reporter.step(4, 16)
+
+    for task_id in ("a", "b"):
+        event = latest(redis_client, task_id)
+        assert event["state"] == "PROGRESS"
+        assert event["step"] == 4
+        assert event["totalSteps"] == 16
+        assert event["etaSeconds"] >= 0
+
+def test_previews_are_sent_as_data_urls(redis_client):
+    reporter = progress.ProgressReporter(["a", "b"], preview_every=4)
+    assert reporter.wants_preview(4, 16)
+    assert not reporter.wants_preview(5, 16)
+    assert not reporter.wants_preview(16, 16)
+
+    previews = latents_to_previews(torch.randn(2, 16, 8, 12))
+    reporter.step(4, 16, previews)
+
+    assert previews[0].size == (12, 8)
+    assert latest(redis_client, "b")["preview"].startswith("data:image/webp;base64,")
+
+def test_finish_includes_each_task_result(redis_client):
+    reporter = progress.ProgressReporter(["a", "b"])
+    reporter.finish("SUCCESS", {"a": {"imageId": "1"}, "b": {"imageId": "2"}})
+
+    assert latest(redis_client, "b") == {"state": "SUCCESS", "elapsedSeconds": pytest.approx(0, abs=1), "result": {"imageId": "2"}}
+
+def test_state_publishes_transition_with_fields(redis_client):
+    progress.ProgressReporter(["a"]).state("QUEUED", lane="batch")
+
+    assert latest(redis_client, "a") == {"state": "QUEUED", "lane": "batch"}
@@ -0,0 +1,91 @@
+# tests/test_result_cache.py
+import fakeredis
+import pytest
+from app.inference.image import storage, writer
+from app.inference.image.result_cache import ResultCache
+
+@pytest.fixture
+def image_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_backend", storage.LocalStorage(str(tmp_path)))
+    return tmp_path
+
+def write_files(cache, image_id, size):
+    """Stores both variants of an image and indexes them like the image writer does."""
+    for variant in ("original", "upscaled"):
+        key = writer.image_key(image_id, variant)
+        storage.get_storage().put(key, b"\0" * size)
+        cache.redis_client.hset(writer.files_key(image_id), key, size)
+        cache.redis_client.hset(writer.durable_key(image_id), variant, writer.image_url(image_id, variant))
+
+def test_key_covers_every_generation_input():
+    base = ("v1", "cat", "1024x1024", 1, 16, 100)
+    keys = {ResultCache.make_key(*base)}
+    for i, value in enumerate(("v2", "dog", "1920x1080", 2, 8, 50)):
+        changed = list(base)
+        changed[i] = value
+        keys.add(ResultCache.make_key(*changed))
+    assert len(keys) == 7
+
+def test_generation_keys_are_scoped_by_user():
+    from app.workers.images import generation_cache_key
+
+    assert generation_cache_key("a", "cat", "1:1", 1) == generation_cache_key("a", "cat", "1:1", 1)
+    assert generation_cache_key("a", "cat", "1:1", 1) != generation_cache_key("b", "cat", "1:1", 1)
+
+def test_hit_returns_stored_result(image_dir):
+    cache = ResultCache(fakeredis.FakeRedis())
+    write_files(cache, "a", 10)
+    cache.put("k", {"imageId": "a", "seed": 1})
+
+    assert cache.get("k") == {"imageId": "a", "seed": 1}
+    assert cache.get("missing") is None
+
+def test_entry_waits_for_the_original_to_be_written(image_dir):
+    cache = ResultCache(fakeredis.FakeRedis())
+    cache.put("k", {"imageId": "a", "seed": 1})
+
+    # Looked up while the writer is still encoding: a miss, and the entry is kept for later
+    assert cache.get("k") is None
+    write_files(cache, "a", 10)
+    cache.commit("a")
+    assert cache.get("k") == {"imageId": "a", "seed": 1}
+
+def test_entry_of_a_failed_write_never_appears(image_dir):
+    cache = ResultCache(fakeredis.FakeRedis())
+    cache.put("k", {"imageId": "a", "seed": 1})
+
+    assert cache.get("k") is None and not cache.redis_client.exists("result_cache:entry:k")
+    cache.forget_image("a")
+    assert not cache.redis_client.exists("result_cache:pending:a")
+
+def test_entry_is_dropped_when_image_is_gone(image_dir):
+    cache = ResultCache(fakeredis.FakeRedis())
+    write_files(cache, "a", 10)
+    cache.put("k", {"imageId": "a", "seed": 1})
+    storage.get_storage().delete_many([writer.image_key("a", "original")])
+
+    assert cache.get("k") is None
+    assert not cache.redis_client.exists("result_cache:entry:k")
+
+def test_least_recently_used_entries_are_evicted_over_budget(image_dir):
+    cache = ResultCache(fakeredis.FakeRedis(), max_bytes=70)
+    for image_id in "abc":
+        write_files(cache, image_id, 10)
+        cache.put(f"k{image_id}", {"imageId": image_id})
+        cache.account_files(image_id)
+    cache.get("ka")  # 'a' becomes the most recently used
+
+    write_files(cache, "d", 10)
+    cache.put("kd", {"imageId": "d"})
+    cache.account_files("d")
+
+    assert cache.get("kb") is None
+    assert cache.get("ka") is not None
+    assert int(cache.redis_client.get("result_cache:bytes")) == 60
+    # Eviction never deletes the files themselves
+    assert storage.get_storage().exists(writer.image_key("b", "original"))
+
+def test_extra_inputs_change_the_key():
+    base = ("v1", "cat", "1024x1024", 1, 16, 100)
+    assert ResultCache.make_key(*base, None) == ResultCache.make_key(*base)
+    assert ResultCache.make_key(*base, {"draft": "a"}) != ResultCache.make_key(*base, {"draft": "b"})
@@ -0,0 +1,96 @@
+# tests/test_retention.py
+import os
+import fakeredis
+import pytest
+from app.inference.image import storage, writer
+from app.inference.image.result_cache import ResultCache
+from app.workers import retention
+from app.workers.retention import ImageGarbageCollector, schedule_expiry
+
+@pytest.fixture
+def image_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_backend", storage.LocalStorage(str(tmp_path)))
+    monkeypatch.setattr(storage, "IMAGE_SHARD_DEPTH", 0)  # Flat, so tests can list the directory
+    return tmp_path
+
+def write_image(client, image_dir, image_id, size, written_at=0):
+    """Stores both variants of an image and indexes them like the image writer does."""
+    for variant in ("original", "upscaled"):
+        key = writer.image_key(image_id, variant)
+        storage.get_storage().put(key, b"\0" * size)
+        client.hset(writer.files_key(image_id), key, size)
+        client.incrby(writer.BYTES_KEY, size)
+    client.zadd(writer.WRITTEN_KEY, {image_id: written_at}, nx=True)
+    client.hset(writer.durable_key(image_id), "original", f"/images/original_{image_id}.png")
+
+def record(client, image_id):
+    client.hset(f"image:{image_id}:generation", "prompt", "cat")
+
+def test_expired_draft_is_deleted_with_every_file(image_dir, monkeypatch):
+    monkeypatch.setattr(retention, "DRAFT_RETENTION_SECONDS", 100)
+    client = fakeredis.FakeRedis()
+    for image_id in ("draft", "keep"):
+        write_image(client, image_dir, image_id, 10)
+        record(client, image_id)
+    schedule_expiry("draft", "draft", client, now=0)
+    schedule_expiry("keep", "standard", client, now=0)  # Standard images are kept forever by default
+    ResultCache(client).put("k", {"imageId": "draft"})
+
+    report = ImageGarbageCollector(client, pause_seconds=0).run(now=101)
+
+    assert report["expired"] == 1 and report["files"] == 2 and report["bytes"] == 20
+    assert sorted(os.listdir(image_dir)) == ["keep.png", "original_keep.png"]
+    assert not client.exists("image:draft:generation", "image:draft:files", "image:draft:durable")
+    assert not client.exists("result_cache:entry:k")
+    assert int(client.get(writer.BYTES_KEY)) == 20
+
+def test_images_are_kept_until_they_expire(image_dir, monkeypatch):
+    monkeypatch.setattr(retention, "DRAFT_RETENTION_SECONDS", 100)
+    client = fakeredis.FakeRedis()
+    write_image(client, image_dir, "draft", 10)
+    record(client, "draft")
+    schedule_expiry("draft", "draft", client, now=0)
+
+    assert ImageGarbageCollector(client, pause_seconds=0).run(now=99)["expired"] == 0
+    assert len(os.listdir(image_dir)) == 2
+
+def test_orphans_are_deleted_after_the_grace_period(image_dir):
+    client = fakeredis.FakeRedis()
+    write_image(client, image_dir, "orphan", 10, written_at=0)
+    write_image(client, image_dir, "recorded", 10, written_at=0)
+    record(client, "recorded")
+    write_image(client, image_dir, "fresh", 10, written_at=90)
+    collector = ImageGarbageCollector(client, pause_seconds=0, orphan_grace_seconds=50)
+
+    report = collector.run(now=100)
+
+    assert report["orphaned"] == 1
+    assert sorted(os.listdir(image_dir)) == ["fresh.png", "original_fresh.png", "original_recorded.png", "recorded.png"]
+    # Recorded images leave the orphan check, fresh ones wait for their grace period
+    assert [member.decode() for member in client.zrange(writer.WRITTEN_KEY, 0, -1)] == ["fresh"]
+
+def test_pass_stops_at_its_batch_limit(image_dir, monkeypatch):
+    monkeypatch.setattr(retention, "DRAFT_RETENTION_SECONDS", 1)
+    client = fakeredis.FakeRedis()
+    for i in range(5):
+        write_image(client, image_dir, f"d{i}", 10)
+        record(client, f"d{i}")
+        schedule_expiry(f"d{i}", "draft", client, now=0)
+    collector = ImageGarbageCollector(client, batch_size=2, max_batches=2, pause_seconds=0)
+
+    first = collector.run(now=10)
+    assert first["expired"] == 4 and first["remaining"] is True
+    second = collector.run(now=10)
+    assert second["expired"] == 1 and second["remaining"] is False
+    assert os.listdir(image_dir) == []
+
+def test_delete_reports_unknown_images_and_finds_unsharded_files(image_dir):
+    client = fakeredis.FakeRedis()
+    write_image(client, image_dir, "a", 10)
+    # Written before images were sharded
+    (image_dir / "original_legacy.png").write_bytes(b"\0" * 5)
+
+    report = ImageGarbageCollector(client).delete(["a", "missing", "legacy"])
+
+    assert report["deleted"] == ["a", "legacy"] and report["images"] == 2 and report["bytes"] == 25
+    assert os.listdir(image_dir) == []
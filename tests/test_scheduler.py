@@ -0,0 +1,124 @@
+# tests/test_scheduler.py
+from concurrent.futures import ThreadPoolExecutor
+import fakeredis
+import pytest
+from app.workers.scheduler import AdmissionError, FairScheduler
+
+def make_scheduler(**kwargs):
+    return FairScheduler(fakeredis.FakeRedis(), **kwargs)
+
+def submit(scheduler, task_id, user, lane="interactive", cost=1.0, bucket="1024x1024"):
+    scheduler.submit({"task_id": task_id, "bucket": bucket, "cost": cost}, user, lane)
+
+def drain(scheduler, bucket=None):
+    order = []
+    while (job := scheduler.pop(bucket)) is not None:
+        order.append(job["task_id"])
+    return order
+
+def test_users_are_served_round_robin():
+    scheduler = make_scheduler()
+    for i in range(4):
+        submit(scheduler, f"a{i}", "alice")
+    submit(scheduler, "b0", "bob")
+    submit(scheduler, "c0", "carol")
+
+    # Alice's backlog does not hold up the users who queued after her
+    assert drain(scheduler) == ["a0", "b0", "c0", "a1", "a2", "a3"]
+
+def test_cheap_jobs_get_proportionally_more_turns():
+    scheduler = make_scheduler()
+    for i in range(4):
+        submit(scheduler, f"d{i}", "alice", cost=0.25)
+        submit(scheduler, f"s{i}", "bob", cost=1.0)
+
+    assert drain(scheduler)[:6] == ["d0", "d1", "d2", "d3", "s0", "s1"]
+
+def test_interactive_lane_goes_first_without_starving_batch():
+    scheduler = make_scheduler(batch_lane_every=2)
+    submit(scheduler, "batch", "alice", lane="batch")
+    for i in range(3):
+        submit(scheduler, f"i{i}", "bob")
+
+    assert drain(scheduler) == ["i0", "i1", "batch", "i2"]
+
+def test_bucket_pop_takes_matching_jobs_only():
+    scheduler = make_scheduler()
+    submit(scheduler, "a", "alice", bucket="draft:512x512")
+    submit(scheduler, "b", "bob", bucket="1024x1024")
+
+    assert drain(scheduler, bucket="1024x1024") == ["b"]
+    assert drain(scheduler) == ["a"]
+
+def test_inflight_cap_is_released_by_finish():
+    scheduler = make_scheduler(max_inflight=2)
+    submit(scheduler, "a", "alice")
+    submit(scheduler, "b", "alice")
+    with pytest.raises(AdmissionError):
+        submit(scheduler, "c", "alice")
+    submit(scheduler, "d", "bob")
+
+    scheduler.finish([scheduler.pop()])
+    submit(scheduler, "c", "alice")
+
+def test_queue_estimate_refuses_with_retry_after():
+    scheduler = make_scheduler(max_wait_seconds=50, seconds_per_cost_unit=20)
+    for i in range(3):
+        submit(scheduler, f"b{i}", f"user{i}", lane="batch")
+
+    # Queued batch work does not count against interactive jobs
+    assert scheduler.estimated_wait("interactive") == 0
+    submit(scheduler, "i0", "dave")
+    with pytest.raises(AdmissionError) as refused:
+        submit(scheduler, "b3", "erin", lane="batch")
+    assert refused.value.retry_after == 30
+
+def test_concurrent_submissions_respect_the_inflight_cap():
+    scheduler = make_scheduler(max_inflight=3)
+
+    def attempt(i):
+        try:
+            submit(scheduler, f"a{i}", "alice")
+            return True
+        except AdmissionError:
+            return False
+
+    with ThreadPoolExecutor(8) as pool:
+        admitted = list(pool.map(attempt, range(16)))
+    assert sum(admitted) == 3 and scheduler.inflight("alice") == 3
+
+def test_expired_lock_holder_does_not_release_the_next_holder():
+    scheduler = make_scheduler()
+    with scheduler._lock():
+        # The lock expired while held and another process took it
+        scheduler.redis_client.set("sched:lock", "other")
+    assert scheduler.redis_client.get("sched:lock") == b"other"
+
+def test_quantum_must_be_positive():
+    with pytest.raises(ValueError):
+        make_scheduler(quantum=0)
+
+def test_large_costs_are_served_without_crediting_round_by_round():
+    scheduler = make_scheduler(quantum=0.001, max_wait_seconds=10000)
+    submit(scheduler, "a", "alice", cost=50.0)
+    submit(scheduler, "b", "bob", cost=20.0)
+
+    assert drain(scheduler) == ["b", "a"]
+
+def test_admission_callback_runs_only_for_admitted_jobs():
+    scheduler = make_scheduler(max_inflight=1)
+    admitted = []
+    scheduler.submit({"task_id": "a", "bucket": "1024x1024", "cost": 1.0}, "alice", on_admitted=lambda: admitted.append("a"))
+    with pytest.raises(AdmissionError):
+        scheduler.submit({"task_id": "b", "bucket": "1024x1024", "cost": 1.0}, "alice", on_admitted=lambda: admitted.append("b"))
+
+    assert admitted == ["a"]
+
+def test_depths_count_queued_and_claimed_jobs_per_lane():
+    scheduler = make_scheduler()
+    submit(scheduler, "a1", "alice")
+    submit(scheduler, "a2", "alice")
+    submit(scheduler, "b1", "bob", lane="batch")
+    scheduler.pop(claimant="w1")
+
+    assert scheduler.depths() == {"interactive": {"queued": 1, "running": 1}, "batch": {"queued": 1, "running": 0}}
@@ -0,0 +1,53 @@
+# tests/test_storage.py
+import os
+import pytest
+from app.inference.image import storage
+from app.inference.image.storage import LocalStorage, S3Storage, object_key
+
+def test_keys_are_sharded_by_id_prefix(monkeypatch):
+    assert object_key("3fa2c0", "original_3fa2c0.png") == "3f/a2/original_3fa2c0.png"
+    monkeypatch.setattr(storage, "IMAGE_SHARD_DEPTH", 0)
+    assert object_key("3fa2c0", "original_3fa2c0.png") == "original_3fa2c0.png"
+
+def test_local_put_is_atomic_and_leaves_no_temp_files(tmp_path):
+    backend = LocalStorage(str(tmp_path))
+
+    assert backend.put("ab/cd/x.png", b"data") == 4
+    assert os.listdir(tmp_path / "ab" / "cd") == ["x.png"]
+    with backend.open("ab/cd/x.png") as f:
+        assert f.read() == b"data"
+    assert backend.url("ab/cd/x.png") == "/images/ab/cd/x.png"
+    assert LocalStorage(str(tmp_path), base_url="https://cdn.example.com/").url("x.png") == "https://cdn.example.com/x.png"
+
+def test_local_bulk_put_and_delete(tmp_path):
+    backend = LocalStorage(str(tmp_path))
+    files = {f"{i:02d}/f{i}.png": b"\0" * i for i in range(1, 21)}
+
+    assert backend.put_many(files) == {key: len(data) for key, data in files.items()}
+    deleted = backend.delete_many(list(files) + ["99/missing.png"])
+
+    assert deleted == {key: len(data) for key, data in files.items()}
+    assert not any(backend.exists(key) for key in files)
+
+@pytest.fixture
+def s3():
+    boto3 = pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="images")
+        yield S3Storage("images", client=client, base_url="https://cdn.example.com")
+
+def test_s3_round_trip(s3):
+    assert s3.put("ab/cd/x.png", b"data") == 4
+    assert s3.exists("ab/cd/x.png") and not s3.exists("ab/cd/y.png")
+    assert s3.open("ab/cd/x.png").read() == b"data"
+    assert s3.client.head_object(Bucket="images", Key="ab/cd/x.png")["ContentType"] == "image/png"
+    assert s3.url("ab/cd/x.png") == "https://cdn.example.com/ab/cd/x.png"
+
+def test_s3_bulk_delete_skips_missing_keys(s3, monkeypatch):
+    monkeypatch.setattr(storage, "S3_DELETE_BATCH", 2)
+    s3.put_many({f"k{i}.png": b"\0" * i for i in range(1, 6)})
+
+    assert s3.delete_many([f"k{i}.png" for i in range(1, 7)]) == {f"k{i}.png": i for i in range(1, 6)}
+    assert s3.client.list_objects_v2(Bucket="images")["KeyCount"] == 0
@@ -0,0 +1,44 @@
+# tests/test_task_events.py
+import asyncio
+import fakeredis
+from app.api.task_events import TaskEventHub
+from app.workers.progress import progress_channel
+
+async def _next(queue):
+    return await asyncio.wait_for(queue.get(), timeout=2)
+
+def test_subscribers_share_one_subscription_per_channel():
+    async def scenario():
+        client = fakeredis.FakeAsyncRedis()
+        hub = TaskEventHub(client)
+        first = await hub.subscribe(["a", "b"])
+        second = await hub.subscribe(["a"])
+        assert hub.channel_count == 2
+
+        await asyncio.sleep(0.05)
+        await client.publish(progress_channel("a"), '{"state": "STARTED"}')
+        assert await _next(first) == (progress_channel("a"), '{"state": "STARTED"}')
+        assert await _next(second) == (progress_channel("a"), '{"state": "STARTED"}')
+
+        await hub.unsubscribe(["a"], second)
+        assert hub.channel_count == 2
+        await hub.unsubscribe(["a", "b"], first)
+        assert hub.channel_count == 0
+        await hub.close()
+
+    asyncio.run(scenario())
+
+def test_events_only_reach_followers_of_the_task():
+    async def scenario():
+        client = fakeredis.FakeAsyncRedis()
+        hub = TaskEventHub(client)
+        follows_a = await hub.subscribe(["a"])
+        follows_b = await hub.subscribe(["b"])
+
+        await asyncio.sleep(0.05)
+        await client.publish(progress_channel("b"), '{"state": "SUCCESS"}')
+        assert (await _next(follows_b))[1] == '{"state": "SUCCESS"}'
+        assert follows_a.empty()
+        await hub.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,60 @@
+# tests/test_telemetry.py
+import fakeredis
+from app.workers.telemetry import QueueTelemetry, TELEMETRY_WINDOW_SECONDS, TELEMETRY_WINDOWS
+
+def make_telemetry():
+    return QueueTelemetry(fakeredis.FakeRedis())
+
+def test_counters_follow_job_lifecycle():
+    telemetry = make_telemetry()
+    telemetry.queued("interactive", 3)
+    telemetry.queued("batch")
+    telemetry.started("interactive", 2)
+    telemetry.finished("interactive")
+
+    counts = telemetry.counts()
+    assert counts["interactive"] == {"queued": 1, "running": 1}
+    assert counts["batch"] == {"queued": 1, "running": 0}
+    assert counts["upscale"] == {"queued": 0, "running": 0}
+
+def test_duration_stats_use_histogram_buckets():
+    telemetry = make_telemetry()
+    for seconds in (3, 4, 4, 25):
+        telemetry.record_duration("generate", "1:1", seconds, now=1000)
+
+    stats = telemetry.duration_stats("generate", "1:1", now=1000)
+    assert stats == {"count": 4, "mean": 9.0, "p50": 5, "p90": 30}
+    assert telemetry.duration_stats("generate", "16:9", now=1000)["count"] == 0
+
+def test_old_windows_age_out():
+    telemetry = make_telemetry()
+    telemetry.record_duration("generate", "1:1", 10, now=0)
+
+    assert telemetry.duration_stats("generate", "1:1", now=TELEMETRY_WINDOW_SECONDS)["count"] == 1
+    assert telemetry.duration_stats("generate", "1:1", now=TELEMETRY_WINDOW_SECONDS * TELEMETRY_WINDOWS)["count"] == 0
+
+def test_estimated_wait_shares_queue_across_busy_processes():
+    telemetry = make_telemetry()
+    assert telemetry.estimated_wait("1:1") is None
+
+    telemetry.record_duration("generate", "1:1", 10)
+    telemetry.queued("interactive", 6)
+    telemetry.started("interactive", 2)
+    telemetry.queued("batch", 4)
+
+    assert telemetry.estimated_wait("1:1", "interactive") == 20
+    assert telemetry.estimated_wait("1:1", "batch") == 40
+
+def test_reconcile_sets_counters_from_real_depths_and_clamps_the_rest():
+    telemetry = make_telemetry()
+    telemetry.queued("interactive", 5)
+    telemetry.finished("batch", 2)
+    telemetry.finished("upscale", 3)
+    telemetry.queued("upscale", 1)
+
+    telemetry.reconcile({"interactive": {"queued": 1, "running": 2}, "batch": {"queued": 0, "running": -1}})
+
+    counts = telemetry.counts()
+    assert counts["interactive"] == {"queued": 1, "running": 2}
+    assert counts["batch"] == {"queued": 0, "running": 0}
+    assert telemetry.redis_client.hmget("telemetry:queue:upscale", "queued", "running") == [b"1", b"0"]
@@ -0,0 +1,29 @@
+# tests/test_tiling.py
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+from app.inference.image.realesrgan.tiling import TiledUpscaler
+
+class NearestUpsample(torch.nn.Module):
+    def forward(self, x):
+        return torch.nn.functional.interpolate(x, scale_factor=4, mode="nearest")
+
+@pytest.mark.parametrize("size", [(64, 64), (300, 517), (20, 90)])
+@pytest.mark.parametrize("workers", [1, 3])
+def test_tiled_output_matches_whole_frame(size, workers):
+    height, width = size
+    pixels = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    image = Image.fromarray(pixels)
+    upscaler = TiledUpscaler(NearestUpsample(), 4, "cpu", tile_size=32, overlap=8, batch_size=3, workers=workers)
+
+    output = upscaler.upscale(image)
+
+    assert output.size == (width * 4, height * 4)
+    expected = np.asarray(image.resize((width * 4, height * 4), Image.NEAREST))
+    assert np.array_equal(np.asarray(output), expected)
+
+def test_building_an_upscaler_leaves_torch_threads_alone():
+    threads = torch.get_num_threads()
+    TiledUpscaler(NearestUpsample(), 4, "cpu", workers=4)
+    assert torch.get_num_threads() == threads
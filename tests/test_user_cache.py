@@ -0,0 +1,96 @@
+# tests/test_user_cache.py
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+import fakeredis
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from app.api import auth
+from app.db.database import get_async_db
+from app.db.models import User
+from app.db.user_cache import TTLCache, UserCache, user_key
+
+def _cache(server, **kwargs) -> UserCache:
+    return UserCache(fakeredis.FakeRedis(server=server), fakeredis.FakeAsyncRedis(server=server), **kwargs)
+
+def _user() -> User:
+    now = datetime(2026, 1, 1)
+    return User(uuid=uuid.uuid4(), email="a@example.com", name="A", refresh_token="secret",
+                last_logged_in=None, created_at=now, updated_at=now)
+
+def test_ttl_cache_expires_and_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1, time.time() + 60)
+    cache.set("b", 2, time.time() + 60)
+    cache.get("a")
+    cache.set("c", 3, time.time() + 60)
+    assert cache.get("b") is None and cache.get("a") == 1
+    cache.set("d", 4, time.time() - 1)
+    assert cache.get("d") is None
+
+def test_lookups_fall_through_the_process_tier_to_redis():
+    server, user = fakeredis.FakeServer(), _user()
+
+    async def scenario():
+        first, second = _cache(server), _cache(server)
+        assert await first.get(user.uuid) is None
+        await first.set(user)
+        assert (await first.get(user.uuid)).email == "a@example.com"
+        cached = await second.get(str(user.uuid))
+        assert cached.uuid == user.uuid and cached.created_at == user.created_at
+        assert cached.refresh_token is None  # Never leaves the database
+        assert (first.local_hits, second.redis_hits, first.misses) == (1, 1, 1)
+
+    asyncio.run(scenario())
+
+def test_invalidation_reaches_every_process():
+    server, user = fakeredis.FakeServer(), _user()
+
+    async def scenario():
+        writer, reader = _cache(server), _cache(server)
+        listener = asyncio.create_task(reader.listen())
+        await asyncio.sleep(0.05)
+        await reader.set(user)
+        writer.invalidate(user.uuid)
+        await asyncio.sleep(0.05)
+        assert len(reader.local) == 0
+        assert not await writer.async_redis_client.exists(user_key(user.uuid))
+        listener.cancel()
+
+    asyncio.run(scenario())
+
+def test_access_tokens_are_decoded_once(monkeypatch):
+    calls = []
+    original = auth.validate_jwt_token
+    monkeypatch.setattr(auth, "validate_jwt_token", lambda token: calls.append(token) or original(token))
+    token = auth.create_jwt_token({"sub": str(uuid.uuid4())}, timedelta(minutes=5))
+    assert auth.validate_access_token(token) == auth.validate_access_token(token)
+    assert len(calls) == 1
+
+def test_current_user_is_served_from_the_cache(monkeypatch):
+    user, lookups = _user(), []
+
+    async def lookup(user_uuid, db):
+        lookups.append(user_uuid)
+        return user
+
+    async def session():
+        class Session:
+            async def close(self):
+                pass
+        yield Session()
+
+    monkeypatch.setattr(auth, "user_cache", _cache(fakeredis.FakeServer()))
+    monkeypatch.setattr(auth, "get_user_from_uuid_async", lookup)
+    app = FastAPI()
+
+    @app.get("/me")
+    async def me(current_user: User = Depends(auth.get_current_user)):
+        return {"email": current_user.email}
+
+    app.dependency_overrides[get_async_db] = session
+    client = TestClient(app)
+    client.cookies.set("access_token", auth.create_jwt_token({"sub": str(user.uuid)}, timedelta(minutes=5)))
+    assert [client.get("/me").json()["email"] for _ in range(3)] == ["a@example.com"] * 3
+    assert len(lookups) == 1
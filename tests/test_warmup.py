@@ -0,0 +1,59 @@
+# tests/test_warmup.py
+import fakeredis
+import pytest
+from app.inference import registry, warmup
+
+@pytest.fixture
+def fake_warmers(monkeypatch):
+    calls = []
+
+    def fail():
+        raise RuntimeError("no weights")
+
+    monkeypatch.setattr(registry, "LOADERS", {"good": lambda: calls.append("load") or "model", "bad": fail})
+    monkeypatch.setattr(registry, "_models", {})
+    monkeypatch.setattr(warmup, "WARMERS", {
+        "good": lambda model: calls.append(f"warm {model}") or {"1024x1024": 0.1},
+        "bad": lambda model: {},
+    })
+    return calls
+
+def test_ready_after_load_and_warm_up(fake_warmers):
+    client = fakeredis.FakeRedis()
+    state = warmup.ModelWarmup("worker", ["good"], client=client)
+
+    assert state.run()
+    assert fake_warmers == ["load", "warm model"]
+    report = warmup.readiness(client)
+    assert report["ready"]
+    model = report["nodes"][state.node]["good"]
+    assert model["state"] == "ready"
+    assert model["timings"] == {"1024x1024": 0.1}
+    assert "loadSeconds" in model and "warmupSeconds" in model
+
+def test_failed_model_is_reported_and_others_still_warm(fake_warmers):
+    client = fakeredis.FakeRedis()
+    state = warmup.ModelWarmup("worker", ["bad", "good", "unknown"], client=client)
+
+    assert not state.run()
+    assert state.models == ["bad", "good"]
+    report = warmup.readiness(client)
+    assert not report["ready"]
+    assert report["nodes"][state.node]["bad"]["state"] == "failed"
+    assert report["nodes"][state.node]["bad"]["error"] == "no weights"
+    assert report["nodes"][state.node]["good"]["state"] == "ready"
+
+def test_expired_nodes_are_dropped():
+    client = fakeredis.FakeRedis()
+    client.sadd(warmup.WARMUP_NODES_KEY, "worker@gone:1")
+
+    assert warmup.readiness(client) == {"ready": False, "nodes": {}}
+    assert not client.smembers(warmup.WARMUP_NODES_KEY)
+
+def test_configured_models(monkeypatch):
+    monkeypatch.delenv("WARMUP_MODELS", raising=False)
+    assert warmup.configured_models(["flux"]) == ["flux"]
+    monkeypatch.setenv("WARMUP_MODELS", "llama, realesrgan")
+    assert warmup.configured_models(["flux"]) == ["llama", "realesrgan"]
+    monkeypatch.setenv("WARMUP_MODELS", "none")
+    assert warmup.configured_models(["flux"]) == []
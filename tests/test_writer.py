@@ -0,0 +1,70 @@
+# tests/test_writer.py
+import fakeredis
+import pytest
+from PIL import Image
+from app.inference.image import storage, writer
+
+@pytest.fixture
+def image_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_backend", storage.LocalStorage(str(tmp_path)))
+    monkeypatch.setattr(writer, "redis_client", fakeredis.FakeRedis())
+    return tmp_path
+
+def test_unavailable_format_falls_back_to_png(image_dir, monkeypatch):
+    monkeypatch.setitem(writer.OUTPUT_FORMATS, "upscaled", ("jpeg2000", None))
+    assert writer.get_output_format("upscaled") == ("png", 6)
+    assert writer.image_url("abcd", "upscaled") == "/images/ab/cd/abcd.png"
+
+def test_webp_output_uses_its_extension(monkeypatch):
+    monkeypatch.setitem(writer.OUTPUT_FORMATS, "original", ("webp", "2"))
+    assert writer.get_output_format("original") == ("webp", 2)
+    assert writer.image_filename("a", "original") == "original_a.webp"
+
+def test_submit_marks_variant_durable_and_calls_back(image_dir, monkeypatch):
+    monkeypatch.setattr(writer, "IMAGE_ALTERNATE_FORMATS", [])
+    saved = []
+    future = writer.ImageWriter().submit(Image.new("RGB", (8, 8)), "bbcc", "original", on_done=saved.append)
+    future.result()
+    writer.ImageWriter().close()
+
+    assert (image_dir / "bb" / "cc" / "original_bbcc.png").exists()
+    assert writer.get_durable_urls("bbcc") == {"original": "/images/bb/cc/original_bbcc.png"}
+    assert writer.redis_client.hgetall(writer.files_key("bbcc")) == {b"bb/cc/original_bbcc.png": str(future.result()).encode()}
+    assert saved == ["bbcc"]
+
+def test_stored_image_reads_back(image_dir):
+    writer.ImageWriter().submit(Image.new("RGB", (8, 4), "red"), "ccdd", "original").result()
+
+    image = writer.open_image("ccdd", "original")
+    assert image.size == (8, 4) and image.getpixel((0, 0)) == (255, 0, 0)
+
+def test_durable_urls_of_many_images(image_dir):
+    writer.ImageWriter().submit(Image.new("RGB", (8, 8)), "c", "original").result()
+    # The durable URL is recorded by a done callback, which may still be running after result()
+    writer.ImageWriter().close()
+
+    assert writer.get_durable_urls_many(["c", "d"]) == {"c": {"original": "/images/c/original_c.png"}, "d": {}}
+
+def test_alternate_formats_are_stored_and_indexed(image_dir, monkeypatch):
+    monkeypatch.setattr(writer, "IMAGE_ALTERNATE_FORMATS", ["webp", "png", "jpeg2000"])
+    writer.ImageWriter().submit(Image.new("RGB", (8, 8)), "ddee", "original").result()
+    writer.ImageWriter().close()
+
+    assert sorted(p.name for p in (image_dir / "dd" / "ee").iterdir()) == ["original_ddee.png", "original_ddee.webp"]
+    assert set(writer.redis_client.hkeys(writer.files_key("ddee"))) == {b"dd/ee/original_ddee.png", b"dd/ee/original_ddee.webp"}
+    # Only the primary format is published
+    assert writer.get_durable_urls("ddee") == {"original": "/images/dd/ee/original_ddee.png"}
+
+def test_failed_write_calls_back_and_is_never_durable(image_dir, monkeypatch):
+    monkeypatch.setattr(writer, "IMAGE_ALTERNATE_FORMATS", [])
+    saved, failed = [], []
+    # RGBA cannot be encoded as JPEG, so the write fails in the pool
+    monkeypatch.setitem(writer.ENCODERS, "png", dict(writer.ENCODERS["png"], format="JPEG"))
+    future = writer.ImageWriter().submit(Image.new("RGBA", (8, 8)), "eeff", "original",
+                                         on_done=saved.append, on_failed=lambda image_id, e: failed.append(image_id))
+    with pytest.raises(OSError):
+        future.result()
+    writer.ImageWriter().close()
+
+    assert saved == [] and failed == ["eeff"]
+    assert writer.get_durable_urls("eeff") == {}